@@ -1,47 +1,834 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, abort
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, abort, g
 from functools import wraps
-from datetime import datetime
+from itertools import islice
+from operator import itemgetter
+from datetime import datetime, timedelta
 import io
 import os
 import csv
+import re
+import time
+import logging
+import queue
+import atexit
+import tempfile
+import threading
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
 from openpyxl.drawing.image import Image as OpenpyxlImage
-from PIL import Image as PILImage
-from db_utils import get_db_connection, execute_query, fetch_one, fetch_all, close_connection
-from auth_utils import login_required, role_required
+from PIL.Image import DecompressionBombError
+from mysql.connector import errors as mysql_errors
+from db_utils import get_db_connection, get_blob_connection, execute_query, execute_many, execute_batch, execute_blob_query, fetch_one, fetch_all, iter_rows, close_connection, BlobStream
+from db_utils import begin_transaction, commit_transaction, rollback_transaction
+from auth_utils import login_required, require_admin, require_personnel, require_student, invalidate_user_cache
+from auth_utils import hash_password, verify_password, password_needs_rehash, get_current_user
+from cache_utils import TTLCache
+from image_utils import make_thumbnails, make_profile_photo
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Let the web server send Excel exports from disk (needs mod_xsendfile or equivalent)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
 
 # Note: Bootstrap is loaded via CDN in templates, no need for Flask-Bootstrap extension
 
+# Dashboard endpoint for each user role (used by index() to route logged-in users)
+ROLE_DASHBOARDS = {
+    'admin': 'admin_dashboard',
+    'personnel': 'personnel_dashboard',
+    'student': 'student_dashboard'
+}
+
+# Resolved URLs for argument-less endpoints that are redirected to frequently
+ROUTE_URLS = {}
+
+# Hash checked when a login email is unknown, so that path costs the same as a wrong password
+DUMMY_PASSWORD_HASH = hash_password(os.urandom(16).hex())
+
+# ============================================================================
+# ACTIVITY LOG WRITER
+# ============================================================================
+
+# Activity log rows waiting to be written by the background writer thread
+LOG_QUEUE = queue.Queue()
+LOG_BATCH_SIZE = 100
+LOG_FLUSH_INTERVAL = 0.1  # seconds to wait for more rows before writing a batch
+
+ACTIVITY_LOG_INSERT = """INSERT INTO activity_logs (user_id, sample_id, activity_type, description, timestamp)
+                         VALUES (%s, %s, %s, %s, NOW())"""
+
+_log_writer_thread = None
+_log_writer_lock = threading.Lock()
+
+def _write_activity_batch(batch):
+    """
+    Insert a batch of queued activity log rows using a single executemany
+    
+    Args:
+        batch: List of (user_id, sample_id, activity_type, description) tuples
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        try:
+            execute_many(conn, ACTIVITY_LOG_INSERT, batch)
+        except Exception:
+            # A single bad row fails the whole batch; retry row by row so the
+            # remaining entries are still recorded
+            for entry in batch:
+                try:
+                    execute_query(conn, ACTIVITY_LOG_INSERT, entry)
+                except Exception as e:
+                    print(f"Error logging activity: {e}")
+    except Exception as e:
+        print(f"Error logging activity: {e}")
+    finally:
+        if conn:
+            try:
+                close_connection(conn)
+            except Exception:
+                pass
+
+def _activity_log_writer():
+    """Background loop that drains LOG_QUEUE and writes rows in batches"""
+    while True:
+        batch = [LOG_QUEUE.get()]
+        deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+        while len(batch) < LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(LOG_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _write_activity_batch(batch)
+        finally:
+            for _ in batch:
+                LOG_QUEUE.task_done()
+
+def _ensure_log_writer():
+    """Start the activity log writer thread if it is not running in this process"""
+    global _log_writer_thread
+    if _log_writer_thread is not None and _log_writer_thread.is_alive():
+        return
+    with _log_writer_lock:
+        if _log_writer_thread is None or not _log_writer_thread.is_alive():
+            _log_writer_thread = threading.Thread(target=_activity_log_writer,
+                                                  name='activity-log-writer', daemon=True)
+            _log_writer_thread.start()
+
+@atexit.register
+def flush_activity_logs():
+    """Write any activity log rows still queued (called on interpreter shutdown)"""
+    batch = []
+    while True:
+        try:
+            batch.append(LOG_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        _write_activity_batch(batch)
+
 # ============================================================================
 # UTILITY FUNCTIONS
 # ============================================================================
 
+def cached_url(endpoint):
+    """
+    Return the URL for an endpoint that takes no arguments, resolving it with
+    url_for() only the first time it is requested
+    
+    Args:
+        endpoint: Name of the Flask endpoint (e.g., 'admin_manage_users')
+        
+    Returns:
+        str: URL for the endpoint
+    """
+    url = ROUTE_URLS.get(endpoint)
+    if url is None:
+        url = ROUTE_URLS[endpoint] = url_for(endpoint)
+    return url
+
 def log_activity(conn, user_id, activity_type, description, sample_id=None):
     """
     Log user activity to the database
     
+    The row is queued and written by a background thread, so the request does
+    not wait on the INSERT.
+    
     Args:
-        conn: Database connection
+        conn: Database connection (unused; kept so existing call sites stay unchanged)
         user_id: ID of the user performing the action
         activity_type: Type of activity performed
         description: Detailed description of the activity
         sample_id: Optional sample ID related to the activity
     """
     try:
-        execute_query(conn,
-            """INSERT INTO activity_logs (user_id, sample_id, activity_type, description, timestamp)
-               VALUES (%s, %s, %s, %s, NOW())""",
-            (user_id, sample_id, activity_type, description))
+        _ensure_log_writer()
+        LOG_QUEUE.put((user_id, sample_id, activity_type, description))
     except Exception as e:
         print(f"Error logging activity: {e}")
 
+# Rows per page on the student browse page
+ROCKS_PER_PAGE = 50
+
+class Pagination:
+    """
+    Page bookkeeping for a LIMIT/OFFSET listing, exposing the attributes the
+    templates' pagers use (page, pages, total, has_prev/next, iter_pages)
+    """
+    
+    def __init__(self, page, per_page, total):
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.pages = max(1, -(-total // per_page))
+        self.offset = (page - 1) * per_page
+        self.has_prev = page > 1
+        self.has_next = page < self.pages
+        self.prev_num = page - 1
+        self.next_num = page + 1
+    
+    def iter_pages(self, left_edge=2, left_current=2, right_current=4, right_edge=2):
+        """Yield page numbers to link, with None where a run of pages is skipped"""
+        last = 0
+        for num in range(1, self.pages + 1):
+            if (num <= left_edge
+                    or self.page - left_current <= num <= self.page + right_current
+                    or num > self.pages - right_edge):
+                if last + 1 != num:
+                    yield None
+                yield num
+                last = num
+
+# Student browse page: verified rocks from all students with the submitter's name
+# (only the columns students/view_rocks.html renders)
+VERIFIED_ROCKS_BASE_QUERY = """SELECT rs.sample_id, rs.user_id, rs.rock_index, rs.rock_id, rs.rock_type,
+            rs.location_name, rs.status, rs.created_at, rs.updated_at,
+            CONCAT(s.first_name, ' ', s.last_name) as submitted_by_name
+            FROM rock_samples rs
+            LEFT JOIN users s ON rs.user_id = s.user_id
+            WHERE rs.status = 'verified'"""
+
+# Optional filters: search, rock type, location, date from, date to
+VERIFIED_FILTER_CLAUSES = (
+    "MATCH(rs.rock_index, rs.rock_id, rs.rock_type, rs.location_name, rs.description) AGAINST (%s IN BOOLEAN MODE)",
+    "(rs.rock_index LIKE %s OR rs.rock_id LIKE %s OR rs.rock_type LIKE %s OR rs.location_name LIKE %s OR rs.description LIKE %s)",
+    "rs.rock_type = %s",
+    "rs.location_name LIKE %s",
+    # Compare created_at itself (not DATE(created_at)) so the created_at indexes can range-scan;
+    # date_to is inclusive, hence the next-day bound
+    "rs.created_at >= %s",
+    "rs.created_at < %s + INTERVAL 1 DAY",
+)
+
+# Assembled SQL keyed by which filters are present (at most 64 entries)
+VERIFIED_ROCK_QUERIES = {}
+
+def get_verified_rock_queries(present):
+    """
+    Get the student browse-page SQL for a combination of filters
+    
+    Args:
+        present: Tuple of six booleans, one per VERIFIED_FILTER_CLAUSES entry
+        
+    Returns:
+        dict: 'page' (paginated listing), 'count' (total rows), 'own'
+              (the current student's rocks), 'export' (CSV export) and
+              'export_images' (Excel export) query strings
+    """
+    queries = VERIFIED_ROCK_QUERIES.get(present)
+    if queries is None:
+        filter_sql = "".join(" AND " + clause
+                             for clause, is_set in zip(VERIFIED_FILTER_CLAUSES, present) if is_set)
+        queries = VERIFIED_ROCK_QUERIES[present] = {
+            'page': VERIFIED_ROCKS_BASE_QUERY + filter_sql + " ORDER BY rs.created_at DESC LIMIT %s OFFSET %s",
+            'count': "SELECT COUNT(*) AS total FROM rock_samples rs WHERE rs.status = 'verified'" + filter_sql,
+            'own': VERIFIED_ROCKS_BASE_QUERY + " AND rs.user_id = %s" + filter_sql + " ORDER BY rs.created_at DESC",
+            'export': VERIFIED_EXPORT_BASE_QUERY.format(image_columns=ROCK_IMAGE_FLAG_COLUMNS)
+                      + filter_sql + " ORDER BY rs.created_at DESC",
+            'export_images': VERIFIED_EXPORT_BASE_QUERY.format(image_columns="")
+                             + filter_sql + " ORDER BY rs.created_at DESC",
+        }
+    return queries
+
+def get_verified_filter_params(search_query, rock_type_filter, location_filter, date_from, date_to,
+                               fulltext=True):
+    """
+    Work out which VERIFIED_FILTER_CLAUSES apply and their parameters
+    
+    Args:
+        search_query: Search text
+        rock_type_filter: Rock type filter
+        location_filter: Location filter
+        date_from: Start date filter
+        date_to: End date filter
+        fulltext: False to search with LIKE even when the FULLTEXT index could be used
+        
+    Returns:
+        tuple: (present flags for get_verified_rock_queries, parameter list)
+    """
+    # Whole-word searches use the FULLTEXT index, anything else falls back to LIKE
+    fulltext_terms = (fulltext_search_terms(search_query)
+                      if fulltext and search_query and FULLTEXT_SEARCH_READY else None)
+    like_search = bool(search_query) and fulltext_terms is None
+    
+    # Parameters in the same order as VERIFIED_FILTER_CLAUSES
+    params = []
+    if fulltext_terms:
+        params.append(fulltext_terms)
+    if like_search:
+        params.extend([f"%{search_query}%"] * 5)
+    if rock_type_filter:
+        params.append(rock_type_filter)
+    if location_filter:
+        params.append(f"%{location_filter}%")
+    if date_from:
+        params.append(date_from)
+    if date_to:
+        params.append(date_to)
+    
+    present = (bool(fulltext_terms), like_search, bool(rock_type_filter),
+               bool(location_filter), bool(date_from), bool(date_to))
+    return present, params
+
+# Set once the ft_search FULLTEXT index is known to exist (see ensure_fulltext_search)
+FULLTEXT_SEARCH_READY = False
+# Set once users.full_name and its ft_full_name index exist (see ensure_full_name_search)
+FULL_NAME_SEARCH_READY = False
+# InnoDB's default innodb_ft_min_token_size; shorter words are not indexed
+FULLTEXT_MIN_WORD_LENGTH = 3
+FULLTEXT_WORD = re.compile(r'^\w+$')
+# InnoDB's default stopword list (INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD);
+# these words are not indexed either
+FULLTEXT_STOPWORDS = frozenset((
+    'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for',
+    'from', 'how', 'i', 'in', 'is', 'it', 'la', 'of', 'on', 'or', 'that', 'the',
+    'this', 'to', 'was', 'what', 'when', 'where', 'who', 'will', 'with', 'und', 'www',
+))
+
+def fulltext_search_terms(search_query):
+    """
+    Build a boolean-mode AGAINST() argument requiring every word of the
+    search as a prefix, e.g. 'gran bas' -> '+gran* +bas*'
+    
+    This matches word prefixes only, unlike LIKE's substring match ('stone'
+    does not find 'sandstone'); callers retry with LIKE when it finds nothing.
+    
+    Args:
+        search_query: Search text
+        
+    Returns:
+        str: AGAINST() argument, or None when the search must use LIKE instead
+             (punctuation, stopwords, or words too short to be indexed)
+    """
+    words = search_query.split()
+    if not words or not all(FULLTEXT_WORD.match(word) and len(word) >= FULLTEXT_MIN_WORD_LENGTH
+                            and word.lower() not in FULLTEXT_STOPWORDS
+                            for word in words):
+        return None
+    return ' '.join(f'+{word}*' for word in words)
+
+def name_search_clause(search_query):
+    """
+    Get the predicate matching the search against a submitter's full name
+    (users joined as `u`): a FULLTEXT match on u.full_name for whole-word
+    searches, otherwise a substring match
+    
+    Args:
+        search_query: Search text
+        
+    Returns:
+        tuple: (SQL fragment with one placeholder, its parameter)
+    """
+    terms = fulltext_search_terms(search_query) if FULL_NAME_SEARCH_READY else None
+    if terms:
+        return "MATCH(u.full_name) AGAINST (%s IN BOOLEAN MODE)", terms
+    if FULL_NAME_SEARCH_READY:
+        return "u.full_name LIKE %s", f"%{search_query}%"
+    return "CONCAT(u.first_name, ' ', u.last_name) LIKE %s", f"%{search_query}%"
+
+# Seconds a worker process reuses cached rock data. invalidate_rock_caches() only
+# clears the worker that made the change, so other workers can lag this long
+ROCK_CACHE_TTL = int(os.environ.get('ROCK_CACHE_TTL', 60))
+
+# Verified-rock listing pages for the student browse page, keyed by the filter values and page
+VERIFIED_ROCKS_CACHE = TTLCache(ttl=ROCK_CACHE_TTL, maxsize=256)
+# Rock type / location dropdown values built from verified rocks
+ROCK_FILTER_OPTIONS_CACHE = TTLCache(ttl=ROCK_CACHE_TTL, maxsize=8)
+
+# Rock lists (without image data) from the get_filtered_*_rocks helpers, keyed
+# by helper and filter values, and personnel rock list pages with their count,
+# keyed by filter values and page; repeated list/CSV export requests reuse them
+FILTERED_ROCKS_CACHE = TTLCache(ttl=ROCK_CACHE_TTL, maxsize=256)
+
+# Whole-table aggregates shown on the personnel pages (dashboard status counts,
+# map rocks with their city statistics), keyed by page
+ROCK_STATS_CACHE = TTLCache(ttl=ROCK_CACHE_TTL, maxsize=8)
+
+def invalidate_rock_caches():
+    """
+    Drop cached rock listings and dropdowns after any rock_samples or archives write
+    (in this worker process only; others expire theirs after ROCK_CACHE_TTL seconds)
+    """
+    VERIFIED_ROCKS_CACHE.clear()
+    ROCK_FILTER_OPTIONS_CACHE.clear()
+    FILTERED_ROCKS_CACHE.clear()
+    ROCK_STATS_CACHE.clear()
+
+def city_statistics(rocks):
+    """
+    Group map rocks by location_name without a second GROUP BY query
+    
+    Args:
+        rocks: Rows with location_name, latitude and longitude
+        
+    Returns:
+        list: One dict per location with specimen_count, avg_lat and avg_lng
+    """
+    totals = {}
+    for rock in rocks:
+        total = totals.setdefault(rock['location_name'], [0, 0, 0])
+        total[0] += 1
+        total[1] += rock['latitude']
+        total[2] += rock['longitude']
+    return [{'location_name': location_name, 'specimen_count': count,
+             'avg_lat': lat_sum / count, 'avg_lng': lng_sum / count}
+            for location_name, (count, lat_sum, lng_sum) in totals.items()]
+
+def embed_thumbnail(ws, thumbnail, anchor, rock, label):
+    """
+    Place one rock thumbnail (see attach_rock_images) in an Excel export worksheet
+    
+    Args:
+        ws: Worksheet being exported
+        thumbnail: None, a (bytes, width, height) tuple, or the exception raised
+        anchor: Cell the image is anchored to, e.g. 'K2'
+        rock: Rock dictionary the image belongs to (for error messages)
+        label: Image kind for error messages, e.g. 'outcrop'
+        
+    Returns:
+        Value for the anchor cell: None once embedded, '' without an image,
+        '(image too large)' past PIL's MAX_IMAGE_PIXELS, '(image error)' if
+        the image could not be read
+    """
+    if thumbnail is None:
+        return ''
+    try:
+        if isinstance(thumbnail, Exception):
+            raise thumbnail
+        image_bytes, width, height = thumbnail
+        img = OpenpyxlImage(io.BytesIO(image_bytes))
+        # Set size - openpyxl uses pixels (approximately 96 DPI for Excel)
+        img.width = width
+        img.height = height
+        img.anchor = anchor
+        ws.add_image(img)
+        return None
+    except DecompressionBombError as e:
+        print(f"Skipping {label} image for sample {rock.get('sample_id')}: {e}")
+        return '(image too large)'
+    except Exception as e:
+        print(f"Error adding {label} image for sample {rock.get('sample_id')}: {e}")
+        return '(image error)'
+
+EXCEL_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Positions of the Rock Specimen and Outcrop image columns (K and L) in every rock export
+EXCEL_IMAGE_COLUMNS = (10, 11)
+# Row height in Excel is in points (1 point = 1/72 inch), not pixels;
+# 150px images need approximately 112.5 points (150px * 0.75)
+EXCEL_IMAGE_ROW_HEIGHT = 115
+# Header row style, shared by every export
+EXCEL_HEADER_FILL = PatternFill(start_color="8B0000", end_color="8B0000", fill_type="solid")
+EXCEL_HEADER_FONT = Font(bold=True, color="FFFFFF")
+EXCEL_HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="center")
+# Streamed workbooks are sent in chunks of this many bytes, with at most
+# EXCEL_STREAM_QUEUE_CHUNKS waiting for a slow client
+EXCEL_STREAM_CHUNK_SIZE = 64 * 1024
+EXCEL_STREAM_QUEUE_CHUNKS = 16
+# With USE_X_SENDFILE, workbooks are written here for the web server to send;
+# files older than EXCEL_EXPORT_MAX_AGE seconds are removed by later exports
+EXCEL_EXPORT_DIR = os.environ.get('EXCEL_EXPORT_DIR') or tempfile.gettempdir()
+EXCEL_EXPORT_PREFIX = 'rock-export-'
+EXCEL_EXPORT_MAX_AGE = 600
+
+def remove_stale_exports():
+    """Delete X-Sendfile export files that the web server has long finished sending"""
+    cutoff = time.time() - EXCEL_EXPORT_MAX_AGE
+    try:
+        with os.scandir(EXCEL_EXPORT_DIR) as entries:
+            for entry in entries:
+                if entry.name.startswith(EXCEL_EXPORT_PREFIX) and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+    except OSError as e:
+        print(f"Error removing old export files: {e}")
+
+def excel_response(title, headers, rocks, row_values, filename):
+    """
+    Build a rock export workbook in openpyxl's write-only mode and send it
+    
+    Args:
+        title: Worksheet title
+        headers: Column titles; columns K and L hold the images
+        rocks: Rocks with thumbnails (include_image_data=True)
+        row_values: Function returning the list of cell values for a rock
+        filename: Download file name
+        
+    Returns:
+        Response: .xlsx attachment
+    """
+    rows = [row_values(rock) for rock in rocks]
+    
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    
+    # Rows are streamed out as they are appended, so column widths come first:
+    # image columns are wide enough for the images, text columns fit the header
+    # and the first 99 rows (capped at 50), measured in one pass over those rows
+    max_lengths = [len(header) for header in headers]
+    for row in rows[:99]:
+        for col_index, value in enumerate(row):
+            if value:
+                length = len(str(value))
+                if length > max_lengths[col_index]:
+                    max_lengths[col_index] = length
+    for col_index, max_length in enumerate(max_lengths):
+        width = 25 if col_index in EXCEL_IMAGE_COLUMNS else min(max_length + 2, 50)
+        ws.column_dimensions[get_column_letter(col_index + 1)].width = width
+    
+    # Header row
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.fill = EXCEL_HEADER_FILL
+        cell.font = EXCEL_HEADER_FONT
+        cell.alignment = EXCEL_HEADER_ALIGNMENT
+        header_cells.append(cell)
+    ws.append(header_cells)
+    
+    # Data rows with their images; rocks without an image (the common case)
+    # leave that cell empty (None from row_values) without calling embed_thumbnail
+    specimen_column, outcrop_column = EXCEL_IMAGE_COLUMNS
+    row_dimensions = ws.row_dimensions
+    append_row = ws.append
+    for row_num, (rock, row) in enumerate(zip(rocks, rows), 2):
+        row_dimensions[row_num].height = EXCEL_IMAGE_ROW_HEIGHT
+        specimen = rock.get('rock_specimen_thumbnail')
+        if specimen is not None:
+            row[specimen_column] = embed_thumbnail(ws, specimen, f'K{row_num}', rock, 'rock specimen')
+        outcrop = rock.get('outcrop_thumbnail')
+        if outcrop is not None:
+            row[outcrop_column] = embed_thumbnail(ws, outcrop, f'L{row_num}', rock, 'outcrop')
+        append_row(row)
+    
+    if app.config['USE_X_SENDFILE']:
+        # Save to disk and return only an X-Sendfile header: the web server sends
+        # the file and this worker is free as soon as the workbook is written.
+        # The file must outlive the response, so it is removed by a later export.
+        remove_stale_exports()
+        with tempfile.NamedTemporaryFile(prefix=EXCEL_EXPORT_PREFIX, suffix='.xlsx',
+                                         dir=EXCEL_EXPORT_DIR, delete=False) as output:
+            wb.save(output)
+        return send_file(output.name, mimetype=EXCEL_MIMETYPE, as_attachment=True,
+                         download_name=filename)
+    
+    # Write-only mode already keeps the rows in a temporary file; zip them
+    # while the response streams instead of building the .xlsx first
+    return app.response_class(stream_workbook(wb), mimetype=EXCEL_MIMETYPE,
+                              headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+class _ChunkWriter(io.RawIOBase):
+    """Write-only stream handing each write to a queue (see stream_workbook)"""
+    
+    def __init__(self, chunks, cancelled):
+        self.chunks = chunks
+        self.cancelled = cancelled
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        # After a cancelled download the rest of the file is discarded, which
+        # lets openpyxl finish (and clean up its temporary files) normally
+        if not self.cancelled.is_set():
+            self.chunks.put(bytes(data))
+        return len(data)
+
+def stream_workbook(wb):
+    """
+    Save a write-only workbook on a background thread, yielding the .xlsx as it is written
+    
+    Args:
+        wb: Write-only Workbook with every row appended
+        
+    Returns:
+        generator: Chunks of the file, for a streaming response
+    """
+    chunks = queue.Queue(maxsize=EXCEL_STREAM_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    
+    def save():
+        try:
+            # zipfile writes to unseekable streams using data descriptors
+            with io.BufferedWriter(_ChunkWriter(chunks, cancelled), EXCEL_STREAM_CHUNK_SIZE) as output:
+                wb.save(output)
+        except Exception as e:
+            print(f"Error writing Excel export: {e}")
+        finally:
+            chunks.put(None)
+    
+    threading.Thread(target=save, name='excel-export', daemon=True).start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        # Client gone or done: stop the writer and unblock it if the queue is full
+        cancelled.set()
+        while True:
+            try:
+                chunks.get_nowait()
+            except queue.Empty:
+                break
+
+# Encoded CSV is sent to the client in chunks of about this many bytes
+CSV_CHUNK_SIZE = 64 * 1024
+# Rows handed to csv.writer.writerows() at a time
+CSV_BATCH_ROWS = 500
+
+# Column titles of the rock CSV and Excel exports (admin exports add Student ID)
+ROCK_EXPORT_HEADERS = (
+    'Sample Index', 'Rock ID', 'Rock Type', 'Description', 'Formation',
+    'Location Name', 'Barangay', 'Province', 'Latitude', 'Longitude',
+    'Rock Specimen Image', 'Outcrop Image',
+    'Submitted By', 'Verified By', 'Status', 'Created At', 'Updated At'
+)
+ADMIN_ROCK_EXPORT_HEADERS = ROCK_EXPORT_HEADERS[:12] + ('Student ID',) + ROCK_EXPORT_HEADERS[12:]
+
+# Leading export columns shared by every rock CSV; the image flags become '(image)'
+CSV_ROCK_COLUMNS = (
+    'rock_index', 'rock_id', 'rock_type', 'description', 'formation',
+    'location_name', 'barangay', 'province', 'latitude', 'longitude',
+    'has_rock_specimen', 'has_outcrop'
+)
+
+def csv_response(header, rows, filename):
+    """
+    Stream a CSV download instead of building the whole file in memory first
+    
+    Args:
+        header: List of column titles
+        rows: Iterable of row lists, consumed while the response is sent
+        filename: Download file name
+        
+    Returns:
+        Response: Streaming text/csv attachment
+    """
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        row_iter = iter(rows)
+        while True:
+            batch = list(islice(row_iter, CSV_BATCH_ROWS))
+            if not batch:
+                break
+            writer.writerows(batch)
+            if buffer.tell() >= CSV_CHUNK_SIZE:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+    
+    return app.response_class(generate(), mimetype='text/csv',
+                              headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+def rock_csv_rows(rocks, name_columns):
+    """
+    Produce rock export CSV rows without per-column Python calls
+    
+    Args:
+        rocks: Rock dicts from a get_filtered_*_rocks helper (without image data)
+        name_columns: Keys of the person columns placed after the image markers
+        
+    Returns:
+        generator: Row lists of CSV_ROCK_COLUMNS, name_columns, status,
+                   created_at_str and updated_at_str
+    """
+    get_values = itemgetter(*CSV_ROCK_COLUMNS, *name_columns, 'status', 'created_at_str', 'updated_at_str')
+    image_flags = (CSV_ROCK_COLUMNS.index('has_rock_specimen'), CSV_ROCK_COLUMNS.index('has_outcrop'))
+    for rock in rocks:
+        # None is written as an empty field
+        row = list(get_values(rock))
+        for index in image_flags:
+            row[index] = '(image)' if row[index] else ''
+        yield row
+
+def parse_rock_form(form):
+    """
+    Read and validate the rock sample fields shared by the add and edit forms of every role
+    
+    Args:
+        form: Submitted request.form
+        
+    Returns:
+        tuple: (fields, error) - a dict of column values ready for the
+               INSERT/UPDATE and None, or None and the message to flash
+    """
+    latitude_str = (form.get('latitude', '') or '').strip()
+    longitude_str = (form.get('longitude', '') or '').strip()
+    if not latitude_str or not longitude_str:
+        return None, 'Latitude and longitude are required.'
+    try:
+        latitude = float(latitude_str)
+        longitude = float(longitude_str)
+    except ValueError:
+        return None, 'Latitude and longitude must be numeric values.'
+    if latitude < -90 or latitude > 90:
+        return None, 'Latitude must be between -90 and 90 degrees.'
+    if longitude < -180 or longitude > 180:
+        return None, 'Longitude must be between -180 and 180 degrees.'
+    
+    fields = {name: (form.get(name, '') or '').strip()
+              for name in ('rock_index', 'rock_id', 'rock_type', 'description', 'formation',
+                           'location_name', 'barangay', 'province')}
+    if not fields['rock_id'] or not fields['rock_type'] or not fields['location_name']:
+        return None, 'Rock ID, Rock Type, and Location are required!'
+    fields['barangay'] = fields['barangay'] or None
+    fields['province'] = fields['province'] or None
+    fields['latitude'] = latitude
+    fields['longitude'] = longitude
+    return fields, None
+
+def save_profile_photo(conn, user_id, file):
+    """
+    Resize an uploaded profile photo and store it on the user's row
+    
+    Args:
+        conn: Database connection
+        user_id: ID of the user
+        file: Uploaded FileStorage object
+        
+    Returns:
+        bool: True if the photo was stored, False if the upload was empty
+        
+    Raises:
+        ValueError: If the upload is not a readable image
+    """
+    stream = file.stream
+    stream.seek(0, os.SEEK_END)
+    if not stream.tell():
+        return False
+    stream.seek(0)
+    # Decoded straight from werkzeug's spooled upload; only the resized JPEG is kept
+    photo = make_profile_photo(stream)
+    filename = os.path.splitext(secure_filename(file.filename))[0] + '.jpg'
+    execute_query(conn, """
+        UPDATE users
+        SET profile_image = %s,
+            profile_image_mime = 'image/jpeg',
+            profile_image_name = %s,
+            profile_image_size = %s,
+            updated_at = NOW()
+        WHERE user_id = %s
+    """, (photo, filename, len(photo), user_id))
+    return True
+
+def save_rock_image(conn, sample_id, image_type, file):
+    """
+    Store an uploaded file as the sample's image of the given type, replacing
+    any existing one in a single upsert once uq_images_sample_type exists
+    (DELETE + INSERT until then)
+    
+    Args:
+        conn: Database connection
+        sample_id: ID of the rock sample
+        image_type: 'rock_specimen' or 'outcrop'
+        file: Uploaded FileStorage object
+        
+    Returns:
+        bool: True if the image was stored, False if the upload was empty
+    """
+    # Size the upload without reading it; werkzeug spools large files to disk
+    stream = file.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if not size:
+        return False
+    params = (sample_id, image_type, BlobStream(stream), file.filename,
+              size, file.content_type or 'application/octet-stream')
+    if not IMAGE_UNIQUE_KEY_READY:
+        # Without the unique key the upsert would add a second row for this type
+        execute_query(conn,
+            "DELETE FROM images WHERE sample_id = %s AND image_type = %s",
+            (sample_id, image_type))
+        execute_blob_query(conn,
+            """INSERT INTO images (sample_id, image_type, image_data, file_name, 
+               file_size, mime_type, created_at)
+               VALUES (%s, %s, %s, %s, %s, %s, NOW())""",
+            params)
+        return True
+    # A replaced image drops its stored thumbnail; the next export rebuilds it
+    clear_thumbnail = (", thumbnail_data = NULL, thumbnail_width = NULL, thumbnail_height = NULL"
+                       if IMAGE_THUMBNAILS_READY else "")
+    execute_blob_query(conn,
+        f"""INSERT INTO images (sample_id, image_type, image_data, file_name, 
+           file_size, mime_type, created_at)
+           VALUES (%s, %s, %s, %s, %s, %s, NOW())
+           ON DUPLICATE KEY UPDATE image_data = VALUES(image_data), file_name = VALUES(file_name),
+               file_size = VALUES(file_size), mime_type = VALUES(mime_type), created_at = NOW(){clear_thumbnail}""",
+        params)
+    return True
+
+def remove_rock_images(conn, sample_id, image_ids):
+    """
+    Delete the sample's images ticked for removal in one statement
+    
+    Args:
+        conn: Database connection
+        sample_id: ID of the rock sample (images of other samples are never touched)
+        image_ids: image_id values from the form; non-numeric entries are ignored
+        
+    Returns:
+        int: Number of images deleted
+    """
+    ids = [int(image_id) for image_id in image_ids if image_id.isdigit()]
+    if not ids:
+        return 0
+    placeholders = ','.join(['%s'] * len(ids))
+    return execute_query(conn,
+        f"DELETE FROM images WHERE sample_id = %s AND image_id IN ({placeholders})",
+        (sample_id, *ids))
+
+def get_verified_filter_options(conn):
+    """
+    Get the distinct rock types and locations of verified rocks (cached)
+    
+    Args:
+        conn: Database connection
+        
+    Returns:
+        tuple: (rock_types, locations) lists of row dicts
+    """
+    options = ROCK_FILTER_OPTIONS_CACHE.get('verified')
+    if options is None:
+        rock_types = fetch_all(conn, 
+                    "SELECT DISTINCT rock_type FROM rock_samples WHERE status = 'verified' AND rock_type IS NOT NULL ORDER BY rock_type") or []
+        locations = fetch_all(conn, 
+                    "SELECT DISTINCT location_name FROM rock_samples WHERE status = 'verified' AND location_name IS NOT NULL ORDER BY location_name") or []
+        options = (rock_types, locations)
+        ROCK_FILTER_OPTIONS_CACHE.set('verified', options)
+    return options
+
 # ============================================================================
 # CONTEXT PROCESSORS
 # ============================================================================
@@ -49,9 +836,13 @@ def log_activity(conn, user_id, activity_type, description, sample_id=None):
 @app.context_processor
 def inject_user_data():
     """Inject user session data into all templates"""
+    # Computed once per request, however many templates are rendered
+    if hasattr(g, '_session_ctx'):
+        return g._session_ctx
     try:
         from auth_utils import get_session_context
-        return get_session_context()
+        g._session_ctx = get_session_context()
+        return g._session_ctx
     except Exception as e:
         # Log the error for debugging
         print(f"Error in context processor: {e}")
@@ -78,14 +869,8 @@ def inject_user_data():
 def index():
     """Redirect to appropriate dashboard based on user role or login page"""
     if 'user_id' in session:
-        role = session.get('role')
-        if role == 'admin':
-            return redirect(url_for('admin_dashboard'))
-        elif role == 'personnel':
-            return redirect(url_for('personnel_dashboard'))
-        elif role == 'student':
-            return redirect(url_for('student_dashboard'))
-    return redirect(url_for('login'))
+        return redirect(url_for(ROLE_DASHBOARDS.get(session.get('role'), 'login')))
+    return redirect(cached_url('login'))
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -101,20 +886,26 @@ def login():
             conn = get_db_connection()
             # Lookup by email only
             user = fetch_one(conn, 
-                "SELECT * FROM users WHERE email = %s AND is_active = TRUE",
+                """SELECT user_id, username, role, first_name, last_name, password_hash, is_active
+                   FROM users WHERE email = %s AND is_active = TRUE""",
                 (email,))
             
-            if user and check_password_hash(user['password_hash'], password):
-                # Check if user's actual role matches the selected role
-                if user['role'] != selected_role:
-                    close_connection(conn)
-                    flash(f'Invalid role selection. Please select "{user["role"].title()}" for this account.', 'danger')
-                    return render_template('login.html')
-                
-                # Update last login
-                execute_query(conn,
-                    "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE user_id = %s",
-                    (user['user_id'],))
+            # Always verify the hash (unknown emails against the dummy one) and check the role
+            # afterwards, so every failed login takes as long as a wrong password
+            stored_hash = user['password_hash'] if user else DUMMY_PASSWORD_HASH
+            password_ok = verify_password(stored_hash, password or '')
+            
+            if user and password_ok and user['role'] == selected_role:
+                # Update last login, upgrading a legacy (pbkdf2/scrypt) hash to Argon2id now that the password is known
+                if password_needs_rehash(stored_hash):
+                    execute_query(conn,
+                        "UPDATE users SET last_login = CURRENT_TIMESTAMP, password_hash = %s WHERE user_id = %s",
+                        (hash_password(password), user['user_id']))
+                else:
+                    execute_query(conn,
+                        "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE user_id = %s",
+                        (user['user_id'],))
+                invalidate_user_cache(user['user_id'])
                 
                 # Set session variables
                 session['user_id'] = user['user_id']
@@ -127,7 +918,7 @@ def login():
                 return redirect(url_for('index'))
             else:
                 close_connection(conn)
-                flash('Invalid credentials or inactive account', 'danger')
+                flash('Invalid credentials, role selection, or inactive account', 'danger')
         except Exception as e:
             if conn:
                 try:
@@ -161,7 +952,7 @@ def signup():
         username = email.split('@')[0] if email else ''
         
         # Hash password
-        password_hash = generate_password_hash(password)
+        password_hash = hash_password(password)
         
         conn = get_db_connection()
         try:
@@ -195,7 +986,7 @@ def signup():
                 (username, email, password_hash, first_name, last_name, student_id))
             close_connection(conn)
             flash('Registration successful! Please login.', 'success')
-            return redirect(url_for('login'))
+            return redirect(cached_url('login'))
         except Exception as e:
             close_connection(conn)
             flash(f'Registration failed: Username or email already exists', 'danger')
@@ -207,77 +998,313 @@ def logout():
     """Handle user logout"""
     session.clear()
     flash('You have been logged out', 'info')
-    return redirect(url_for('login'))
+    return redirect(cached_url('login'))
 
 # ============================================================================
 # STUDENT ROUTES
 # ============================================================================
 
+# Columns added to existing databases: (column name, definition)
+USER_PHOTO_COLUMNS = [
+    ('profile_image', 'LONGBLOB NULL'),
+    ('profile_image_mime', 'VARCHAR(255) NULL'),
+    ('profile_image_name', 'VARCHAR(255) NULL'),
+    ('profile_image_size', 'INT NULL'),
+]
+ROCK_LOCATION_COLUMNS = [
+    ('barangay', 'VARCHAR(255) NULL'),
+    ('province', 'VARCHAR(255) NULL'),
+]
+# Export thumbnail stored next to each image (see attach_rock_images)
+IMAGE_THUMBNAIL_COLUMNS = [
+    ('thumbnail_data', 'MEDIUMBLOB NULL'),
+    ('thumbnail_width', 'SMALLINT NULL'),
+    ('thumbnail_height', 'SMALLINT NULL'),
+]
+
+# Set once the columns above are known to exist, so later calls skip the DDL
+_USER_PHOTO_COLUMNS_READY = False
+_ROCK_LOCATION_COLUMNS_READY = False
+IMAGE_THUMBNAILS_READY = False
+# Set once images has uq_images_sample_type (see ensure_image_unique_key)
+IMAGE_UNIQUE_KEY_READY = False
+
+def column_exists(conn, table, column):
+    """
+    Check whether a column exists on a table in the current database
+    
+    Returns:
+        bool: True if the column exists
+    """
+    return bool(fetch_one(conn,
+        """SELECT 1 AS present FROM information_schema.columns
+           WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s LIMIT 1""",
+        (table, column)))
+
 def ensure_user_photo_columns(conn):
     """
     Ensure the users table has columns for profile photo storage.
-    Safe to call multiple times.
+    Safe to call multiple times; only the first successful call touches the schema.
     """
+    global _USER_PHOTO_COLUMNS_READY
+    if _USER_PHOTO_COLUMNS_READY:
+        return
     try:
-        # MySQL/MariaDB support IF NOT EXISTS for ADD COLUMN
-        execute_query(conn, """
-            ALTER TABLE users
-            ADD COLUMN IF NOT EXISTS profile_image LONGBLOB NULL,
-            ADD COLUMN IF NOT EXISTS profile_image_mime VARCHAR(255) NULL,
-            ADD COLUMN IF NOT EXISTS profile_image_name VARCHAR(255) NULL,
-            ADD COLUMN IF NOT EXISTS profile_image_size INT NULL
-        """)
-    except Exception as _e:
-        # If database version doesn't support IF NOT EXISTS per-column, attempt adding individually
+        # MariaDB supports IF NOT EXISTS for ADD COLUMN
+        execute_query(conn, "ALTER TABLE users " + ", ".join(
+            f"ADD COLUMN IF NOT EXISTS {column} {definition}" for column, definition in USER_PHOTO_COLUMNS))
+        _USER_PHOTO_COLUMNS_READY = True
+    except Exception:
+        # MySQL does not, so add only the columns that are missing
         try:
-            execute_query(conn, "ALTER TABLE users ADD COLUMN profile_image LONGBLOB NULL")
-        except Exception:
-            pass
+            for column, definition in USER_PHOTO_COLUMNS:
+                if not column_exists(conn, 'users', column):
+                    execute_query(conn, f"ALTER TABLE users ADD COLUMN {column} {definition}")
+            _USER_PHOTO_COLUMNS_READY = True
+        except Exception as e:
+            print(f"Error adding profile photo columns: {e}")
+
+def ensure_rock_location_columns(conn):
+    """
+    Ensure the rock_samples table has barangay and province columns, and drop deprecated fields.
+    Safe to call multiple times; only the first successful call touches the schema.
+    """
+    global _ROCK_LOCATION_COLUMNS_READY
+    if _ROCK_LOCATION_COLUMNS_READY:
+        return
+    try:
+        execute_query(conn, "ALTER TABLE rock_samples " + ", ".join(
+            [f"ADD COLUMN IF NOT EXISTS {column} {definition}" for column, definition in ROCK_LOCATION_COLUMNS]
+            + ["DROP COLUMN IF EXISTS outcrop_id"]))
+        _ROCK_LOCATION_COLUMNS_READY = True
+    except Exception:
+        # For MySQL versions without IF [NOT] EXISTS on columns
         try:
-            execute_query(conn, "ALTER TABLE users ADD COLUMN profile_image_mime VARCHAR(255) NULL")
-        except Exception:
-            pass
+            for column, definition in ROCK_LOCATION_COLUMNS:
+                if not column_exists(conn, 'rock_samples', column):
+                    execute_query(conn, f"ALTER TABLE rock_samples ADD COLUMN {column} {definition}")
+            # Drop deprecated outcrop_id column if it exists
+            if column_exists(conn, 'rock_samples', 'outcrop_id'):
+                execute_query(conn, "ALTER TABLE rock_samples DROP COLUMN outcrop_id")
+            _ROCK_LOCATION_COLUMNS_READY = True
+        except Exception as e:
+            print(f"Error updating rock location columns: {e}")
+
+def ensure_image_thumbnail_columns(conn):
+    """
+    Ensure the images table has the stored export thumbnail columns.
+    Safe to call multiple times; only the first successful call touches the schema.
+    """
+    global IMAGE_THUMBNAILS_READY
+    if IMAGE_THUMBNAILS_READY:
+        return
+    try:
+        execute_query(conn, "ALTER TABLE images " + ", ".join(
+            f"ADD COLUMN IF NOT EXISTS {column} {definition}" for column, definition in IMAGE_THUMBNAIL_COLUMNS))
+        IMAGE_THUMBNAILS_READY = True
+    except Exception:
+        # For MySQL versions without IF NOT EXISTS on columns
         try:
-            execute_query(conn, "ALTER TABLE users ADD COLUMN profile_image_name VARCHAR(255) NULL")
-        except Exception:
-            pass
+            for column, definition in IMAGE_THUMBNAIL_COLUMNS:
+                if not column_exists(conn, 'images', column):
+                    execute_query(conn, f"ALTER TABLE images ADD COLUMN {column} {definition}")
+            IMAGE_THUMBNAILS_READY = True
+        except Exception as e:
+            print(f"Error adding image thumbnail columns: {e}")
+
+# Secondary indexes created by the startup migration: (table, index name, column list)
+STARTUP_INDEXES = [
+    ('rock_samples', 'idx_rocks_status_created', '(status, created_at)'),
+    ('rock_samples', 'idx_rocks_status_type', '(status, rock_type)'),
+    ('rock_samples', 'idx_rocks_user_status_created', '(user_id, status, created_at)'),
+    ('rock_samples', 'idx_rocks_created', '(created_at)'),
+    ('rock_samples', 'idx_rocks_type_created', '(rock_type, created_at)'),
+]
+
+# Columns searched by the student browse page (must match VERIFIED_FILTER_CLAUSES)
+FULLTEXT_SEARCH_COLUMNS = '(rock_index, rock_id, rock_type, location_name, description)'
+
+def index_exists(conn, table, index_name):
+    """
+    Check whether an index exists on a table in the current database
+    
+    Returns:
+        bool: True if the index exists
+    """
+    return bool(fetch_one(conn,
+        """SELECT 1 AS present FROM information_schema.statistics
+           WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1""",
+        (table, index_name)))
+
+# Indexes to drop: made redundant by a STARTUP_INDEXES entry, or no longer used
+REDUNDANT_INDEXES = [
+    ('rock_samples', 'idx_rocks_user_status'),
+    # Only served the student map's GROUP BY, now computed from the rock list
+    ('rock_samples', 'idx_rocks_status_location'),
+    # Copied seven users columns (password_hash included) for a lookup the UNIQUE
+    # email key already answers with one row; it only slowed every users write
+    ('users', 'ix_users_login'),
+]
+
+def ensure_indexes(conn):
+    """
+    Create any STARTUP_INDEXES entry that is missing and drop REDUNDANT_INDEXES
+    
+    One failing index does not stop the others; the first error is raised
+    once every index has been tried.
+    """
+    changes = [(table, index_name, f"CREATE INDEX {index_name} ON {table} {columns}", False)
+               for table, index_name, columns in STARTUP_INDEXES]
+    changes += [(table, index_name, f"ALTER TABLE {table} DROP INDEX {index_name}", True)
+                for table, index_name in REDUNDANT_INDEXES]
+    first_error = None
+    for table, index_name, statement, present in changes:
         try:
-            execute_query(conn, "ALTER TABLE users ADD COLUMN profile_image_size INT NULL")
-        except Exception:
-            pass
+            if index_exists(conn, table, index_name) == present:
+                execute_query(conn, statement)
+        except Exception as e:
+            print(f"Error updating index {index_name} on {table}: {e}")
+            first_error = first_error or e
+    if first_error:
+        raise first_error
+
+def ensure_fulltext_search(conn):
+    """
+    Ensure rock_samples has the ft_search FULLTEXT index and enable
+    MATCH() searches on the student browse page once it does
+    """
+    global FULLTEXT_SEARCH_READY
+    if not index_exists(conn, 'rock_samples', 'ft_search'):
+        execute_query(conn, f"CREATE FULLTEXT INDEX ft_search ON rock_samples {FULLTEXT_SEARCH_COLUMNS}")
+    FULLTEXT_SEARCH_READY = True
+
+def ensure_full_name_search(conn):
+    """
+    Ensure users has the stored full_name column (first and last name) with
+    the ft_full_name FULLTEXT index, and enable name searches on it once it does
+    """
+    global FULL_NAME_SEARCH_READY
+    if not column_exists(conn, 'users', 'full_name'):
+        execute_query(conn, """ALTER TABLE users ADD COLUMN full_name VARCHAR(101)
+            GENERATED ALWAYS AS (CONCAT(first_name, ' ', last_name)) STORED""")
+    if not index_exists(conn, 'users', 'ft_full_name'):
+        execute_query(conn, "CREATE FULLTEXT INDEX ft_full_name ON users (full_name)")
+    FULL_NAME_SEARCH_READY = True
 
-def ensure_rock_location_columns(conn):
+def ensure_image_unique_key(conn):
     """
-    Ensure the rock_samples table has barangay and province columns, and drop deprecated fields.
+    Ensure images has a unique key on (sample_id, image_type) so uploads can
+    replace the existing image with one upsert (sets IMAGE_UNIQUE_KEY_READY).
+    
+    Never deletes images: if a sample already has several images of one type,
+    the key is not added and uploads keep using DELETE + INSERT until
+    scripts/dedupe_images.py has been run.
     """
-    try:
-        execute_query(conn, """
-            ALTER TABLE rock_samples
-            ADD COLUMN IF NOT EXISTS barangay VARCHAR(255) NULL,
-            ADD COLUMN IF NOT EXISTS province VARCHAR(255) NULL
-        """)
-    except Exception:
+    global IMAGE_UNIQUE_KEY_READY
+    if IMAGE_UNIQUE_KEY_READY:
+        return
+    if not index_exists(conn, 'images', 'uq_images_sample_type'):
+        duplicate = fetch_one(conn, """
+            SELECT sample_id, image_type FROM images
+            GROUP BY sample_id, image_type HAVING COUNT(*) > 1 LIMIT 1""")
+        if duplicate:
+            print("Not adding uq_images_sample_type: images has duplicate (sample_id, image_type) rows "
+                  f"(e.g. sample {duplicate['sample_id']}, {duplicate['image_type']}). "
+                  "Run scripts/dedupe_images.py to remove them.")
+            return
+        execute_query(conn,
+            "ALTER TABLE images ADD UNIQUE KEY uq_images_sample_type (sample_id, image_type)")
+        # The non-unique index on the same columns is now redundant
         try:
-            execute_query(conn, "ALTER TABLE rock_samples ADD COLUMN barangay VARCHAR(255) NULL")
+            execute_query(conn, "ALTER TABLE images DROP INDEX idx_images_sample_type")
         except Exception:
             pass
+    IMAGE_UNIQUE_KEY_READY = True
+
+# Set once every startup migration step has succeeded or failed for good in this process
+_SCHEMA_READY = False
+_SCHEMA_RETRY_SECONDS = 30
+_schema_next_attempt = 0.0
+_schema_lock = threading.Lock()
+
+# Startup migration steps, in order. A step that fails does not stop the others;
+# until a step succeeds, the feature it enables stays off (e.g. search keeps
+# using LIKE without the FULLTEXT indexes)
+STARTUP_MIGRATIONS = [
+    ('user photo columns', ensure_user_photo_columns),
+    ('rock location columns', ensure_rock_location_columns),
+    ('image thumbnail columns', ensure_image_thumbnail_columns),
+    ('image unique key', ensure_image_unique_key),
+    ('indexes', ensure_indexes),
+    ('FULLTEXT search index', ensure_fulltext_search),
+    ('full_name search column', ensure_full_name_search),
+]
+
+# Errors a retry cannot fix: bad SQL or missing privileges, duplicate keys or
+# rows, features the server lacks
+PERMANENT_MIGRATION_ERRORS = (mysql_errors.ProgrammingError, mysql_errors.IntegrityError,
+                              mysql_errors.NotSupportedError, mysql_errors.DataError)
+
+# Names of the STARTUP_MIGRATIONS steps that no longer need to run
+_migrations_done = set()
+
+def run_startup_migrations(conn):
+    """
+    Apply the additive schema changes the routes rely on (one combined
+    ALTER per table where the server supports IF [NOT] EXISTS)
+    
+    Each step runs on its own. A step that fails with one of
+    PERMANENT_MIGRATION_ERRORS is logged and not tried again in this
+    process; other failures (e.g. a lost connection) are retried later.
+    
+    Args:
+        conn: Database connection
+        
+    Returns:
+        bool: True once no step is left to retry
+    """
+    for name, step in STARTUP_MIGRATIONS:
+        if name in _migrations_done:
+            continue
         try:
-            execute_query(conn, "ALTER TABLE rock_samples ADD COLUMN province VARCHAR(255) NULL")
-        except Exception:
-            pass
-    # Drop deprecated outcrop_id column if it exists
-    try:
-        execute_query(conn, "ALTER TABLE rock_samples DROP COLUMN IF EXISTS outcrop_id")
-    except Exception:
-        # For MySQL versions without DROP COLUMN IF EXISTS
+            step(conn)
+        except PERMANENT_MIGRATION_ERRORS as e:
+            print(f"Startup migration '{name}' failed and will not be retried: {e}")
+        except Exception as e:
+            print(f"Startup migration '{name}' failed, retrying in {_SCHEMA_RETRY_SECONDS} s: {e}")
+            continue
+        _migrations_done.add(name)
+    return len(_migrations_done) == len(STARTUP_MIGRATIONS)
+
+@app.before_request
+def apply_startup_migrations():
+    """Run the startup migrations on the first request this process handles"""
+    global _SCHEMA_READY, _schema_next_attempt
+    if _SCHEMA_READY or request.endpoint == 'static' or time.monotonic() < _schema_next_attempt:
+        return
+    with _schema_lock:
+        if _SCHEMA_READY:
+            return
+        conn = None
         try:
-            execute_query(conn, "ALTER TABLE rock_samples DROP COLUMN outcrop_id")
-        except Exception:
-            pass
+            conn = get_db_connection()
+            if run_startup_migrations(conn):
+                _SCHEMA_READY = True
+            else:
+                _schema_next_attempt = time.monotonic() + _SCHEMA_RETRY_SECONDS
+        except Exception as e:
+            # Leave the flag unset and retry later, once the database is reachable
+            _schema_next_attempt = time.monotonic() + _SCHEMA_RETRY_SECONDS
+            print(f"Error running startup migrations: {e}")
+        finally:
+            if conn:
+                try:
+                    close_connection(conn)
+                except Exception:
+                    pass
 
 @app.route('/student/dashboard')
-@login_required
-@role_required('student')
+@require_student
 def student_dashboard():
     """Student dashboard with statistics and recent submissions"""
     conn = None
@@ -295,53 +1322,30 @@ def student_dashboard():
             flash('Student information not found', 'danger')
             return redirect(url_for('logout'))
         
-        # Get basic statistics - use IFNULL to handle NULL from SUM() on empty tables
-        stats = fetch_one(conn,
-            """SELECT 
-                IFNULL(COUNT(*), 0) as total_submissions,
-                IFNULL(SUM(CASE WHEN status = 'verified' THEN 1 ELSE 0 END), 0) as verified_count,
-                IFNULL(SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END), 0) as pending_count,
-                IFNULL(SUM(CASE WHEN status = 'rejected' THEN 1 ELSE 0 END), 0) as rejected_count
-            FROM rock_samples WHERE user_id = %s""",
-            (user_id,))
-        
-        # Get additional statistics
-        additional_stats = fetch_one(conn,
-            """SELECT 
-                IFNULL(COUNT(DISTINCT rock_type), 0) as unique_rock_types,
-                IFNULL(COUNT(DISTINCT location_name), 0) as unique_locations
-            FROM rock_samples WHERE user_id = %s""",
-            (user_id,))
-        
-        # Initialize stats safely
-        if not stats:
-            stats = {
-                'total_submissions': 0,
-                'verified_count': 0,
-                'pending_count': 0,
-                'rejected_count': 0
-            }
-        
-        # Merge statistics safely
-        if additional_stats:
-            stats.update(additional_stats)
-        else:
-            stats.update({
-                'unique_rock_types': 0,
-                'unique_locations': 0
-            })
-        
-        # Ensure all numeric values are integers (not None)
-        for key in ['total_submissions', 'verified_count', 'pending_count', 'rejected_count', 
-                    'unique_rock_types', 'unique_locations']:
-            if key not in stats or stats[key] is None:
-                stats[key] = 0
-            else:
-                stats[key] = int(stats[key])
+        # Per-status counts walk idx_rocks_user_status_created; the ROLLUP row (status NULL,
+        # status itself is NOT NULL) carries the totals across all statuses
+        rows = fetch_all(conn,
+            """SELECT status, COUNT(*) as count,
+                COUNT(DISTINCT rock_type) as unique_rock_types,
+                COUNT(DISTINCT location_name) as unique_locations
+            FROM rock_samples WHERE user_id = %s
+            GROUP BY status WITH ROLLUP""",
+            (user_id,)) or []
+        counts = {row['status']: row for row in rows}
+        totals = counts.get(None, {})
+        stats = {
+            'total_submissions': int(totals.get('count', 0)),
+            'verified_count': int(counts.get('verified', {}).get('count', 0)),
+            'pending_count': int(counts.get('pending', {}).get('count', 0)),
+            'rejected_count': int(counts.get('rejected', {}).get('count', 0)),
+            'unique_rock_types': int(totals.get('unique_rock_types', 0)),
+            'unique_locations': int(totals.get('unique_locations', 0)),
+        }
         
         # Get recent submissions
         recent_rocks = fetch_all(conn,
-            """SELECT * FROM rock_samples 
+            """SELECT sample_id, rock_id, rock_type, location_name, status, created_at
+               FROM rock_samples 
                WHERE user_id = %s 
                ORDER BY created_at DESC LIMIT 10""",
             (user_id,))
@@ -358,95 +1362,52 @@ def student_dashboard():
                 close_connection(conn)
             except:
                 pass
-        print(f"Database error in student_dashboard: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Database error in student_dashboard")
         flash('Database connection error. Please ensure XAMPP MySQL is running.', 'danger')
         return redirect(url_for('logout'))
 
 @app.route('/student/add-rock', methods=['GET', 'POST'])
-@login_required
-@role_required('student')
+@require_student
 def student_add_rock():
     """Add new rock sample submission"""
     if request.method == 'POST':
         user_id = session['user_id']
-        rock_index = request.form.get('rock_index')
-        rock_id = request.form.get('rock_id')
-        rock_type = request.form.get('rock_type')
-        description = request.form.get('description', '')
-        formation = request.form.get('formation', '')
-        location_name = request.form.get('location_name')
-        barangay = request.form.get('barangay') or None
-        province = request.form.get('province') or None
-        
-        # Handle optional latitude/longitude
-        latitude_str = (request.form.get('latitude', '') or '').strip()
-        longitude_str = (request.form.get('longitude', '') or '').strip()
-
-        if not latitude_str or not longitude_str:
-            flash('Latitude and longitude are required.', 'danger')
-            return redirect(url_for('student_add_rock'))
-        try:
-            latitude = float(latitude_str)
-            longitude = float(longitude_str)
-        except ValueError:
-            flash('Latitude and longitude must be numeric values.', 'danger')
-            return redirect(url_for('student_add_rock'))
-
-        if latitude < -90 or latitude > 90:
-            flash('Latitude must be between -90 and 90 degrees.', 'danger')
-            return redirect(url_for('student_add_rock'))
-        if longitude < -180 or longitude > 180:
-            flash('Longitude must be between -180 and 180 degrees.', 'danger')
+        fields, error = parse_rock_form(request.form)
+        if error:
+            flash(error, 'danger')
             return redirect(url_for('student_add_rock'))
+        rock_id = fields['rock_id']
+        rock_type = fields['rock_type']
         
         rock_specimen = request.files.get('rock_specimen')
         outcrop_image = request.files.get('outcrop_image')
         
-        conn = get_db_connection()
+        # Uploaded images are streamed, which needs the pure-Python driver
+        conn = get_blob_connection()
         try:
-            ensure_rock_location_columns(conn)
+            # Sample row and images are committed together
+            begin_transaction(conn)
+            
             # Insert rock sample
             sample_id = execute_query(conn,
                 """INSERT INTO rock_samples (user_id, rock_index, rock_id, rock_type, 
                    description, formation, location_name, barangay, province, latitude, longitude, 
                    status, created_at)
                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending', NOW())""",
-                (user_id, rock_index, rock_id, rock_type, description, formation, 
-                 location_name, barangay, province, latitude, longitude))
+                (user_id, fields['rock_index'], rock_id, rock_type, fields['description'], fields['formation'],
+                 fields['location_name'], fields['barangay'], fields['province'],
+                 fields['latitude'], fields['longitude']))
             
             # Insert rock specimen image (ensure only one image of this type)
             if rock_specimen and rock_specimen.filename:
-                # Delete any existing rock_specimen images for this sample (safety check)
-                execute_query(conn,
-                    """DELETE FROM images 
-                       WHERE sample_id = %s AND image_type = 'rock_specimen'""",
-                    (sample_id,))
-                rock_specimen_data = rock_specimen.read()
-                if rock_specimen_data:
-                    execute_query(conn,
-                        """INSERT INTO images (sample_id, image_type, image_data, file_name, 
-                           file_size, mime_type, created_at)
-                           VALUES (%s, 'rock_specimen', %s, %s, %s, %s, NOW())""",
-                        (sample_id, rock_specimen_data, rock_specimen.filename,
-                             len(rock_specimen_data), rock_specimen.content_type or 'application/octet-stream'))
+                save_rock_image(conn, sample_id, 'rock_specimen', rock_specimen)
             
             # Insert outcrop image (ensure only one image of this type)
             if outcrop_image and outcrop_image.filename:
-                # Delete any existing outcrop images for this sample (safety check)
-                execute_query(conn,
-                    """DELETE FROM images 
-                       WHERE sample_id = %s AND image_type = 'outcrop'""",
-                    (sample_id,))
-                outcrop_image_data = outcrop_image.read()
-                if outcrop_image_data:
-                    execute_query(conn,
-                        """INSERT INTO images (sample_id, image_type, image_data, file_name, 
-                           file_size, mime_type, created_at)
-                           VALUES (%s, 'outcrop', %s, %s, %s, %s, NOW())""",
-                        (sample_id, outcrop_image_data, outcrop_image.filename,
-                             len(outcrop_image_data), outcrop_image.content_type or 'application/octet-stream'))
+                save_rock_image(conn, sample_id, 'outcrop', outcrop_image)
+            
+            commit_transaction(conn)
+            invalidate_rock_caches()
             
             # Log activity
             log_activity(conn, user_id, 'submitted',
@@ -456,26 +1417,37 @@ def student_add_rock():
             flash('Rock sample submitted successfully and is pending verification!', 'success')
             return redirect(url_for('student_view_rocks'))
         except Exception as e:
+            try:
+                rollback_transaction(conn)
+            except Exception:
+                pass
             close_connection(conn)
             flash(f'Error submitting rock sample: {str(e)}', 'danger')
     
     return render_template('students/add_rock.html')
 
 @app.route('/student/edit-rock/<int:sample_id>', methods=['GET', 'POST'])
-@login_required
-@role_required('student')
+@require_student
 def student_edit_rock(sample_id):
     """Edit rock sample belonging to the logged-in student."""
     conn = None
     user_id = session['user_id']
     
     try:
-        conn = get_db_connection()
-        ensure_rock_location_columns(conn)
-        # First, verify the rock belongs to this student
+        # Uploaded images are streamed, which needs the pure-Python driver
+        conn = get_blob_connection() if request.method == 'POST' else get_db_connection()
+        # First, verify the rock belongs to this student; its current images come
+        # back on the same row (uq_images_sample_type allows one of each type)
         rock = fetch_one(conn,
-            """SELECT * FROM rock_samples 
-               WHERE sample_id = %s AND user_id = %s AND status IN ('pending', 'verified')""",
+            """SELECT rs.sample_id, rs.rock_index, rs.rock_id, rs.rock_type, rs.description, rs.formation,
+                      rs.location_name, rs.barangay, rs.province, rs.latitude, rs.longitude,
+                      rs.status, rs.verified_by,
+                      spec.image_id AS rock_specimen_image_id, spec.file_name AS rock_specimen_file_name,
+                      outc.image_id AS outcrop_image_id, outc.file_name AS outcrop_file_name
+               FROM rock_samples rs
+               LEFT JOIN images spec ON spec.sample_id = rs.sample_id AND spec.image_type = 'rock_specimen'
+               LEFT JOIN images outc ON outc.sample_id = rs.sample_id AND outc.image_type = 'outcrop'
+               WHERE rs.sample_id = %s AND rs.user_id = %s AND rs.status IN ('pending', 'verified')""",
             (sample_id, user_id))
         active_nav = 'student_pending_verifications' if rock and rock.get('status') == 'pending' else 'student_view_rocks'
         
@@ -484,35 +1456,16 @@ def student_edit_rock(sample_id):
             return redirect(url_for('student_pending_verifications'))
         
         if request.method == 'POST':
-            rock_index = request.form.get('rock_index')
-            rock_id = request.form.get('rock_id')
-            rock_type = request.form.get('rock_type')
-            description = request.form.get('description', '')
-            formation = request.form.get('formation', '')
-            location_name = request.form.get('location_name')
-            barangay = request.form.get('barangay') or None
-            province = request.form.get('province') or None
-            
-            # Handle optional latitude/longitude
-            latitude_str = (request.form.get('latitude', '') or '').strip()
-            longitude_str = (request.form.get('longitude', '') or '').strip()
-
-            if not latitude_str or not longitude_str:
-                flash('Latitude and longitude are required.', 'danger')
-                return redirect(url_for('student_edit_rock', sample_id=sample_id))
-            try:
-                latitude = float(latitude_str)
-                longitude = float(longitude_str)
-            except ValueError:
-                flash('Latitude and longitude must be numeric values.', 'danger')
-                return redirect(url_for('student_edit_rock', sample_id=sample_id))
-
-            if latitude < -90 or latitude > 90:
-                flash('Latitude must be between -90 and 90 degrees.', 'danger')
-                return redirect(url_for('student_edit_rock', sample_id=sample_id))
-            if longitude < -180 or longitude > 180:
-                flash('Longitude must be between -180 and 180 degrees.', 'danger')
+            fields, error = parse_rock_form(request.form)
+            if error:
+                flash(error, 'danger')
                 return redirect(url_for('student_edit_rock', sample_id=sample_id))
+            rock_id = fields['rock_id']
+            rock_type = fields['rock_type']
+            # Column values shared by both UPDATE variants below
+            field_values = (fields['rock_index'], rock_id, rock_type, fields['description'],
+                            fields['formation'], fields['location_name'], fields['barangay'],
+                            fields['province'], fields['latitude'], fields['longitude'])
             
             rock_specimen = request.files.get('rock_specimen')
             outcrop_image = request.files.get('outcrop_image')
@@ -520,6 +1473,8 @@ def student_edit_rock(sample_id):
             try:
                 current_status = rock['status']
                 current_verified_by = rock.get('verified_by')
+                # Sample row and images are committed together
+                begin_transaction(conn)
                 # Update rock sample
                 try:
                     execute_query(conn,
@@ -531,13 +1486,11 @@ def student_edit_rock(sample_id):
                                status = %s,
                                verified_by = %s
                            WHERE sample_id = %s""",
-                        (rock_index, rock_id, rock_type, description, formation, 
-                         location_name, barangay, province, latitude, longitude,
-                         current_status,
-                         current_verified_by,
-                         sample_id))
+                        field_values + (current_status, current_verified_by, sample_id))
                 except Exception:
                     # Fallback for schemas where verified_by cannot be NULL or updated
+                    # (the failed UPDATE rolled the transaction back, so start a new one)
+                    begin_transaction(conn)
                     execute_query(conn,
                         """UPDATE rock_samples 
                            SET rock_index = %s, rock_id = %s, rock_type = %s, 
@@ -546,44 +1499,18 @@ def student_edit_rock(sample_id):
                                updated_at = NOW(),
                                status = %s
                            WHERE sample_id = %s""",
-                        (rock_index, rock_id, rock_type, description, formation, 
-                         location_name, barangay, province, latitude, longitude,
-                         current_status,
-                         sample_id))
+                        field_values + (current_status, sample_id))
 
                 # Update rock specimen image if provided (ensure only one image of this type)
                 if rock_specimen and rock_specimen.filename:
-                    # Delete existing rock specimen image before inserting new one
-                    execute_query(conn,
-                        """DELETE FROM images 
-                           WHERE sample_id = %s AND image_type = 'rock_specimen'""",
-                        (sample_id,))
-                    rock_specimen_data = rock_specimen.read()
-                    if rock_specimen_data:
-                        # Insert new rock specimen image
-                        execute_query(conn,
-                            """INSERT INTO images (sample_id, image_type, image_data, file_name, 
-                               file_size, mime_type, created_at)
-                               VALUES (%s, 'rock_specimen', %s, %s, %s, %s, NOW())""",
-                            (sample_id, rock_specimen_data, rock_specimen.filename,
-                                 len(rock_specimen_data), rock_specimen.content_type or 'application/octet-stream'))
+                    save_rock_image(conn, sample_id, 'rock_specimen', rock_specimen)
                 
                 # Update outcrop image if provided (ensure only one image of this type)
                 if outcrop_image and outcrop_image.filename:
-                    # Delete existing outcrop image before inserting new one
-                    execute_query(conn,
-                        """DELETE FROM images 
-                           WHERE sample_id = %s AND image_type = 'outcrop'""",
-                        (sample_id,))
-                    outcrop_image_data = outcrop_image.read()
-                    if outcrop_image_data:
-                        # Insert new outcrop image
-                        execute_query(conn,
-                            """INSERT INTO images (sample_id, image_type, image_data, file_name, 
-                               file_size, mime_type, created_at)
-                               VALUES (%s, 'outcrop', %s, %s, %s, %s, NOW())""",
-                            (sample_id, outcrop_image_data, outcrop_image.filename,
-                                 len(outcrop_image_data), outcrop_image.content_type or 'application/octet-stream'))
+                    save_rock_image(conn, sample_id, 'outcrop', outcrop_image)
+                
+                commit_transaction(conn)
+                invalidate_rock_caches()
                 
                 # Log activity
                 log_activity(conn, user_id, 'updated', 
@@ -594,13 +1521,16 @@ def student_edit_rock(sample_id):
                     return redirect(url_for('student_pending_verifications'))
                 return redirect(url_for('student_view_rocks'))
             except Exception as e:
+                try:
+                    rollback_transaction(conn)
+                except Exception:
+                    pass
                 flash(f'Error updating rock sample: {str(e)}', 'danger')
         
-        # Get existing images for display
-        images = fetch_all(conn,
-            """SELECT image_id, image_type, file_name, file_size, mime_type, created_at
-               FROM images WHERE sample_id = %s""",
-            (sample_id,))
+        # Existing images for display, from the joined columns
+        images = [{'image_id': rock[f'{image_type}_image_id'], 'image_type': image_type,
+                   'file_name': rock[f'{image_type}_file_name']}
+                  for image_type in ('rock_specimen', 'outcrop') if rock[f'{image_type}_image_id']]
         
         return render_template(
             'students/edit_rock.html',
@@ -612,8 +1542,7 @@ def student_edit_rock(sample_id):
         close_connection(conn)
 
 @app.route('/student/delete-rock/<int:sample_id>', methods=['POST'])
-@login_required
-@role_required('student')
+@require_student
 def student_delete_rock(sample_id):
     """Delete rock sample (students can only delete their own pending samples)"""
     conn = get_db_connection()
@@ -621,7 +1550,7 @@ def student_delete_rock(sample_id):
     
     # First, verify the rock belongs to this student and is pending
     rock = fetch_one(conn,
-        """SELECT * FROM rock_samples 
+        """SELECT rock_id, rock_type FROM rock_samples 
            WHERE sample_id = %s AND user_id = %s AND status = 'pending'""",
         (sample_id, user_id))
     
@@ -631,21 +1560,16 @@ def student_delete_rock(sample_id):
         return redirect(url_for('student_pending_verifications'))
     
     try:
-        # Log the deletion activity before deleting other records
-        execute_query(conn,
-            """INSERT INTO activity_logs (user_id, sample_id, activity_type, description)
-               VALUES (%s, %s, 'deleted', %s)""",
-            (user_id, sample_id, f'Rock sample deleted: {rock["rock_id"]} - {rock["rock_type"]}'))
-        
-        # Delete associated images
-        execute_query(conn,
-            """DELETE FROM images WHERE sample_id = %s""",
-            (sample_id,))
-        
-        # Delete the rock sample (activity logs will remain for history)
+        # Delete the rock sample; images (and approval/archive rows) go with it via
+        # ON DELETE CASCADE, activity logs remain for history
         execute_query(conn,
             """DELETE FROM rock_samples WHERE sample_id = %s""",
             (sample_id,))
+        invalidate_rock_caches()
+        
+        # Logged without sample_id: the queued row is written after the delete, and
+        # activity_logs.sample_id would be set to NULL by the foreign key anyway
+        log_activity(conn, user_id, 'deleted', f'Rock sample deleted: {rock["rock_id"]} - {rock["rock_type"]}')
         
         close_connection(conn)
         flash('Rock sample deleted successfully!', 'success')
@@ -657,8 +1581,7 @@ def student_delete_rock(sample_id):
         return redirect(url_for('student_pending_verifications'))
 
 @app.route('/student/view-rocks')
-@login_required
-@role_required('student')
+@require_student
 def student_view_rocks():
     """View all verified rock samples from all students with search and filtering"""
     conn = None
@@ -672,168 +1595,289 @@ def student_view_rocks():
         date_from = (request.args.get('date_from', '') or '').strip()
         date_to = (request.args.get('date_to', '') or '').strip()
         
-        # Debug: Print filter parameters (remove in production)
-        if rock_type_filter:
-            print(f"DEBUG: rock_type_filter received: '{rock_type_filter}' (length: {len(rock_type_filter)})")
-        
-        # Build the base query - only verified rocks from all students
-        base_query = """SELECT rs.*, 
-            CONCAT(v.first_name, ' ', v.last_name) as verified_by_name,
-            CONCAT(s.first_name, ' ', s.last_name) as submitted_by_name
-            FROM rock_samples rs
-            LEFT JOIN users v ON rs.verified_by = v.user_id
-            LEFT JOIN users s ON rs.user_id = s.user_id
-                    WHERE rs.status = 'verified'"""
-        
-        # Add WHERE conditions for filtering
-        where_conditions = []
-        params = []
-        
-        if search_query:
-            where_conditions.append("(rs.rock_index LIKE %s OR rs.rock_id LIKE %s OR rs.rock_type LIKE %s OR rs.location_name LIKE %s OR rs.description LIKE %s)")
-            search_param = f"%{search_query}%"
-            params.extend([search_param, search_param, search_param, search_param, search_param])
+        # SQL for this combination of filters (built once per combination)
+        filter_key = (search_query, rock_type_filter, location_filter, date_from, date_to)
+        present, params = get_verified_filter_params(*filter_key)
         
-        if rock_type_filter:
-            where_conditions.append("rs.rock_type = %s")
-            params.append(rock_type_filter)
-        
-        if location_filter:
-            where_conditions.append("rs.location_name LIKE %s")
-            params.append(f"%{location_filter}%")
-        
-        if date_from:
-            where_conditions.append("DATE(rs.created_at) >= %s")
-            params.append(date_from)
-        
-        if date_to:
-            where_conditions.append("DATE(rs.created_at) <= %s")
-            params.append(date_to)
-        
-        # Combine query with conditions
-        if where_conditions:
-            query = base_query + " AND " + " AND ".join(where_conditions) + " ORDER BY rs.created_at DESC"
-        else:
-            query = base_query + " ORDER BY rs.created_at DESC"
-        
-        # Execute query to get filtered rocks
-        # Convert params list to tuple for MySQL connector compatibility, or None if empty
-        query_params = tuple(params) if params else None
-        
-        # Debug: Print query details
-        if rock_type_filter:
-            print(f"DEBUG: Executing query with rock_type_filter='{rock_type_filter}'")
-            print(f"DEBUG: Query: {query}")
-            print(f"DEBUG: Params: {query_params}")
+        # Only one page of rocks is loaded per request
+        page = max(request.args.get('page', 1, type=int), 1)
         
+        query = query_params = None
         try:
-            rocks = fetch_all(conn, query, query_params)
-            # Ensure rocks is a list, not None
-            if rocks is None:
-                rocks = []
-            
-            if rock_type_filter:
-                print(f"DEBUG: Query executed successfully, found {len(rocks)} results")
-                if len(rocks) > 0:
-                    print(f"DEBUG: First rock: {rocks[0].get('rock_id')} - {rocks[0].get('rock_type')}")
-        except Exception as e:
-            print(f"DEBUG: Error executing query: {e}")
-            print(f"DEBUG: Query: {query}")
-            print(f"DEBUG: Params: {query_params}")
-            import traceback
-            traceback.print_exc()
-            rocks = []
+            cached = VERIFIED_ROCKS_CACHE.get(filter_key + (page,))
+            if cached is None:
+                total = fetch_one(conn, get_verified_rock_queries(present)['count'], tuple(params) or None)['total']
+                if not total and present[0]:
+                    # MATCH only finds word prefixes; retry as a substring search
+                    present, params = get_verified_filter_params(*filter_key, fulltext=False)
+                    total = fetch_one(conn, get_verified_rock_queries(present)['count'], tuple(params))['total']
+                
+                # Execute query to get filtered rocks
+                # Convert params list to tuple for MySQL connector compatibility
+                query = get_verified_rock_queries(present)['page']
+                query_params = tuple(params) + (ROCKS_PER_PAGE, (page - 1) * ROCKS_PER_PAGE)
+                if app.logger.isEnabledFor(logging.DEBUG):
+                    app.logger.debug("student_view_rocks query: %s params: %s", query, query_params)
+                # Ensure rocks is a list, not None
+                rocks = fetch_all(conn, query, query_params) or []
+                cached = (rocks, total, present, params)
+                VERIFIED_ROCKS_CACHE.set(filter_key + (page,), cached)
+            rocks, total, present, params = cached
+        except Exception:
+            app.logger.exception("Error loading verified rocks (query: %s, params: %s)", query, query_params)
+            rocks, total = [], 0
+        queries = get_verified_rock_queries(present)
         
         # Get unique rock types and locations for filter dropdowns
-        rock_types = fetch_all(conn, 
-                    "SELECT DISTINCT rock_type FROM rock_samples WHERE status = 'verified' AND rock_type IS NOT NULL ORDER BY rock_type") or []
+        rock_types, locations = get_verified_filter_options(conn)
         
-        locations = fetch_all(conn, 
-                    "SELECT DISTINCT location_name FROM rock_samples WHERE status = 'verified' AND location_name IS NOT NULL ORDER BY location_name") or []
+        # The student's own verified rocks with the same filters (not paginated)
+        user_id = int(session['user_id'])
+        my_verified = VERIFIED_ROCKS_CACHE.get(('own', user_id) + filter_key)
+        if my_verified is None:
+            my_verified = fetch_all(conn, queries['own'], (user_id,) + tuple(params)) or []
+            VERIFIED_ROCKS_CACHE.set(('own', user_id) + filter_key, my_verified)
         
-                # Query student's verified rocks directly from database
-        my_verified = []
-        if 'user_id' in session:
-                    try:
-                        user_id = int(session['user_id'])  # Ensure it's an integer
-                        
-                        # Build query for student's verified rocks with same filters
-                        my_verified_base_query = """SELECT rs.*, 
-                        CONCAT(v.first_name, ' ', v.last_name) as verified_by_name,
-                        CONCAT(s.first_name, ' ', s.last_name) as submitted_by_name
-                        FROM rock_samples rs
-                        LEFT JOIN users v ON rs.verified_by = v.user_id
-                        LEFT JOIN users s ON rs.user_id = s.user_id
-                        WHERE rs.status = 'verified' AND rs.user_id = %s"""
-                        
-                        my_verified_where_conditions = []
-                        my_verified_params = [user_id]
-                        
-                        if search_query:
-                            my_verified_where_conditions.append("(rs.rock_index LIKE %s OR rs.rock_id LIKE %s OR rs.rock_type LIKE %s OR rs.location_name LIKE %s OR rs.description LIKE %s)")
-                            search_param = f"%{search_query}%"
-                            my_verified_params.extend([search_param, search_param, search_param, search_param, search_param])
-                        
-                        if rock_type_filter:
-                            my_verified_where_conditions.append("rs.rock_type = %s")
-                            my_verified_params.append(rock_type_filter)
-                        
-                        if location_filter:
-                            my_verified_where_conditions.append("rs.location_name LIKE %s")
-                            my_verified_params.append(f"%{location_filter}%")
-                        
-                        if date_from:
-                            my_verified_where_conditions.append("DATE(rs.created_at) >= %s")
-                            my_verified_params.append(date_from)
-                        
-                        if date_to:
-                            my_verified_where_conditions.append("DATE(rs.created_at) <= %s")
-                            my_verified_params.append(date_to)
-                        
-                        # Combine query with conditions
-                        if my_verified_where_conditions:
-                            my_verified_query = my_verified_base_query + " AND " + " AND ".join(my_verified_where_conditions) + " ORDER BY rs.created_at DESC"
-                        else:
-                            my_verified_query = my_verified_base_query + " ORDER BY rs.created_at DESC"
-                        
-                        # Convert params list to tuple for MySQL connector compatibility
-                        my_verified_query_params = tuple(my_verified_params) if my_verified_params else None
-                        my_verified = fetch_all(conn, my_verified_query, my_verified_query_params) or []
-                    except Exception as e:
-                        print(f"Error fetching student's verified rocks: {e}")
-                        import traceback
-                        traceback.print_exc()
-                        my_verified = []
+        pagination = Pagination(page, ROCKS_PER_PAGE, total)
+        # Active filters, carried over by the pager links
+        filter_args = {key: value for key, value in zip(
+            ('search', 'rock_type', 'location', 'date_from', 'date_to'), filter_key) if value}
         
         close_connection(conn)
         
-        # Debug: Verify rocks before rendering
-        if rock_type_filter:
-            print(f"DEBUG: Before rendering template - rocks count: {len(rocks) if rocks else 0}")
-            print(f"DEBUG: rocks type: {type(rocks)}")
-            if rocks and len(rocks) > 0:
-                print(f"DEBUG: First rock sample_id: {rocks[0].get('sample_id')}")
-                print(f"DEBUG: First rock rock_type: {rocks[0].get('rock_type')}")
-        
         return render_template('students/view_rocks.html', rocks=rocks, 
                             search_query=search_query, rock_type_filter=rock_type_filter,
                             location_filter=location_filter, date_from=date_from, date_to=date_to,
-                            rock_types=rock_types, locations=locations, my_verified=my_verified)
+                            rock_types=rock_types, locations=locations, my_verified=my_verified,
+                            pagination=pagination, filter_args=filter_args)
     except Exception as e:
         if conn:
             try:
                 close_connection(conn)
             except:
                 pass
-        print(f"Error in student_view_rocks: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in student_view_rocks")
         flash('An error occurred while loading rock samples.', 'danger')
         # Return empty data on error
         return render_template('students/view_rocks.html', rocks=[], 
                              search_query='', rock_type_filter='',
                              location_filter='', date_from='', date_to='',
-                             rock_types=[], locations=[], my_verified=[])
+                             rock_types=[], locations=[], my_verified=[],
+                             pagination=Pagination(1, ROCKS_PER_PAGE, 0), filter_args={})
+
+# Image flags selected with the rocks when no image data is needed; each EXISTS
+# is a single probe of uq_images_sample_type (sample_id, image_type)
+ROCK_IMAGE_FLAG_COLUMNS = """,
+        EXISTS(SELECT 1 FROM images i WHERE i.sample_id = rs.sample_id AND i.image_type = 'rock_specimen') AS has_rock_specimen,
+        EXISTS(SELECT 1 FROM images i WHERE i.sample_id = rs.sample_id AND i.image_type = 'outcrop') AS has_outcrop"""
+
+# rock_samples columns returned by the get_filtered_*_rocks helpers: the ones the
+# list pages and exports use, so columns added to the table later are not fetched.
+# The *_str columns are the timestamps already formatted as 'YYYY-MM-DD HH:MM:SS'
+# for the exports (CAST rather than DATE_FORMAT: the connector does not unescape %%)
+EXPORT_ROCK_COLUMNS = """rs.sample_id, rs.user_id, rs.verified_by, rs.rock_index, rs.rock_id,
+        rs.rock_type, rs.description, rs.formation, rs.location_name, rs.barangay,
+        rs.province, rs.latitude, rs.longitude, rs.status, rs.created_at, rs.updated_at,
+        CAST(rs.created_at AS CHAR) AS created_at_str, CAST(rs.updated_at AS CHAR) AS updated_at_str"""
+
+# Image fields every Excel-exported rock carries, filled in by attach_rock_images
+ROCK_IMAGE_DEFAULTS = {
+    'has_rock_specimen': False,
+    'has_outcrop': False,
+    'rock_specimen_thumbnail': None,
+    'outcrop_thumbnail': None,
+    'rock_specimen_mime': None,
+    'outcrop_mime': None,
+}
+
+# Sample ids per image query in attach_rock_images, keeping IN (...) lists short
+ROCK_IMAGES_BATCH_SIZE = 1024
+# Image query per IN-list length, so the placeholders are joined once per length
+# (keyed by (count, IMAGE_THUMBNAILS_READY))
+ROCK_IMAGE_QUERIES = {}
+
+def get_rock_images_query(count):
+    """
+    Get the query loading the specimen/outcrop images of `count` samples.
+    Once thumbnails are stored, the original image_data is only sent for
+    images that do not have one yet.
+    
+    Args:
+        count: Number of sample_id parameters
+        
+    Returns:
+        str: SQL with `count` placeholders in its IN list
+    """
+    key = (count, IMAGE_THUMBNAILS_READY)
+    query = ROCK_IMAGE_QUERIES.get(key)
+    if query is None:
+        placeholders = ','.join(['%s'] * count)
+        if IMAGE_THUMBNAILS_READY:
+            image_columns = """thumbnail_data, thumbnail_width, thumbnail_height,
+                       CASE WHEN thumbnail_data IS NULL THEN image_data END AS image_data"""
+        else:
+            image_columns = """NULL AS thumbnail_data, NULL AS thumbnail_width, NULL AS thumbnail_height,
+                       image_data"""
+        query = ROCK_IMAGE_QUERIES[key] = f"""
+                SELECT image_id, sample_id, image_type, mime_type,
+                       {image_columns}
+                FROM images
+                WHERE sample_id IN ({placeholders}) 
+                AND image_type IN ('rock_specimen', 'outcrop')
+            """
+    return query
+
+def attach_rock_images(conn, rocks, include_image_data=False):
+    """
+    Add image thumbnails for the Excel export to rocks from the get_filtered_*_rocks helpers.
+    Without include_image_data there is nothing to add: the rock query already
+    selected has_rock_specimen and has_outcrop (ROCK_IMAGE_FLAG_COLUMNS).
+    
+    Thumbnails stored in images.thumbnail_data are used as they are; the rest
+    are made from the original images and stored for the next export.
+    
+    Args:
+        conn: Database connection
+        rocks: List of rock dictionaries (updated in place)
+        include_image_data: If True, adds rock_specimen_thumbnail and
+            outcrop_thumbnail (see make_thumbnails) for Excel export
+    
+    Returns:
+        The same rocks list
+    """
+    if rocks and include_image_data:
+        # One pass: give every rock the image defaults and index it by sample_id
+        # (the dict keys double as the de-duplicated id list for the queries)
+        rock_dict = {}
+        defaults = ROCK_IMAGE_DEFAULTS
+        for rock in rocks:
+            rock.update(defaults)
+            sample_id = rock.get('sample_id')
+            if sample_id:
+                rock_dict[sample_id] = rock
+        sample_ids = list(rock_dict)
+        # (rock, thumbnail key, image_id, original image) still to be thumbnailed
+        missing = []
+        if sample_ids:
+            # Fetch the images for Excel export, ROCK_IMAGES_BATCH_SIZE samples
+            # per query; rows are streamed so the driver never buffers every BLOB
+            # alongside the copies kept on the rocks
+            for start in range(0, len(sample_ids), ROCK_IMAGES_BATCH_SIZE):
+                batch = sample_ids[start:start + ROCK_IMAGES_BATCH_SIZE]
+                for img in iter_rows(conn, get_rock_images_query(len(batch)), tuple(batch)):
+                    rock = rock_dict.get(img['sample_id'])
+                    if rock is not None:
+                        img_type = img['image_type']
+                        if img_type == 'rock_specimen':
+                            rock['has_rock_specimen'] = True
+                            rock['rock_specimen_mime'] = img['mime_type']
+                            thumbnail_key = 'rock_specimen_thumbnail'
+                        elif img_type == 'outcrop':
+                            rock['has_outcrop'] = True
+                            rock['outcrop_mime'] = img['mime_type']
+                            thumbnail_key = 'outcrop_thumbnail'
+                        else:
+                            continue
+                        if img['thumbnail_data']:
+                            rock[thumbnail_key] = (bytes(img['thumbnail_data']),
+                                                   img['thumbnail_width'], img['thumbnail_height'])
+                        elif img['image_data']:
+                            missing.append((rock, thumbnail_key, img['image_id'], img['image_data']))
+        
+        if missing:
+            # Thumbnail in parallel, then store them so later exports skip the resize
+            thumbnails = make_thumbnails([image_data for _, _, _, image_data in missing])
+            stored = []
+            for (rock, thumbnail_key, image_id, _), thumbnail in zip(missing, thumbnails):
+                rock[thumbnail_key] = thumbnail
+                if isinstance(thumbnail, tuple):
+                    stored.append((*thumbnail, image_id))
+            if stored and IMAGE_THUMBNAILS_READY:
+                try:
+                    execute_many(conn,
+                        """UPDATE images SET thumbnail_data = %s, thumbnail_width = %s, thumbnail_height = %s
+                           WHERE image_id = %s""", stored)
+                except Exception as e:
+                    print(f"Error storing image thumbnails: {e}")
+    
+    return rocks
+
+# SELECTs behind the get_filtered_*_rocks helpers, up to their fixed WHERE
+# conditions; {image_columns} is ROCK_IMAGE_FLAG_COLUMNS unless images are attached
+VERIFIED_EXPORT_BASE_QUERY = """SELECT """ + EXPORT_ROCK_COLUMNS + """{image_columns},
+        CONCAT(v.first_name, ' ', v.last_name) as verified_by_name,
+        CONCAT(s.first_name, ' ', s.last_name) as submitted_by_name
+        FROM rock_samples rs
+        LEFT JOIN users v ON rs.verified_by = v.user_id
+        LEFT JOIN users s ON rs.user_id = s.user_id
+        WHERE rs.status = 'verified'"""
+PERSONNEL_ROCKS_EXPORT_QUERY = """SELECT """ + EXPORT_ROCK_COLUMNS + """{image_columns},
+        CONCAT(u.first_name, ' ', u.last_name) as student_name,
+        CONCAT(v.first_name, ' ', v.last_name) as verified_by_name
+        FROM rock_samples rs
+        JOIN users u ON rs.user_id = u.user_id
+        LEFT JOIN users v ON rs.verified_by = v.user_id
+        WHERE rs.status = 'verified'
+        AND NOT EXISTS (SELECT 1 FROM archives a WHERE a.sample_id = rs.sample_id)"""
+ADMIN_ROCKS_EXPORT_QUERY = """SELECT """ + EXPORT_ROCK_COLUMNS + """{image_columns},
+        CONCAT(u.first_name, ' ', u.last_name) as student_name,
+        u.school_id as student_id,
+        CONCAT(v.first_name, ' ', v.last_name) as verified_by_name
+        FROM rock_samples rs
+        JOIN users u ON rs.user_id = u.user_id
+        LEFT JOIN users v ON rs.verified_by = v.user_id
+        WHERE NOT EXISTS (SELECT 1 FROM archives a WHERE a.sample_id = rs.sample_id)"""
+
+# Personnel rock list page: count and page of verified, unarchived rocks, before
+# the get_personnel_filter_params predicates
+PERSONNEL_ROCK_COUNT_QUERY = """SELECT COUNT(*) AS total
+        FROM rock_samples rs
+        JOIN users u ON rs.user_id = u.user_id
+        WHERE rs.status = 'verified'
+        AND NOT EXISTS (SELECT 1 FROM archives a WHERE a.sample_id = rs.sample_id)"""
+PERSONNEL_ROCK_PAGE_QUERY = """SELECT rs.sample_id, rs.rock_id, rs.rock_type, rs.location_name,
+        rs.status, rs.created_at,
+        CONCAT(u.first_name, ' ', u.last_name) as student_name
+        FROM rock_samples rs
+        JOIN users u ON rs.user_id = u.user_id
+        WHERE rs.status = 'verified'
+        AND NOT EXISTS (SELECT 1 FROM archives a WHERE a.sample_id = rs.sample_id)"""
+
+# Personnel/admin search; name_clause comes from name_search_clause()
+ROCK_SEARCH_CLAUSE = """(rs.rock_id LIKE %s OR rs.rock_type LIKE %s 
+                                   OR rs.location_name LIKE %s OR rs.description LIKE %s
+                                   OR {name_clause}{extra})"""
+
+# Personnel rock type filter values and the rock_type they select
+PERSONNEL_ROCK_TYPES = {
+    'igneous': 'Igneous Rock',
+    'sedimentary': 'Sedimentary Rock',
+    'metamorphic': 'Metamorphic Rock'
+}
+
+# Assembled personnel/admin SQL keyed by (base query, include_image_data, clauses)
+FILTERED_ROCK_QUERIES = {}
+
+def get_filtered_rocks_query(base_query, include_image_data, clauses):
+    """
+    Get the SQL for a personnel/admin rock list with the given filters (built once per combination)
+    
+    Args:
+        base_query: PERSONNEL_ROCKS_EXPORT_QUERY or ADMIN_ROCKS_EXPORT_QUERY
+        include_image_data: True when attach_rock_images will add the images
+        clauses: Tuple of the filter predicates that apply, in parameter order
+        
+    Returns:
+        str: Complete query ordered newest first
+    """
+    key = (base_query, include_image_data, clauses)
+    query = FILTERED_ROCK_QUERIES.get(key)
+    if query is None:
+        image_columns = "" if include_image_data else ROCK_IMAGE_FLAG_COLUMNS
+        query = FILTERED_ROCK_QUERIES[key] = (base_query.format(image_columns=image_columns)
+                                              + "".join(" AND " + clause for clause in clauses)
+                                              + " ORDER BY rs.created_at DESC")
+    return query
 
 def get_filtered_verified_rocks(conn, search_query='', rock_type_filter='', location_filter='', date_from='', date_to='', include_image_data=False):
     """
@@ -852,249 +1896,94 @@ def get_filtered_verified_rocks(conn, search_query='', rock_type_filter='', loca
     Returns:
         List of rock dictionaries with image information
     """
-    # Build the base query - only verified rocks from all students
-    base_query = """SELECT rs.*, 
-        CONCAT(v.first_name, ' ', v.last_name) as verified_by_name,
-        CONCAT(s.first_name, ' ', s.last_name) as submitted_by_name
-        FROM rock_samples rs
-        LEFT JOIN users v ON rs.verified_by = v.user_id
-        LEFT JOIN users s ON rs.user_id = s.user_id
-        WHERE rs.status = 'verified'"""
-    
-    # Add WHERE conditions for filtering
-    where_conditions = []
-    params = []
-    
-    if search_query:
-        where_conditions.append("(rs.rock_index LIKE %s OR rs.rock_id LIKE %s OR rs.rock_type LIKE %s OR rs.location_name LIKE %s OR rs.description LIKE %s)")
-        search_param = f"%{search_query}%"
-        params.extend([search_param, search_param, search_param, search_param, search_param])
-    
-    if rock_type_filter:
-        where_conditions.append("rs.rock_type = %s")
-        params.append(rock_type_filter)
-    
-    if location_filter:
-        where_conditions.append("rs.location_name LIKE %s")
-        params.append(f"%{location_filter}%")
-    
-    if date_from:
-        where_conditions.append("DATE(rs.created_at) >= %s")
-        params.append(date_from)
-    
-    if date_to:
-        where_conditions.append("DATE(rs.created_at) <= %s")
-        params.append(date_to)
+    cache_key = ('verified', search_query, rock_type_filter, location_filter, date_from, date_to)
+    if not include_image_data:
+        cached = FILTERED_ROCKS_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
     
-    # Combine query with conditions
-    if where_conditions:
-        query = base_query + " AND " + " AND ".join(where_conditions) + " ORDER BY rs.created_at DESC"
-    else:
-        query = base_query + " ORDER BY rs.created_at DESC"
+    # Same filters as the browse page, with the SQL built once per combination
+    filter_values = (search_query, rock_type_filter, location_filter, date_from, date_to)
+    query_name = 'export_images' if include_image_data else 'export'
+    present, params = get_verified_filter_params(*filter_values)
     
     # Execute query to get filtered rocks
     query_params = tuple(params) if params else None
-    rocks = fetch_all(conn, query, query_params) or []
+    rocks = fetch_all(conn, get_verified_rock_queries(present)[query_name], query_params) or []
+    if not rocks and present[0]:
+        # As on the browse page, retry a FULLTEXT search that found nothing with LIKE
+        present, params = get_verified_filter_params(*filter_values, fulltext=False)
+        rocks = fetch_all(conn, get_verified_rock_queries(present)[query_name], tuple(params)) or []
     
-    # Get image information for all rocks
-    if rocks:
-        sample_ids = [rock.get('sample_id') for rock in rocks if rock.get('sample_id')]
-        if sample_ids:
-            # Initialize all rocks with image flags
-            for rock in rocks:
-                rock['has_rock_specimen'] = False
-                rock['has_outcrop'] = False
-                rock['rock_specimen_data'] = None
-                rock['outcrop_data'] = None
-                rock['rock_specimen_mime'] = None
-                rock['outcrop_mime'] = None
-            
-            if include_image_data:
-                # Fetch actual image data for Excel export
-                placeholders = ','.join(['%s'] * len(sample_ids))
-                images_query = f"""
-                    SELECT sample_id, image_type, image_data, mime_type
-                    FROM images
-                    WHERE sample_id IN ({placeholders}) 
-                    AND image_type IN ('rock_specimen', 'outcrop')
-                    ORDER BY sample_id, image_type
-                """
-                image_results = fetch_all(conn, images_query, tuple(sample_ids))
-                
-                # Store image data in rocks - create a dict for faster lookup
-                rock_dict = {rock.get('sample_id'): rock for rock in rocks}
-                
-                # Store image data in rocks
-                for img in image_results:
-                    sample_id = img.get('sample_id')
-                    img_type = img.get('image_type')
-                    if sample_id and img_type and sample_id in rock_dict:
-                        rock = rock_dict[sample_id]
-                        if img_type == 'rock_specimen':
-                            rock['has_rock_specimen'] = True
-                            rock['rock_specimen_data'] = img.get('image_data')
-                            rock['rock_specimen_mime'] = img.get('mime_type')
-                        elif img_type == 'outcrop':
-                            rock['has_outcrop'] = True
-                            rock['outcrop_data'] = img.get('image_data')
-                            rock['outcrop_mime'] = img.get('mime_type')
-            else:
-                # Just check if images exist for CSV export
-                placeholders = ','.join(['%s'] * len(sample_ids))
-                images_query = f"""
-                    SELECT sample_id, image_type
-                    FROM images
-                    WHERE sample_id IN ({placeholders}) 
-                    AND image_type IN ('rock_specimen', 'outcrop')
-                """
-                image_results = fetch_all(conn, images_query, tuple(sample_ids))
-                
-                # Create a set for quick lookup
-                image_set = set()
-                for img in image_results:
-                    sample_id = img.get('sample_id')
-                    img_type = img.get('image_type')
-                    if sample_id and img_type:
-                        image_set.add((sample_id, img_type))
-                
-                # Set flags
-                for rock in rocks:
-                    sample_id = rock.get('sample_id')
-                    if sample_id:
-                        if (sample_id, 'rock_specimen') in image_set:
-                            rock['has_rock_specimen'] = True
-                        if (sample_id, 'outcrop') in image_set:
-                            rock['has_outcrop'] = True
+    if not include_image_data:
+        FILTERED_ROCKS_CACHE.set(cache_key, rocks)
+        return rocks
     
-    return rocks
+    # Get image information for all rocks
+    return attach_rock_images(conn, rocks, include_image_data)
 
-def get_filtered_personnel_rocks(conn, search_query='', rock_type_filter='', include_image_data=False):
+def get_personnel_filter_params(search_query, rock_type_filter):
     """
-    Helper function to get filtered verified rocks for personnel based on search criteria.
-    Excludes archived rocks.
+    Work out the personnel rock list filter predicates and their parameters
     
     Args:
-        conn: Database connection
         search_query: Search text
         rock_type_filter: Rock type filter (igneous, sedimentary, metamorphic)
-        include_image_data: If True, includes actual image data for Excel export
-    
+        
     Returns:
-        List of rock dictionaries with image information
+        tuple: (tuple of predicates ANDed onto the verified, unarchived rocks, parameter list)
     """
-    # Build the base query - only verified rocks, excluding archived
-    base_query = """SELECT rs.*, 
-        CONCAT(u.first_name, ' ', u.last_name) as student_name,
-        CONCAT(v.first_name, ' ', v.last_name) as verified_by_name
-        FROM rock_samples rs
-        JOIN users u ON rs.user_id = u.user_id
-        LEFT JOIN users v ON rs.verified_by = v.user_id
-        LEFT JOIN archives a ON rs.sample_id = a.sample_id
-        WHERE rs.status = 'verified' AND a.sample_id IS NULL"""
-    
-    # Add WHERE conditions for filtering
-    where_conditions = []
+    clauses = []
     params = []
     
     if search_query:
-        where_conditions.append("""(rs.rock_id LIKE %s OR rs.rock_type LIKE %s 
-                                   OR rs.location_name LIKE %s OR rs.description LIKE %s
-                                   OR CONCAT(u.first_name, ' ', u.last_name) LIKE %s)""")
+        name_clause, name_param = name_search_clause(search_query)
+        clauses.append(ROCK_SEARCH_CLAUSE.format(name_clause=name_clause, extra=""))
         search_param = f"%{search_query}%"
-        params.extend([search_param] * 5)
+        params.extend([search_param] * 4 + [name_param])
+    
+    # Map filter values to full rock type names
+    rock_type = PERSONNEL_ROCK_TYPES.get(rock_type_filter.lower()) if rock_type_filter else None
+    if rock_type:
+        clauses.append("rs.rock_type = %s")
+        params.append(rock_type)
+    
+    return tuple(clauses), params
+
+def get_filtered_personnel_rocks(conn, search_query='', rock_type_filter='', include_image_data=False):
+    """
+    Helper function to get filtered verified rocks for personnel based on search criteria.
+    Excludes archived rocks.
+    
+    Args:
+        conn: Database connection
+        search_query: Search text
+        rock_type_filter: Rock type filter (igneous, sedimentary, metamorphic)
+        include_image_data: If True, includes actual image data for Excel export
     
-    if rock_type_filter and rock_type_filter != '':
-        # Map filter values to full rock type names
-        rock_type_map = {
-            'igneous': 'Igneous Rock',
-            'sedimentary': 'Sedimentary Rock',
-            'metamorphic': 'Metamorphic Rock'
-        }
-        if rock_type_filter.lower() in rock_type_map:
-            where_conditions.append("rs.rock_type = %s")
-            params.append(rock_type_map[rock_type_filter.lower()])
+    Returns:
+        List of rock dictionaries with image information
+    """
+    cache_key = ('personnel', search_query, rock_type_filter)
+    if not include_image_data:
+        cached = FILTERED_ROCKS_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
     
-    # Combine query with conditions
-    if where_conditions:
-        query = base_query + " AND " + " AND ".join(where_conditions) + " ORDER BY rs.created_at DESC"
-    else:
-        query = base_query + " ORDER BY rs.created_at DESC"
+    # Only verified rocks, excluding archived
+    clauses, params = get_personnel_filter_params(search_query, rock_type_filter)
+    query = get_filtered_rocks_query(PERSONNEL_ROCKS_EXPORT_QUERY, include_image_data, clauses)
     
     # Execute query to get filtered rocks
     query_params = tuple(params) if params else None
     rocks = fetch_all(conn, query, query_params) or []
     
-    # Get image information for all rocks
-    if rocks:
-        sample_ids = [rock.get('sample_id') for rock in rocks if rock.get('sample_id')]
-        if sample_ids:
-            # Initialize all rocks with image flags
-            for rock in rocks:
-                rock['has_rock_specimen'] = False
-                rock['has_outcrop'] = False
-                rock['rock_specimen_data'] = None
-                rock['outcrop_data'] = None
-                rock['rock_specimen_mime'] = None
-                rock['outcrop_mime'] = None
-            
-            if include_image_data:
-                # Fetch actual image data for Excel export
-                placeholders = ','.join(['%s'] * len(sample_ids))
-                images_query = f"""
-                    SELECT sample_id, image_type, image_data, mime_type
-                    FROM images
-                    WHERE sample_id IN ({placeholders}) 
-                    AND image_type IN ('rock_specimen', 'outcrop')
-                    ORDER BY sample_id, image_type
-                """
-                image_results = fetch_all(conn, images_query, tuple(sample_ids))
-                
-                # Store image data in rocks - create a dict for faster lookup
-                rock_dict = {rock.get('sample_id'): rock for rock in rocks}
-                
-                # Store image data in rocks
-                for img in image_results:
-                    sample_id = img.get('sample_id')
-                    img_type = img.get('image_type')
-                    if sample_id and img_type and sample_id in rock_dict:
-                        rock = rock_dict[sample_id]
-                        if img_type == 'rock_specimen':
-                            rock['has_rock_specimen'] = True
-                            rock['rock_specimen_data'] = img.get('image_data')
-                            rock['rock_specimen_mime'] = img.get('mime_type')
-                        elif img_type == 'outcrop':
-                            rock['has_outcrop'] = True
-                            rock['outcrop_data'] = img.get('image_data')
-                            rock['outcrop_mime'] = img.get('mime_type')
-            else:
-                # Just check if images exist for CSV export
-                placeholders = ','.join(['%s'] * len(sample_ids))
-                images_query = f"""
-                    SELECT sample_id, image_type
-                    FROM images
-                    WHERE sample_id IN ({placeholders}) 
-                    AND image_type IN ('rock_specimen', 'outcrop')
-                """
-                image_results = fetch_all(conn, images_query, tuple(sample_ids))
-                
-                # Create a set for quick lookup
-                image_set = set()
-                for img in image_results:
-                    sample_id = img.get('sample_id')
-                    img_type = img.get('image_type')
-                    if sample_id and img_type:
-                        image_set.add((sample_id, img_type))
-                
-                # Set flags
-                for rock in rocks:
-                    sample_id = rock.get('sample_id')
-                    if sample_id:
-                        if (sample_id, 'rock_specimen') in image_set:
-                            rock['has_rock_specimen'] = True
-                        if (sample_id, 'outcrop') in image_set:
-                            rock['has_outcrop'] = True
+    if not include_image_data:
+        FILTERED_ROCKS_CACHE.set(cache_key, rocks)
+        return rocks
     
-    return rocks
+    # Get image information for all rocks
+    return attach_rock_images(conn, rocks, include_image_data)
 
 def get_filtered_admin_rocks(conn, search_query='', rock_type_filter='', status_filter='', include_image_data=False):
     """
@@ -1112,123 +2001,46 @@ def get_filtered_admin_rocks(conn, search_query='', rock_type_filter='', status_
     Returns:
         List of rock dictionaries with image information
     """
-    # Build the base query - all rocks, excluding archived
-    base_query = """SELECT rs.*, 
-        CONCAT(u.first_name, ' ', u.last_name) as student_name,
-        u.school_id as student_id,
-        CONCAT(v.first_name, ' ', v.last_name) as verified_by_name
-        FROM rock_samples rs
-        JOIN users u ON rs.user_id = u.user_id
-        LEFT JOIN users v ON rs.verified_by = v.user_id
-        LEFT JOIN archives a ON rs.sample_id = a.sample_id
-        WHERE a.sample_id IS NULL"""
-    
-    # Add WHERE conditions for filtering
-    where_conditions = []
+    cache_key = ('admin', search_query, rock_type_filter, status_filter)
+    if not include_image_data:
+        cached = FILTERED_ROCKS_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    # All rocks, excluding archived; filter predicates in parameter order
+    clauses = []
     params = []
     
     # Add status filter
     if status_filter and status_filter.lower() in ['verified', 'pending', 'rejected']:
-        where_conditions.append("rs.status = %s")
+        clauses.append("rs.status = %s")
         params.append(status_filter.lower())
     
     if search_query:
-        where_conditions.append("""(rs.rock_id LIKE %s OR rs.rock_type LIKE %s 
-                                   OR rs.location_name LIKE %s OR rs.description LIKE %s
-                                   OR CONCAT(u.first_name, ' ', u.last_name) LIKE %s
-                                   OR u.school_id LIKE %s)""")
+        name_clause, name_param = name_search_clause(search_query)
+        clauses.append(ROCK_SEARCH_CLAUSE.format(name_clause=name_clause, extra=" OR u.school_id LIKE %s"))
         search_param = f"%{search_query}%"
-        params.extend([search_param] * 6)
+        params.extend([search_param] * 4 + [name_param, search_param])
     
-    if rock_type_filter and rock_type_filter != '':
-        where_conditions.append("rs.rock_type = %s")
+    if rock_type_filter:
+        clauses.append("rs.rock_type = %s")
         params.append(rock_type_filter)
     
-    # Combine query with conditions
-    if where_conditions:
-        query = base_query + " AND " + " AND ".join(where_conditions) + " ORDER BY rs.created_at DESC"
-    else:
-        query = base_query + " ORDER BY rs.created_at DESC"
+    query = get_filtered_rocks_query(ADMIN_ROCKS_EXPORT_QUERY, include_image_data, tuple(clauses))
     
     # Execute query to get filtered rocks
     query_params = tuple(params) if params else None
     rocks = fetch_all(conn, query, query_params) or []
     
-    # Get image information for all rocks
-    if rocks:
-        sample_ids = [rock.get('sample_id') for rock in rocks if rock.get('sample_id')]
-        if sample_ids:
-            # Initialize all rocks with image flags
-            for rock in rocks:
-                rock['has_rock_specimen'] = False
-                rock['has_outcrop'] = False
-                rock['rock_specimen_data'] = None
-                rock['outcrop_data'] = None
-                rock['rock_specimen_mime'] = None
-                rock['outcrop_mime'] = None
-            
-            if include_image_data:
-                # Fetch actual image data for Excel export
-                placeholders = ','.join(['%s'] * len(sample_ids))
-                images_query = f"""
-                    SELECT sample_id, image_type, image_data, mime_type
-                    FROM images
-                    WHERE sample_id IN ({placeholders}) 
-                    AND image_type IN ('rock_specimen', 'outcrop')
-                    ORDER BY sample_id, image_type
-                """
-                image_results = fetch_all(conn, images_query, tuple(sample_ids))
-                
-                # Store image data in rocks - create a dict for faster lookup
-                rock_dict = {rock.get('sample_id'): rock for rock in rocks}
-                
-                # Store image data in rocks
-                for img in image_results:
-                    sample_id = img.get('sample_id')
-                    img_type = img.get('image_type')
-                    if sample_id and img_type and sample_id in rock_dict:
-                        rock = rock_dict[sample_id]
-                        if img_type == 'rock_specimen':
-                            rock['has_rock_specimen'] = True
-                            rock['rock_specimen_data'] = img.get('image_data')
-                            rock['rock_specimen_mime'] = img.get('mime_type')
-                        elif img_type == 'outcrop':
-                            rock['has_outcrop'] = True
-                            rock['outcrop_data'] = img.get('image_data')
-                            rock['outcrop_mime'] = img.get('mime_type')
-            else:
-                # Just check if images exist for CSV export
-                placeholders = ','.join(['%s'] * len(sample_ids))
-                images_query = f"""
-                    SELECT sample_id, image_type
-                    FROM images
-                    WHERE sample_id IN ({placeholders}) 
-                    AND image_type IN ('rock_specimen', 'outcrop')
-                """
-                image_results = fetch_all(conn, images_query, tuple(sample_ids))
-                
-                # Create a set for quick lookup
-                image_set = set()
-                for img in image_results:
-                    sample_id = img.get('sample_id')
-                    img_type = img.get('image_type')
-                    if sample_id and img_type:
-                        image_set.add((sample_id, img_type))
-                
-                # Set flags
-                for rock in rocks:
-                    sample_id = rock.get('sample_id')
-                    if sample_id:
-                        if (sample_id, 'rock_specimen') in image_set:
-                            rock['has_rock_specimen'] = True
-                        if (sample_id, 'outcrop') in image_set:
-                            rock['has_outcrop'] = True
+    if not include_image_data:
+        FILTERED_ROCKS_CACHE.set(cache_key, rocks)
+        return rocks
     
-    return rocks
+    # Get image information for all rocks
+    return attach_rock_images(conn, rocks, include_image_data)
 
 @app.route('/student/export-rocks/csv')
-@login_required
-@role_required('student')
+@require_student
 def student_export_rocks_csv():
     """Export verified rock samples to CSV format based on current filters"""
     conn = None
@@ -1245,61 +2057,15 @@ def student_export_rocks_csv():
         # Get filtered rocks (without image data for CSV)
         rocks = get_filtered_verified_rocks(conn, search_query, rock_type_filter, location_filter, date_from, date_to, include_image_data=False)
         
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header row
-        writer.writerow([
-            'Sample Index', 'Rock ID', 'Rock Type', 'Description', 'Formation',
-            'Location Name', 'Barangay', 'Province', 'Latitude', 'Longitude',
-            'Rock Specimen Image', 'Outcrop Image',
-            'Submitted By', 'Verified By', 'Status', 'Created At', 'Updated At'
-        ])
-        
-        # Write data rows
-        for rock in rocks:
-            # Check if images exist and show "(image)" if they do
-            rock_specimen_img = '(image)' if rock.get('has_rock_specimen') else ''
-            outcrop_img = '(image)' if rock.get('has_outcrop') else ''
-            
-            writer.writerow([
-                rock.get('rock_index', ''),
-                rock.get('rock_id', ''),
-                rock.get('rock_type', ''),
-                rock.get('description', ''),
-                rock.get('formation', ''),
-                rock.get('location_name', ''),
-                rock.get('barangay', ''),
-                rock.get('province', ''),
-                rock.get('latitude', ''),
-                rock.get('longitude', ''),
-                rock_specimen_img,
-                outcrop_img,
-                rock.get('submitted_by_name', ''),
-                rock.get('verified_by_name', ''),
-                rock.get('status', ''),
-                rock.get('created_at').strftime('%Y-%m-%d %H:%M:%S') if rock.get('created_at') else '',
-                rock.get('updated_at').strftime('%Y-%m-%d %H:%M:%S') if rock.get('updated_at') else ''
-            ])
+        # CSV header row
+        header = ROCK_EXPORT_HEADERS
         
         # Prepare file for download
-        output.seek(0)
         filename = f"verified_rocks_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         
         close_connection(conn)
         
-        # Create BytesIO object for CSV
-        mem = io.BytesIO()
-        mem.write(output.getvalue().encode('utf-8'))
-        mem.seek(0)
-        
-        return send_file(
-            mem,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
-        )
+        return csv_response(header, rock_csv_rows(rocks, ('submitted_by_name', 'verified_by_name')), filename)
         
     except Exception as e:
         if conn:
@@ -1314,8 +2080,7 @@ def student_export_rocks_csv():
         return redirect(url_for('student_view_rocks'))
 
 @app.route('/student/export-rocks/excel')
-@login_required
-@role_required('student')
+@require_student
 def student_export_rocks_excel():
     """Export verified rock samples to Excel format based on current filters"""
     conn = None
@@ -1332,231 +2097,35 @@ def student_export_rocks_excel():
         # Get filtered rocks with image data for Excel export
         rocks = get_filtered_verified_rocks(conn, search_query, rock_type_filter, location_filter, date_from, date_to, include_image_data=True)
         
-        # Create Excel workbook in memory
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Verified Rock Samples"
-        
-        # Define header row (including image columns)
-        headers = [
-            'Sample Index', 'Rock ID', 'Rock Type', 'Description', 'Formation',
-            'Location Name', 'Barangay', 'Province', 'Latitude', 'Longitude',
-            'Rock Specimen Image', 'Outcrop Image',
-            'Submitted By', 'Verified By', 'Status', 'Created At', 'Updated At'
-        ]
-        
-        # Style for header row
-        header_fill = PatternFill(start_color="8B0000", end_color="8B0000", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Write header row
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = header_alignment
-        
-        # Set column widths for image columns (columns K and L) - wider for images
-        ws.column_dimensions['K'].width = 25  # Rock Specimen Image
-        ws.column_dimensions['L'].width = 25  # Outcrop Image
-        
-        # Set row height for image rows (higher to accommodate images)
-        # Row height in Excel is in points (1 point = 1/72 inch), not pixels
-        # For 150px images, we need approximately 112.5 points (150px * 0.75)
-        image_row_height = 115  # points
-        
-        # Write data rows and embed images
-        for row_num, rock in enumerate(rocks, 2):
-            # Write text data
-            ws.cell(row=row_num, column=1, value=rock.get('rock_index', ''))
-            ws.cell(row=row_num, column=2, value=rock.get('rock_id', ''))
-            ws.cell(row=row_num, column=3, value=rock.get('rock_type', ''))
-            ws.cell(row=row_num, column=4, value=rock.get('description', ''))
-            ws.cell(row=row_num, column=5, value=rock.get('formation', ''))
-            ws.cell(row=row_num, column=6, value=rock.get('location_name', ''))
-            ws.cell(row=row_num, column=7, value=rock.get('barangay', ''))
-            ws.cell(row=row_num, column=8, value=rock.get('province', ''))
-            ws.cell(row=row_num, column=9, value=rock.get('latitude', ''))
-            ws.cell(row=row_num, column=10, value=rock.get('longitude', ''))
-            
-            # Set row height for images
-            ws.row_dimensions[row_num].height = image_row_height
-            
-            # Column 11: Rock Specimen Image
-            if rock.get('rock_specimen_data'):
-                try:
-                    # Create image from bytes
-                    img_data = rock.get('rock_specimen_data')
-                    # Ensure img_data is bytes
-                    if not isinstance(img_data, bytes):
-                        if isinstance(img_data, bytearray):
-                            img_data = bytes(img_data)
-                        else:
-                            raise ValueError(f"Image data is not bytes, got {type(img_data)}")
-                    img_bytes = io.BytesIO(img_data)
-                    
-                    # Resize image while maintaining aspect ratio using PIL
-                    pil_img = PILImage.open(img_bytes)
-                    max_size = 150
-                    
-                    # Store original dimensions
-                    original_width = pil_img.width
-                    original_height = pil_img.height
-                    
-                    # Calculate new size maintaining aspect ratio
-                    if original_width > max_size or original_height > max_size:
-                        # Use LANCZOS resampling for high quality
-                        try:
-                            pil_img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
-                        except (AttributeError, TypeError):
-                            # Fallback for older PIL versions
-                            pil_img.thumbnail((max_size, max_size), PILImage.LANCZOS)
-                    
-                    # Get final dimensions after thumbnail
-                    final_width = pil_img.width
-                    final_height = pil_img.height
-                    
-                    # Save resized image to BytesIO
-                    resized_bytes = io.BytesIO()
-                    # Determine best format - preserve PNG if possible, otherwise use JPEG
-                    # OpenPyXL supports both JPEG and PNG
-                    if pil_img.mode == 'RGBA':
-                        # For RGBA, save as PNG to preserve transparency, or convert to RGB for JPEG
-                        pil_img.save(resized_bytes, format='PNG')
-                    elif pil_img.format and pil_img.format.upper() in ['PNG', 'JPEG', 'JPG']:
-                        # Preserve original format if it's PNG or JPEG
-                        pil_img.save(resized_bytes, format=pil_img.format, quality=85 if pil_img.format.upper() == 'JPEG' else None)
-                    else:
-                        # Convert other formats to JPEG
-                        if pil_img.mode not in ['RGB', 'L']:
-                            pil_img = pil_img.convert('RGB')
-                        pil_img.save(resized_bytes, format='JPEG', quality=85)
-                    resized_bytes.seek(0)
-                    
-                    # Create openpyxl image
-                    img = OpenpyxlImage(resized_bytes)
-                    # Set size - openpyxl uses pixels (approximately 96 DPI for Excel)
-                    img.width = final_width
-                    img.height = final_height
-                    
-                    # Anchor image to cell - center it in the cell
-                    img.anchor = f'K{row_num}'
-                    ws.add_image(img)
-                except Exception as e:
-                    print(f"Error adding rock specimen image for sample {rock.get('sample_id')}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    ws.cell(row=row_num, column=11, value='(image error)')
-            else:
-                ws.cell(row=row_num, column=11, value='')
-            
-            # Column 12: Outcrop Image
-            if rock.get('outcrop_data'):
-                try:
-                    # Create image from bytes
-                    img_data = rock.get('outcrop_data')
-                    # Ensure img_data is bytes
-                    if not isinstance(img_data, bytes):
-                        if isinstance(img_data, bytearray):
-                            img_data = bytes(img_data)
-                        else:
-                            raise ValueError(f"Image data is not bytes, got {type(img_data)}")
-                    img_bytes = io.BytesIO(img_data)
-                    
-                    # Resize image while maintaining aspect ratio using PIL
-                    pil_img = PILImage.open(img_bytes)
-                    max_size = 150
-                    
-                    # Store original dimensions
-                    original_width = pil_img.width
-                    original_height = pil_img.height
-                    
-                    # Calculate new size maintaining aspect ratio
-                    if original_width > max_size or original_height > max_size:
-                        # Use LANCZOS resampling for high quality
-                        try:
-                            pil_img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
-                        except (AttributeError, TypeError):
-                            # Fallback for older PIL versions
-                            pil_img.thumbnail((max_size, max_size), PILImage.LANCZOS)
-                    
-                    # Get final dimensions after thumbnail
-                    final_width = pil_img.width
-                    final_height = pil_img.height
-                    
-                    # Save resized image to BytesIO
-                    resized_bytes = io.BytesIO()
-                    # Determine best format - preserve PNG if possible, otherwise use JPEG
-                    # OpenPyXL supports both JPEG and PNG
-                    if pil_img.mode == 'RGBA':
-                        # For RGBA, save as PNG to preserve transparency, or convert to RGB for JPEG
-                        pil_img.save(resized_bytes, format='PNG')
-                    elif pil_img.format and pil_img.format.upper() in ['PNG', 'JPEG', 'JPG']:
-                        # Preserve original format if it's PNG or JPEG
-                        pil_img.save(resized_bytes, format=pil_img.format, quality=85 if pil_img.format.upper() == 'JPEG' else None)
-                    else:
-                        # Convert other formats to JPEG
-                        if pil_img.mode not in ['RGB', 'L']:
-                            pil_img = pil_img.convert('RGB')
-                        pil_img.save(resized_bytes, format='JPEG', quality=85)
-                    resized_bytes.seek(0)
-                    
-                    # Create openpyxl image
-                    img = OpenpyxlImage(resized_bytes)
-                    # Set size - openpyxl uses pixels (approximately 96 DPI for Excel)
-                    img.width = final_width
-                    img.height = final_height
-                    
-                    # Anchor image to cell - center it in the cell
-                    img.anchor = f'L{row_num}'
-                    ws.add_image(img)
-                except Exception as e:
-                    print(f"Error adding outcrop image for sample {rock.get('sample_id')}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    ws.cell(row=row_num, column=12, value='(image error)')
-            else:
-                ws.cell(row=row_num, column=12, value='')
-            
-            # Continue with remaining text columns
-            ws.cell(row=row_num, column=13, value=rock.get('submitted_by_name', ''))
-            ws.cell(row=row_num, column=14, value=rock.get('verified_by_name', ''))
-            ws.cell(row=row_num, column=15, value=rock.get('status', ''))
-            ws.cell(row=row_num, column=16, value=rock.get('created_at').strftime('%Y-%m-%d %H:%M:%S') if rock.get('created_at') else '')
-            ws.cell(row=row_num, column=17, value=rock.get('updated_at').strftime('%Y-%m-%d %H:%M:%S') if rock.get('updated_at') else '')
-        
-        # Auto-adjust column widths for text columns (skip image columns K and L)
-        for col_num in range(1, len(headers) + 1):
-            if col_num not in [11, 12]:  # Skip image columns
-                column_letter = ws.cell(row=1, column=col_num).column_letter
-                max_length = 0
-                for row in ws.iter_rows(min_row=1, max_row=min(len(rocks) + 1, 100), min_col=col_num, max_col=col_num):
-                    for cell in row:
-                        try:
-                            if cell.value and len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                adjusted_width = min(max_length + 2, 50)
-                if adjusted_width > 0:
-                    ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # Save workbook to BytesIO
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+        headers = ROCK_EXPORT_HEADERS
+        
+        def row_values(rock):
+            """Cell values for one rock; the image columns are filled in by excel_response"""
+            return [
+                rock.get('rock_index', ''),
+                rock.get('rock_id', ''),
+                rock.get('rock_type', ''),
+                rock.get('description', ''),
+                rock.get('formation', ''),
+                rock.get('location_name', ''),
+                rock.get('barangay', ''),
+                rock.get('province', ''),
+                rock.get('latitude', ''),
+                rock.get('longitude', ''),
+                None,  # Rock Specimen Image
+                None,  # Outcrop Image
+                rock.get('submitted_by_name', ''),
+                rock.get('verified_by_name', ''),
+                rock.get('status', ''),
+                rock.get('created_at_str') or '',
+                rock.get('updated_at_str') or ''
+            ]
         
         filename = f"verified_rocks_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         
         close_connection(conn)
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return excel_response("Verified Rock Samples", headers, rocks, row_values, filename)
         
     except Exception as e:
         if conn:
@@ -1571,8 +2140,7 @@ def student_export_rocks_excel():
         return redirect(url_for('student_view_rocks'))
 
 @app.route('/student/rock-detail/<int:rock_id>')
-@login_required
-@role_required('student')
+@require_student
 def student_rock_detail(rock_id):
     """View details of rock sample - students can view their own rocks (any status) or verified rocks from others"""
     conn = get_db_connection()
@@ -1581,13 +2149,23 @@ def student_rock_detail(rock_id):
     # Get rock details - allow viewing:
     # 1. Student's own rocks (any status: pending, verified, rejected)
     # 2. Other students' verified rocks only
+    # Only the columns the template shows; its images come back on the same row
+    # (uq_images_sample_type allows one of each type)
     rock = fetch_one(conn,
-        """SELECT rs.*, 
+        """SELECT rs.sample_id, rs.rock_index, rs.rock_id, rs.rock_type, rs.description, rs.formation,
+           rs.location_name, rs.barangay, rs.province, rs.latitude, rs.longitude, rs.status,
+           rs.created_at, rs.updated_at,
            CONCAT(v.first_name, ' ', v.last_name) as verified_by_name,
-           CONCAT(s.first_name, ' ', s.last_name) as submitted_by_name
+           CONCAT(s.first_name, ' ', s.last_name) as submitted_by_name,
+           spec.image_id AS rock_specimen_image_id, spec.file_name AS rock_specimen_file_name,
+           spec.file_size AS rock_specimen_file_size,
+           outc.image_id AS outcrop_image_id, outc.file_name AS outcrop_file_name,
+           outc.file_size AS outcrop_file_size
            FROM rock_samples rs
            LEFT JOIN users v ON rs.verified_by = v.user_id
            LEFT JOIN users s ON rs.user_id = s.user_id
+           LEFT JOIN images spec ON spec.sample_id = rs.sample_id AND spec.image_type = 'rock_specimen'
+           LEFT JOIN images outc ON outc.sample_id = rs.sample_id AND outc.image_type = 'outcrop'
            WHERE rs.sample_id = %s 
            AND (rs.user_id = %s OR rs.status = 'verified')""",
         (rock_id, user_id))
@@ -1600,25 +2178,24 @@ def student_rock_detail(rock_id):
         # Otherwise redirect to view rocks
         return redirect(url_for('student_view_rocks'))
     
-    # Get images for this rock sample
-    images = fetch_all(conn,
-        """SELECT image_id, image_type, file_name, file_size, mime_type, created_at
-           FROM images WHERE sample_id = %s""",
-        (rock_id,))
-    
     close_connection(conn)
+    
+    images = [{'image_id': rock[f'{image_type}_image_id'], 'image_type': image_type,
+               'file_name': rock[f'{image_type}_file_name'], 'file_size': rock[f'{image_type}_file_size']}
+              for image_type in ('rock_specimen', 'outcrop') if rock[f'{image_type}_image_id']]
     return render_template('students/rock_detail.html', rock=rock, images=images)
 
 @app.route('/student/pending-verifications')
-@login_required
-@role_required('student')
+@require_student
 def student_pending_verifications():
     """View pending verifications for student"""
     conn = get_db_connection()
     user_id = session['user_id']
     
+    # Only the columns the pending table shows
     pending = fetch_all(conn,
-        """SELECT *, DATEDIFF(NOW(), created_at) as days_pending 
+        """SELECT sample_id, rock_id, rock_type, location_name, created_at,
+                  DATEDIFF(NOW(), created_at) as days_pending 
            FROM rock_samples 
            WHERE user_id = %s AND status = 'pending'
            ORDER BY created_at DESC""",
@@ -1628,8 +2205,7 @@ def student_pending_verifications():
     return render_template('students/pending_verifications.html', pending=pending)
 
 @app.route('/student/archives')
-@login_required
-@role_required('student')
+@require_student
 def student_archives():
     """View archived rock samples for student"""
     conn = get_db_connection()
@@ -1649,8 +2225,7 @@ def student_archives():
     return render_template('students/archives.html', archives=archives)
 
 @app.route('/student/map')
-@login_required
-@role_required('student')
+@require_student
 def student_map():
     """Interactive map showing verified rock sample locations from all students"""
     conn = get_db_connection()
@@ -1665,20 +2240,51 @@ def student_map():
            WHERE rs.status = 'verified' AND rs.latitude IS NOT NULL AND rs.longitude IS NOT NULL
            ORDER BY rs.created_at DESC""")
     
-    # Get city-level statistics for verified rocks only
-    cities = fetch_all(conn,
-        """SELECT location_name, COUNT(*) as specimen_count,
-           AVG(latitude) as avg_lat, AVG(longitude) as avg_lng
-           FROM rock_samples 
-           WHERE status = 'verified' AND latitude IS NOT NULL AND longitude IS NOT NULL
-           GROUP BY location_name""")
-    
     close_connection(conn)
-    return render_template('students/map.html', rocks=rocks, cities=cities)
+    
+    # City-level statistics, aggregated from the same rows instead of a second scan
+    return render_template('students/map.html', rocks=rocks, cities=city_statistics(rocks))
+
+# Activity log date filters compare al.timestamp itself (not DATE(al.timestamp))
+# so MySQL can range-scan idx_activity_user_timestamp / idx_timestamp
+LOG_DATE_FROM_CLAUSE = "al.timestamp >= %s"
+LOG_DATE_TO_CLAUSE = "al.timestamp < %s"
+
+def parse_log_dates(date_from, date_to):
+    """
+    Turn the inclusive YYYY-MM-DD log filters into timestamp bounds
+    
+    Args:
+        date_from: First day to include, or empty
+        date_to: Last day to include, or empty
+        
+    Returns:
+        tuple: (start, end) datetimes for LOG_DATE_FROM_CLAUSE / LOG_DATE_TO_CLAUSE;
+               end is midnight after date_to. Missing or invalid dates give None.
+    """
+    def parse(value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d') if value else None
+        except ValueError:
+            return None
+    start = parse(date_from)
+    end = parse(date_to)
+    return start, end + timedelta(days=1) if end else None
+
+# Student log page SQL keyed by (date_from given, date_to given)
+STUDENT_LOG_QUERIES = {
+    (has_from, has_to): """SELECT al.*, rs.rock_id, rs.rock_type, rs.status as sample_status
+           FROM activity_logs al
+           LEFT JOIN rock_samples rs ON al.sample_id = rs.sample_id
+           WHERE al.user_id = %s"""
+        + (" AND " + LOG_DATE_FROM_CLAUSE if has_from else "")
+        + (" AND " + LOG_DATE_TO_CLAUSE if has_to else "")
+        + " ORDER BY al.timestamp DESC LIMIT 50"
+    for has_from in (False, True) for has_to in (False, True)
+}
 
 @app.route('/student/logs')
-@login_required
-@role_required('student')
+@require_student
 def student_logs():
     """View activity logs for student with filtering"""
     conn = get_db_connection()
@@ -1688,29 +2294,10 @@ def student_logs():
     date_from = request.args.get('date_from')
     date_to = request.args.get('date_to')
     
-    # Build the base query
-    base_query = """SELECT al.*, rs.rock_id, rs.rock_type, rs.status as sample_status
-           FROM activity_logs al
-           LEFT JOIN rock_samples rs ON al.sample_id = rs.sample_id
-           WHERE al.user_id = %s"""
-    
-    # Add WHERE conditions for filtering
-    where_conditions = [user_id]
-    params = [user_id]
-    
-    if date_from:
-        where_conditions.append("DATE(al.timestamp) >= %s")
-        params.append(date_from)
-    
-    if date_to:
-        where_conditions.append("DATE(al.timestamp) <= %s")
-        params.append(date_to)
-    
-    # Combine query with conditions
-    if len(where_conditions) > 1:
-        query = base_query + " AND " + " AND ".join(where_conditions[1:]) + " ORDER BY al.timestamp DESC LIMIT 50"
-    else:
-        query = base_query + " ORDER BY al.timestamp DESC LIMIT 50"
+    # Pick the prebuilt query for the filters given
+    start, end = parse_log_dates(date_from, date_to)
+    query = STUDENT_LOG_QUERIES[(start is not None, end is not None)]
+    params = [user_id] + [bound for bound in (start, end) if bound is not None]
     
     logs = fetch_all(conn, query, params)
     
@@ -1719,17 +2306,13 @@ def student_logs():
                          date_from=date_from, date_to=date_to)
 
 @app.route('/student/settings', methods=['GET', 'POST'])
-@login_required
-@role_required('student')
+@require_student
 def student_settings():
     """Student settings page"""
-    conn = get_db_connection()
     user_id = session['user_id']
     
-    # Ensure columns exist for profile photos
-    ensure_user_photo_columns(conn)
-    
     if request.method == 'POST':
+        conn = get_db_connection()
         first_name = request.form.get('first_name')
         last_name = request.form.get('last_name')
         email = request.form.get('email')
@@ -1737,7 +2320,7 @@ def student_settings():
         new_password = request.form.get('new_password')
         
         if new_password:
-            password_hash = generate_password_hash(new_password)
+            password_hash = hash_password(new_password)
             execute_query(conn,
                 """UPDATE users SET first_name = %s, last_name = %s, email = %s, 
                    school_id = %s, password_hash = %s WHERE user_id = %s""",
@@ -1747,42 +2330,31 @@ def student_settings():
                 """UPDATE users SET first_name = %s, last_name = %s, email = %s, 
                    school_id = %s WHERE user_id = %s""",
                 (first_name, last_name, email, school_id, user_id))
+        invalidate_user_cache(user_id)
+        close_connection(conn)
         
         flash('Settings updated successfully!', 'success')
         return redirect(url_for('student_settings'))
     
-    user = fetch_one(conn, "SELECT * FROM users WHERE user_id = %s", (user_id,))
-    close_connection(conn)
-    return render_template('students/settings.html', user=user)
+    # The account fields come from the per-user cache (dropped on every users UPDATE)
+    return render_template('students/settings.html', user=get_current_user())
 
 @app.route('/student/upload-photo', methods=['POST'])
-@login_required
-@role_required('student')
+@require_student
 def student_upload_photo():
     """Upload or replace student profile photo"""
     conn = get_db_connection()
     try:
-        ensure_user_photo_columns(conn)
         file = request.files.get('profile_photo')
         if not file or not file.filename:
             close_connection(conn)
             flash('Please select an image to upload', 'danger')
             return redirect(url_for('student_settings'))
-        filename = secure_filename(file.filename)
-        data = file.read()
-        if not data:
+        if not save_profile_photo(conn, session['user_id'], file):
             close_connection(conn)
             flash('Empty file uploaded', 'danger')
             return redirect(url_for('student_settings'))
-        execute_query(conn, """
-            UPDATE users
-            SET profile_image = %s,
-                profile_image_mime = %s,
-                profile_image_name = %s,
-                profile_image_size = %s,
-                updated_at = NOW()
-            WHERE user_id = %s
-        """, (data, file.content_type or 'application/octet-stream', filename, len(data), session['user_id']))
+        invalidate_user_cache(session['user_id'])
         log_activity(conn, session['user_id'], 'profile_photo_updated', 'Updated profile photo')
         close_connection(conn)
         flash('Profile photo updated', 'success')
@@ -1795,8 +2367,7 @@ def student_upload_photo():
     return redirect(url_for('student_settings'))
 
 @app.route('/student/update-profile', methods=['POST'])
-@login_required
-@role_required('student')
+@require_student
 def student_update_profile():
     """Update student profile"""
     try:
@@ -1821,6 +2392,7 @@ def student_update_profile():
         execute_query(conn,
             "UPDATE users SET first_name = %s, last_name = %s, email = %s, school_id = %s, updated_at = NOW() WHERE user_id = %s",
             (first_name, last_name, email, school_id, session['user_id']))
+        invalidate_user_cache(session['user_id'])
         
         # Update session
         session['full_name'] = f"{first_name} {last_name}"
@@ -1838,8 +2410,7 @@ def student_update_profile():
     return redirect(url_for('student_settings'))
 
 @app.route('/student/change-password', methods=['POST'])
-@login_required
-@role_required('student')
+@require_student
 def student_change_password():
     """Change student password"""
     try:
@@ -1859,16 +2430,17 @@ def student_change_password():
         # Verify current password
         user = fetch_one(conn, "SELECT password_hash FROM users WHERE user_id = %s", (session['user_id'],))
         
-        if not user or not check_password_hash(user['password_hash'], current_password):
+        if not user or not verify_password(user['password_hash'], current_password):
             flash('Current password is incorrect', 'error')
             close_connection(conn)
             return redirect(url_for('student_settings'))
         
         # Update password
-        new_hash = generate_password_hash(new_password)
+        new_hash = hash_password(new_password)
         execute_query(conn,
             "UPDATE users SET password_hash = %s, updated_at = NOW() WHERE user_id = %s",
             (new_hash, session['user_id']))
+        invalidate_user_cache(session['user_id'])
         
         log_activity(conn, session['user_id'], 'password_changed', 'Changed password')
         
@@ -1883,8 +2455,7 @@ def student_change_password():
     return redirect(url_for('student_settings'))
 
 @app.route('/student/update-notifications', methods=['POST'])
-@login_required
-@role_required('student')
+@require_student
 def student_update_notifications():
     """Update student notification preferences"""
     try:
@@ -1907,44 +2478,28 @@ def student_update_notifications():
 # ============================================================================
 
 @app.route('/personnel/settings')
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_settings():
     """Personnel settings page - view info and change password"""
-    conn = get_db_connection()
-    ensure_user_photo_columns(conn)
-    user = fetch_one(conn, "SELECT * FROM users WHERE user_id = %s", (session['user_id'],))
-    close_connection(conn)
-    return render_template('personnel/settings.html', user=user)
+    # The account fields come from the per-user cache (dropped on every users UPDATE)
+    return render_template('personnel/settings.html', user=get_current_user())
 
 @app.route('/personnel/upload-photo', methods=['POST'])
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_upload_photo():
     """Upload or replace personnel profile photo"""
     conn = get_db_connection()
     try:
-        ensure_user_photo_columns(conn)
         file = request.files.get('profile_photo')
         if not file or not file.filename:
             close_connection(conn)
             flash('Please select an image to upload', 'danger')
             return redirect(url_for('personnel_settings'))
-        filename = secure_filename(file.filename)
-        data = file.read()
-        if not data:
+        if not save_profile_photo(conn, session['user_id'], file):
             close_connection(conn)
             flash('Empty file uploaded', 'danger')
             return redirect(url_for('personnel_settings'))
-        execute_query(conn, """
-            UPDATE users
-            SET profile_image = %s,
-                profile_image_mime = %s,
-                profile_image_name = %s,
-                profile_image_size = %s,
-                updated_at = NOW()
-            WHERE user_id = %s
-        """, (data, file.content_type or 'application/octet-stream', filename, len(data), session['user_id']))
+        invalidate_user_cache(session['user_id'])
         log_activity(conn, session['user_id'], 'profile_photo_updated', 'Updated profile photo')
         close_connection(conn)
         flash('Profile photo updated', 'success')
@@ -1957,8 +2512,7 @@ def personnel_upload_photo():
     return redirect(url_for('personnel_settings'))
 
 @app.route('/personnel/change-password', methods=['POST'])
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_change_password():
     """Change personnel password"""
     try:
@@ -1975,15 +2529,16 @@ def personnel_change_password():
         
         conn = get_db_connection()
         user = fetch_one(conn, "SELECT password_hash FROM users WHERE user_id = %s", (session['user_id'],))
-        if not user or not check_password_hash(user['password_hash'], current_password):
+        if not user or not verify_password(user['password_hash'], current_password):
             flash('Current password is incorrect', 'error')
             close_connection(conn)
             return redirect(url_for('personnel_settings'))
         
-        new_hash = generate_password_hash(new_password)
+        new_hash = hash_password(new_password)
         execute_query(conn,
             "UPDATE users SET password_hash = %s, updated_at = NOW() WHERE user_id = %s",
             (new_hash, session['user_id']))
+        invalidate_user_cache(session['user_id'])
         
         log_activity(conn, session['user_id'], 'password_changed', 'Changed password')
         close_connection(conn)
@@ -1997,27 +2552,26 @@ def personnel_change_password():
     return redirect(url_for('personnel_settings'))
 
 @app.route('/personnel/dashboard')
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_dashboard():
     """Personnel dashboard with verification statistics"""
     conn = get_db_connection()
-    user_id = session['user_id']
-    
-    # Get comprehensive statistics
-    stats = fetch_one(conn,
-        """SELECT 
-            (SELECT COUNT(*) FROM rock_samples) as total_rocks,
-            (SELECT COUNT(*) FROM rock_samples WHERE status = 'pending') as pending_rocks,
-            (SELECT COUNT(*) FROM rock_samples WHERE status = 'verified') as approved_rocks,
-            (SELECT COUNT(*) FROM rock_samples WHERE status = 'rejected') as rejected_rocks,
-            (SELECT COUNT(*) FROM rock_samples WHERE verified_by = %s) as verified_by_me
-        """,
-        (user_id,))
     
-    # Get recent pending submissions for display
+    # Per-status counts in one pass over idx_status; the ROLLUP row (status NULL,
+    # status itself is NOT NULL) carries the total
+    counts = ROCK_STATS_CACHE.get('personnel_dashboard')
+    if counts is None:
+        rows = fetch_all(conn,
+            """SELECT status, COUNT(*) as count
+               FROM rock_samples
+               GROUP BY status WITH ROLLUP""") or []
+        counts = {row['status']: int(row['count']) for row in rows}
+        ROCK_STATS_CACHE.set('personnel_dashboard', counts)
+    
+    # Get recent pending submissions for display (only the columns the table shows)
     recent_pending = fetch_all(conn,
-        """SELECT rs.*, CONCAT(u.first_name, ' ', u.last_name) as student_name, u.school_id
+        """SELECT rs.sample_id, rs.rock_index, rs.rock_id, rs.rock_type, rs.location_name, rs.created_at,
+           CONCAT(u.first_name, ' ', u.last_name) as student_name, u.school_id
            FROM rock_samples rs
            JOIN users u ON rs.user_id = u.user_id
            WHERE rs.status = 'pending'
@@ -2025,33 +2579,39 @@ def personnel_dashboard():
     
     close_connection(conn)
     return render_template('personnel/dashboard.html', 
-                         total_rocks=stats['total_rocks'] or 0,
-                         pending_rocks=stats['pending_rocks'] or 0,
-                         approved_rocks=stats['approved_rocks'] or 0,
-                         rejected_rocks=stats['rejected_rocks'] or 0,
+                         total_rocks=counts.get(None, 0),
+                         pending_rocks=counts.get('pending', 0),
+                         approved_rocks=counts.get('verified', 0),
+                         rejected_rocks=counts.get('rejected', 0),
                          recent_pending=recent_pending)
 
 @app.route('/personnel/verification-panel')
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_verification_panel():
     """Verification panel for personnel to review rock samples"""
     conn = get_db_connection()
+    page = max(request.args.get('page', 1, type=int), 1)
     
+    # One page of the queue, oldest first, walking idx_rocks_status_created
+    total = fetch_one(conn, "SELECT COUNT(*) AS total FROM rock_samples WHERE status = 'pending'")['total']
+    pagination = Pagination(page, ROCKS_PER_PAGE, total)
+    # Only the columns the queue table shows
     pending_rocks = fetch_all(conn,
-        """SELECT rs.*, CONCAT(u.first_name, ' ', u.last_name) as student_name,
-           u.email as student_email, u.school_id
+        """SELECT rs.sample_id, rs.rock_id, rs.rock_type, rs.location_name, rs.created_at,
+           CONCAT(u.first_name, ' ', u.last_name) as student_name
            FROM rock_samples rs
            JOIN users u ON rs.user_id = u.user_id
            WHERE rs.status = 'pending'
-           ORDER BY rs.created_at ASC""")
+           ORDER BY rs.created_at ASC, rs.sample_id ASC
+           LIMIT %s OFFSET %s""",
+        (ROCKS_PER_PAGE, pagination.offset))
     
     close_connection(conn)
-    return render_template('personnel/verification_panel.html', pending_rocks=pending_rocks)
+    return render_template('personnel/verification_panel.html', pending_rocks=pending_rocks,
+                         pagination=pagination)
 
 @app.route('/personnel/verify-rock/<int:sample_id>', methods=['POST'])
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_verify_rock(sample_id):
     """Approve or reject a rock sample"""
     action = request.form.get('action')  # 'approve' or 'reject'
@@ -2059,137 +2619,112 @@ def personnel_verify_rock(sample_id):
     user_id = session['user_id']
     
     conn = get_db_connection()
+    try:
+        if action == 'approve':
+            # Status change and its approval log in one round-trip and one transaction
+            execute_batch(conn, [
+                ("""UPDATE rock_samples 
+                    SET status = 'verified', verified_by = %s, updated_at = CURRENT_TIMESTAMP
+                    WHERE sample_id = %s""", (user_id, sample_id)),
+                ("""INSERT INTO approval_logs (user_id, sample_id, action, remarks)
+                    VALUES (%s, %s, 'approved', %s)""", (user_id, sample_id, remarks)),
+            ])
+            invalidate_rock_caches()
+            
+            log_activity(conn, user_id, 'approved', 'Rock sample approved', sample_id)
+            
+            flash('Rock sample approved successfully!', 'success')
+        
+        elif action == 'reject':
+            execute_batch(conn, [
+                ("""UPDATE rock_samples 
+                    SET status = 'rejected', verified_by = %s, updated_at = CURRENT_TIMESTAMP
+                    WHERE sample_id = %s""", (user_id, sample_id)),
+                ("""INSERT INTO approval_logs (user_id, sample_id, action, remarks)
+                    VALUES (%s, %s, 'rejected', %s)""", (user_id, sample_id, remarks)),
+            ])
+            invalidate_rock_caches()
+            
+            log_activity(conn, user_id, 'rejected', f'Rock sample rejected: {remarks}', sample_id)
+            
+            flash('Rock sample rejected', 'warning')
     
-    if action == 'approve':
-        execute_query(conn,
-            """UPDATE rock_samples 
-               SET status = 'verified', verified_by = %s, updated_at = CURRENT_TIMESTAMP
-               WHERE sample_id = %s""",
-            (user_id, sample_id))
-        
-        execute_query(conn,
-            """INSERT INTO approval_logs (user_id, sample_id, action, remarks)
-               VALUES (%s, %s, 'approved', %s)""",
-            (user_id, sample_id, remarks))
-        
-        execute_query(conn,
-            """INSERT INTO activity_logs (user_id, sample_id, activity_type, description)
-               VALUES (%s, %s, 'approved', 'Rock sample approved')""",
-            (user_id, sample_id))
-        
-        flash('Rock sample approved successfully!', 'success')
-    
-    elif action == 'reject':
-        execute_query(conn,
-            """UPDATE rock_samples 
-               SET status = 'rejected', verified_by = %s, updated_at = CURRENT_TIMESTAMP
-               WHERE sample_id = %s""",
-            (user_id, sample_id))
-        
-        execute_query(conn,
-            """INSERT INTO approval_logs (user_id, sample_id, action, remarks)
-               VALUES (%s, %s, 'rejected', %s)""",
-            (user_id, sample_id, remarks))
-        
-        execute_query(conn,
-            """INSERT INTO activity_logs (user_id, sample_id, activity_type, description)
-               VALUES (%s, %s, 'rejected', %s)""",
-            (user_id, sample_id, f'Rock sample rejected: {remarks}'))
-        
-        flash('Rock sample rejected', 'warning')
-    
-    close_connection(conn)
+    except Exception:
+        # Neither the status change nor its log is kept
+        try:
+            rollback_transaction(conn)
+        except Exception:
+            pass
+        app.logger.exception("Error verifying rock sample %s", sample_id)
+        flash('An error occurred while updating the rock sample. Please try again.', 'danger')
+    finally:
+        close_connection(conn)
     return redirect(url_for('personnel_verification_panel'))
 
 @app.route('/personnel/rock-list')
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_rock_list():
     """View verified rock samples only with search and filtering"""
-    conn = get_db_connection()
-    
     # Get search and filter parameters
     search_query = request.args.get('search', '').strip()
     rock_type_filter = request.args.get('rock_type', '').strip()
     
-    # Use helper function to get filtered rocks
-    rocks = get_filtered_personnel_rocks(conn, search_query, rock_type_filter, include_image_data=False)
+    page = max(request.args.get('page', 1, type=int), 1)
+    
+    # Same filters as the CSV export, but only one page is read, newest first;
+    # each page and its count are cached until the next rock change
+    cache_key = ('personnel_page', search_query, rock_type_filter, page)
+    cached = FILTERED_ROCKS_CACHE.get(cache_key)
+    if cached is None:
+        clauses, params = get_personnel_filter_params(search_query, rock_type_filter)
+        where = "".join(" AND " + clause for clause in clauses)
+        conn = get_db_connection()
+        try:
+            total = fetch_one(conn, PERSONNEL_ROCK_COUNT_QUERY + where, tuple(params) or None)['total']
+            pagination = Pagination(page, ROCKS_PER_PAGE, total)
+            # Only the columns the list table shows
+            rocks = fetch_all(conn,
+                PERSONNEL_ROCK_PAGE_QUERY + where
+                + " ORDER BY rs.created_at DESC, rs.sample_id DESC LIMIT %s OFFSET %s",
+                (*params, ROCKS_PER_PAGE, pagination.offset)) or []
+        finally:
+            close_connection(conn)
+        cached = (rocks, total)
+        FILTERED_ROCKS_CACHE.set(cache_key, cached)
+    rocks, total = cached
+    pagination = Pagination(page, ROCKS_PER_PAGE, total)
+    # Active filters, carried over by the pager links
+    filter_args = {key: value for key, value in
+                   (('search', search_query), ('rock_type', rock_type_filter)) if value}
     
-    close_connection(conn)
     return render_template('personnel/rock_list_view.html', rocks=rocks, 
-                         search_query=search_query, rock_type_filter=rock_type_filter)
+                         search_query=search_query, rock_type_filter=rock_type_filter,
+                         pagination=pagination, filter_args=filter_args)
 
 @app.route('/personnel/export-rocks/csv')
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_export_rocks_csv():
     """Export verified rock samples to CSV format based on current filters"""
     conn = None
     try:
-        conn = get_db_connection()
-        
-        # Get filter parameters from request (same as rock_list)
-        search_query = request.args.get('search', '').strip()
-        rock_type_filter = request.args.get('rock_type', '').strip()
-        
-        # Get filtered rocks (without image data for CSV)
-        rocks = get_filtered_personnel_rocks(conn, search_query, rock_type_filter, include_image_data=False)
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header row
-        writer.writerow([
-            'Sample Index', 'Rock ID', 'Rock Type', 'Description', 'Formation',
-            'Location Name', 'Barangay', 'Province', 'Latitude', 'Longitude',
-            'Rock Specimen Image', 'Outcrop Image',
-            'Submitted By', 'Verified By', 'Status', 'Created At', 'Updated At'
-        ])
-        
-        # Write data rows
-        for rock in rocks:
-            # Check if images exist and show "(image)" if they do
-            rock_specimen_img = '(image)' if rock.get('has_rock_specimen') else ''
-            outcrop_img = '(image)' if rock.get('has_outcrop') else ''
-            
-            writer.writerow([
-                rock.get('rock_index', ''),
-                rock.get('rock_id', ''),
-                rock.get('rock_type', ''),
-                rock.get('description', ''),
-                rock.get('formation', ''),
-                rock.get('location_name', ''),
-                rock.get('barangay', ''),
-                rock.get('province', ''),
-                rock.get('latitude', ''),
-                rock.get('longitude', ''),
-                rock_specimen_img,
-                outcrop_img,
-                rock.get('student_name', ''),
-                rock.get('verified_by_name', ''),
-                rock.get('status', ''),
-                rock.get('created_at').strftime('%Y-%m-%d %H:%M:%S') if rock.get('created_at') else '',
-                rock.get('updated_at').strftime('%Y-%m-%d %H:%M:%S') if rock.get('updated_at') else ''
-            ])
+        conn = get_db_connection()
+        
+        # Get filter parameters from request (same as rock_list)
+        search_query = request.args.get('search', '').strip()
+        rock_type_filter = request.args.get('rock_type', '').strip()
+        
+        # Get filtered rocks (without image data for CSV)
+        rocks = get_filtered_personnel_rocks(conn, search_query, rock_type_filter, include_image_data=False)
+        
+        # CSV header row
+        header = ROCK_EXPORT_HEADERS
         
         # Prepare file for download
-        output.seek(0)
         filename = f"verified_rocks_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         
         close_connection(conn)
         
-        # Create BytesIO object for CSV
-        mem = io.BytesIO()
-        mem.write(output.getvalue().encode('utf-8'))
-        mem.seek(0)
-        
-        return send_file(
-            mem,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
-        )
+        return csv_response(header, rock_csv_rows(rocks, ('student_name', 'verified_by_name')), filename)
         
     except Exception as e:
         if conn:
@@ -2204,8 +2739,7 @@ def personnel_export_rocks_csv():
         return redirect(url_for('personnel_rock_list'))
 
 @app.route('/personnel/export-rocks/excel')
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_export_rocks_excel():
     """Export verified rock samples to Excel format based on current filters"""
     conn = None
@@ -2219,231 +2753,35 @@ def personnel_export_rocks_excel():
         # Get filtered rocks with image data for Excel export
         rocks = get_filtered_personnel_rocks(conn, search_query, rock_type_filter, include_image_data=True)
         
-        # Create Excel workbook in memory
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Verified Rock Samples"
-        
-        # Define header row (including image columns)
-        headers = [
-            'Sample Index', 'Rock ID', 'Rock Type', 'Description', 'Formation',
-            'Location Name', 'Barangay', 'Province', 'Latitude', 'Longitude',
-            'Rock Specimen Image', 'Outcrop Image',
-            'Submitted By', 'Verified By', 'Status', 'Created At', 'Updated At'
-        ]
-        
-        # Style for header row
-        header_fill = PatternFill(start_color="8B0000", end_color="8B0000", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Write header row
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = header_alignment
-        
-        # Set column widths for image columns (columns K and L) - wider for images
-        ws.column_dimensions['K'].width = 25  # Rock Specimen Image
-        ws.column_dimensions['L'].width = 25  # Outcrop Image
-        
-        # Set row height for image rows (higher to accommodate images)
-        # Row height in Excel is in points (1 point = 1/72 inch), not pixels
-        # For 150px images, we need approximately 112.5 points (150px * 0.75)
-        image_row_height = 115  # points
-        
-        # Write data rows and embed images
-        for row_num, rock in enumerate(rocks, 2):
-            # Write text data
-            ws.cell(row=row_num, column=1, value=rock.get('rock_index', ''))
-            ws.cell(row=row_num, column=2, value=rock.get('rock_id', ''))
-            ws.cell(row=row_num, column=3, value=rock.get('rock_type', ''))
-            ws.cell(row=row_num, column=4, value=rock.get('description', ''))
-            ws.cell(row=row_num, column=5, value=rock.get('formation', ''))
-            ws.cell(row=row_num, column=6, value=rock.get('location_name', ''))
-            ws.cell(row=row_num, column=7, value=rock.get('barangay', ''))
-            ws.cell(row=row_num, column=8, value=rock.get('province', ''))
-            ws.cell(row=row_num, column=9, value=rock.get('latitude', ''))
-            ws.cell(row=row_num, column=10, value=rock.get('longitude', ''))
-            
-            # Set row height for images
-            ws.row_dimensions[row_num].height = image_row_height
-            
-            # Column 11: Rock Specimen Image
-            if rock.get('rock_specimen_data'):
-                try:
-                    # Create image from bytes
-                    img_data = rock.get('rock_specimen_data')
-                    # Ensure img_data is bytes
-                    if not isinstance(img_data, bytes):
-                        if isinstance(img_data, bytearray):
-                            img_data = bytes(img_data)
-                        else:
-                            raise ValueError(f"Image data is not bytes, got {type(img_data)}")
-                    img_bytes = io.BytesIO(img_data)
-                    
-                    # Resize image while maintaining aspect ratio using PIL
-                    pil_img = PILImage.open(img_bytes)
-                    max_size = 150
-                    
-                    # Store original dimensions
-                    original_width = pil_img.width
-                    original_height = pil_img.height
-                    
-                    # Calculate new size maintaining aspect ratio
-                    if original_width > max_size or original_height > max_size:
-                        # Use LANCZOS resampling for high quality
-                        try:
-                            pil_img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
-                        except (AttributeError, TypeError):
-                            # Fallback for older PIL versions
-                            pil_img.thumbnail((max_size, max_size), PILImage.LANCZOS)
-                    
-                    # Get final dimensions after thumbnail
-                    final_width = pil_img.width
-                    final_height = pil_img.height
-                    
-                    # Save resized image to BytesIO
-                    resized_bytes = io.BytesIO()
-                    # Determine best format - preserve PNG if possible, otherwise use JPEG
-                    # OpenPyXL supports both JPEG and PNG
-                    if pil_img.mode == 'RGBA':
-                        # For RGBA, save as PNG to preserve transparency, or convert to RGB for JPEG
-                        pil_img.save(resized_bytes, format='PNG')
-                    elif pil_img.format and pil_img.format.upper() in ['PNG', 'JPEG', 'JPG']:
-                        # Preserve original format if it's PNG or JPEG
-                        pil_img.save(resized_bytes, format=pil_img.format, quality=85 if pil_img.format.upper() == 'JPEG' else None)
-                    else:
-                        # Convert other formats to JPEG
-                        if pil_img.mode not in ['RGB', 'L']:
-                            pil_img = pil_img.convert('RGB')
-                        pil_img.save(resized_bytes, format='JPEG', quality=85)
-                    resized_bytes.seek(0)
-                    
-                    # Create openpyxl image
-                    img = OpenpyxlImage(resized_bytes)
-                    # Set size - openpyxl uses pixels (approximately 96 DPI for Excel)
-                    img.width = final_width
-                    img.height = final_height
-                    
-                    # Anchor image to cell - center it in the cell
-                    img.anchor = f'K{row_num}'
-                    ws.add_image(img)
-                except Exception as e:
-                    print(f"Error adding rock specimen image for sample {rock.get('sample_id')}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    ws.cell(row=row_num, column=11, value='(image error)')
-            else:
-                ws.cell(row=row_num, column=11, value='')
-            
-            # Column 12: Outcrop Image
-            if rock.get('outcrop_data'):
-                try:
-                    # Create image from bytes
-                    img_data = rock.get('outcrop_data')
-                    # Ensure img_data is bytes
-                    if not isinstance(img_data, bytes):
-                        if isinstance(img_data, bytearray):
-                            img_data = bytes(img_data)
-                        else:
-                            raise ValueError(f"Image data is not bytes, got {type(img_data)}")
-                    img_bytes = io.BytesIO(img_data)
-                    
-                    # Resize image while maintaining aspect ratio using PIL
-                    pil_img = PILImage.open(img_bytes)
-                    max_size = 150
-                    
-                    # Store original dimensions
-                    original_width = pil_img.width
-                    original_height = pil_img.height
-                    
-                    # Calculate new size maintaining aspect ratio
-                    if original_width > max_size or original_height > max_size:
-                        # Use LANCZOS resampling for high quality
-                        try:
-                            pil_img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
-                        except (AttributeError, TypeError):
-                            # Fallback for older PIL versions
-                            pil_img.thumbnail((max_size, max_size), PILImage.LANCZOS)
-                    
-                    # Get final dimensions after thumbnail
-                    final_width = pil_img.width
-                    final_height = pil_img.height
-                    
-                    # Save resized image to BytesIO
-                    resized_bytes = io.BytesIO()
-                    # Determine best format - preserve PNG if possible, otherwise use JPEG
-                    # OpenPyXL supports both JPEG and PNG
-                    if pil_img.mode == 'RGBA':
-                        # For RGBA, save as PNG to preserve transparency, or convert to RGB for JPEG
-                        pil_img.save(resized_bytes, format='PNG')
-                    elif pil_img.format and pil_img.format.upper() in ['PNG', 'JPEG', 'JPG']:
-                        # Preserve original format if it's PNG or JPEG
-                        pil_img.save(resized_bytes, format=pil_img.format, quality=85 if pil_img.format.upper() == 'JPEG' else None)
-                    else:
-                        # Convert other formats to JPEG
-                        if pil_img.mode not in ['RGB', 'L']:
-                            pil_img = pil_img.convert('RGB')
-                        pil_img.save(resized_bytes, format='JPEG', quality=85)
-                    resized_bytes.seek(0)
-                    
-                    # Create openpyxl image
-                    img = OpenpyxlImage(resized_bytes)
-                    # Set size - openpyxl uses pixels (approximately 96 DPI for Excel)
-                    img.width = final_width
-                    img.height = final_height
-                    
-                    # Anchor image to cell - center it in the cell
-                    img.anchor = f'L{row_num}'
-                    ws.add_image(img)
-                except Exception as e:
-                    print(f"Error adding outcrop image for sample {rock.get('sample_id')}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    ws.cell(row=row_num, column=12, value='(image error)')
-            else:
-                ws.cell(row=row_num, column=12, value='')
-            
-            # Continue with remaining text columns
-            ws.cell(row=row_num, column=13, value=rock.get('student_name', ''))
-            ws.cell(row=row_num, column=14, value=rock.get('verified_by_name', ''))
-            ws.cell(row=row_num, column=15, value=rock.get('status', ''))
-            ws.cell(row=row_num, column=16, value=rock.get('created_at').strftime('%Y-%m-%d %H:%M:%S') if rock.get('created_at') else '')
-            ws.cell(row=row_num, column=17, value=rock.get('updated_at').strftime('%Y-%m-%d %H:%M:%S') if rock.get('updated_at') else '')
-        
-        # Auto-adjust column widths for text columns (skip image columns K and L)
-        for col_num in range(1, len(headers) + 1):
-            if col_num not in [11, 12]:  # Skip image columns
-                column_letter = ws.cell(row=1, column=col_num).column_letter
-                max_length = 0
-                for row in ws.iter_rows(min_row=1, max_row=min(len(rocks) + 1, 100), min_col=col_num, max_col=col_num):
-                    for cell in row:
-                        try:
-                            if cell.value and len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                adjusted_width = min(max_length + 2, 50)
-                if adjusted_width > 0:
-                    ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # Save workbook to BytesIO
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+        headers = ROCK_EXPORT_HEADERS
+        
+        def row_values(rock):
+            """Cell values for one rock; the image columns are filled in by excel_response"""
+            return [
+                rock.get('rock_index', ''),
+                rock.get('rock_id', ''),
+                rock.get('rock_type', ''),
+                rock.get('description', ''),
+                rock.get('formation', ''),
+                rock.get('location_name', ''),
+                rock.get('barangay', ''),
+                rock.get('province', ''),
+                rock.get('latitude', ''),
+                rock.get('longitude', ''),
+                None,  # Rock Specimen Image
+                None,  # Outcrop Image
+                rock.get('student_name', ''),
+                rock.get('verified_by_name', ''),
+                rock.get('status', ''),
+                rock.get('created_at_str') or '',
+                rock.get('updated_at_str') or ''
+            ]
         
         filename = f"verified_rocks_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    
+        
         close_connection(conn)
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return excel_response("Verified Rock Samples", headers, rocks, row_values, filename)
         
     except Exception as e:
         if conn:
@@ -2458,15 +2796,16 @@ def personnel_export_rocks_excel():
         return redirect(url_for('personnel_rock_list'))
 
 @app.route('/personnel/rock-detail/<int:sample_id>')
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_rock_detail(sample_id):
     """View detailed information about a rock sample"""
     conn = get_db_connection()
     
     rock = fetch_one(conn,
-        """SELECT rs.*, CONCAT(u.first_name, ' ', u.last_name) as student_name,
-           u.email as student_email, u.school_id,
+        """SELECT rs.sample_id, rs.rock_index, rs.rock_id, rs.rock_type, rs.description, rs.formation,
+           rs.location_name, rs.barangay, rs.province, rs.latitude, rs.longitude, rs.status,
+           rs.created_at, rs.updated_at,
+           CONCAT(u.first_name, ' ', u.last_name) as student_name, u.school_id,
            CONCAT(v.first_name, ' ', v.last_name) as verified_by_name
            FROM rock_samples rs
            JOIN users u ON rs.user_id = u.user_id
@@ -2492,8 +2831,7 @@ def personnel_rock_detail(sample_id):
                          images=images, approval_history=approval_history)
 
 @app.route('/personnel/archive-rock/<int:sample_id>', methods=['POST'])
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_archive_rock(sample_id):
     """Archive a rock sample"""
     reason = request.form.get('reason', '')
@@ -2505,19 +2843,16 @@ def personnel_archive_rock(sample_id):
         """INSERT INTO archives (sample_id, archived_by, archive_reason, status)
            VALUES (%s, %s, %s, 'archived')""",
         (sample_id, user_id, reason))
+    invalidate_rock_caches()
     
-    execute_query(conn,
-        """INSERT INTO activity_logs (user_id, sample_id, activity_type, description)
-           VALUES (%s, %s, 'archived', %s)""",
-        (user_id, sample_id, f'Rock sample archived: {reason}'))
+    log_activity(conn, user_id, 'archived', f'Rock sample archived: {reason}', sample_id)
     
     close_connection(conn)
     flash('Rock sample archived successfully!', 'success')
     return redirect(url_for('personnel_verification_panel'))
 
 @app.route('/personnel/archives')
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_archives():
     """View archived rock samples - only show archives created by logged-in personnel"""
     conn = get_db_connection()
@@ -2538,74 +2873,50 @@ def personnel_archives():
     return render_template('personnel/archives.html', archived_rocks=archives)
 
 @app.route('/personnel/map')
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_map():
     """Interactive map showing all rock sample locations"""
-    conn = get_db_connection()
-    
-    # Get all rock samples with coordinates
-    rocks = fetch_all(conn,
-        """SELECT rs.sample_id, rs.rock_id, rs.rock_type, rs.formation, rs.location_name, 
-           rs.latitude, rs.longitude, rs.status, rs.created_at,
-           CONCAT(u.first_name, ' ', u.last_name) as student_name
-           FROM rock_samples rs
-           JOIN users u ON rs.user_id = u.user_id
-           WHERE rs.latitude IS NOT NULL AND rs.longitude IS NOT NULL
-           ORDER BY rs.created_at DESC""")
-    
-    # Get city-level statistics
-    cities = fetch_all(conn,
-        """SELECT location_name, COUNT(*) as specimen_count,
-           AVG(latitude) as avg_lat, AVG(longitude) as avg_lng
-           FROM rock_samples 
-           WHERE latitude IS NOT NULL AND longitude IS NOT NULL
-           GROUP BY location_name""")
+    cached = ROCK_STATS_CACHE.get('personnel_map')
+    if cached is None:
+        conn = get_db_connection()
+        
+        # Get all rock samples with coordinates
+        rocks = fetch_all(conn,
+            """SELECT rs.sample_id, rs.rock_id, rs.rock_type, rs.formation, rs.location_name, 
+               rs.latitude, rs.longitude, rs.status, rs.created_at,
+               CONCAT(u.first_name, ' ', u.last_name) as student_name
+               FROM rock_samples rs
+               JOIN users u ON rs.user_id = u.user_id
+               WHERE rs.latitude IS NOT NULL AND rs.longitude IS NOT NULL
+               ORDER BY rs.created_at DESC""")
+        
+        close_connection(conn)
+        
+        # City-level statistics, aggregated from the same rows instead of a second scan
+        cached = (rocks, city_statistics(rocks))
+        ROCK_STATS_CACHE.set('personnel_map', cached)
     
-    close_connection(conn)
+    rocks, cities = cached
     return render_template('personnel/map.html', rocks=rocks, cities=cities)
 
 @app.route('/personnel/add-rock', methods=['GET', 'POST'])
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_add_rock():
     """Add new rock sample (personnel adds their own rock)"""
     if request.method == 'POST':
         user_id = session['user_id']  # Personnel's ID
-        rock_index = request.form.get('rock_index')
-        rock_id = request.form.get('rock_id')
-        rock_type = request.form.get('rock_type')
-        description = request.form.get('description', '')
-        formation = request.form.get('formation', '')
-        location_name = request.form.get('location_name')
-        barangay = request.form.get('barangay') or None
-        province = request.form.get('province') or None
-        
-        # Handle optional latitude/longitude
-        latitude_str = (request.form.get('latitude', '') or '').strip()
-        longitude_str = (request.form.get('longitude', '') or '').strip()
-
-        if not latitude_str or not longitude_str:
-            flash('Latitude and longitude are required.', 'danger')
-            return redirect(url_for('personnel_add_rock'))
-        try:
-            latitude = float(latitude_str)
-            longitude = float(longitude_str)
-        except ValueError:
-            flash('Latitude and longitude must be numeric values.', 'danger')
-            return redirect(url_for('personnel_add_rock'))
-
-        if latitude < -90 or latitude > 90:
-            flash('Latitude must be between -90 and 90 degrees.', 'danger')
-            return redirect(url_for('personnel_add_rock'))
-        if longitude < -180 or longitude > 180:
-            flash('Longitude must be between -180 and 180 degrees.', 'danger')
+        fields, error = parse_rock_form(request.form)
+        if error:
+            flash(error, 'danger')
             return redirect(url_for('personnel_add_rock'))
+        rock_id = fields['rock_id']
+        rock_type = fields['rock_type']
         
         rock_specimen = request.files.get('rock_specimen')
         outcrop_image = request.files.get('outcrop_image')
         
-        conn = get_db_connection()
+        # Uploaded images are streamed, which needs the pure-Python driver
+        conn = get_blob_connection()
         try:
             ensure_rock_location_columns(conn)
             # Insert rock sample - personnel rocks are auto-verified
@@ -2614,40 +2925,18 @@ def personnel_add_rock():
                    description, formation, location_name, barangay, province, latitude, longitude, 
                    status, verified_by, created_at)
                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'verified', %s, NOW())""",
-                (user_id, rock_index, rock_id, rock_type, description, formation, 
-                 location_name, barangay, province, latitude, longitude, user_id))
+                (user_id, fields['rock_index'], rock_id, rock_type, fields['description'], fields['formation'],
+                 fields['location_name'], fields['barangay'], fields['province'],
+                 fields['latitude'], fields['longitude'], user_id))
+            invalidate_rock_caches()
             
             # Insert rock specimen image (ensure only one image of this type)
             if rock_specimen and rock_specimen.filename:
-                # Delete any existing rock_specimen images for this sample (safety check)
-                execute_query(conn,
-                    """DELETE FROM images 
-                       WHERE sample_id = %s AND image_type = 'rock_specimen'""",
-                    (sample_id,))
-                rock_specimen_data = rock_specimen.read()
-                if rock_specimen_data:
-                    execute_query(conn,
-                        """INSERT INTO images (sample_id, image_type, image_data, file_name, 
-                           file_size, mime_type, created_at)
-                           VALUES (%s, 'rock_specimen', %s, %s, %s, %s, NOW())""",
-                        (sample_id, rock_specimen_data, rock_specimen.filename,
-                             len(rock_specimen_data), rock_specimen.content_type or 'application/octet-stream'))
+                save_rock_image(conn, sample_id, 'rock_specimen', rock_specimen)
             
             # Insert outcrop image (ensure only one image of this type)
             if outcrop_image and outcrop_image.filename:
-                # Delete any existing outcrop images for this sample (safety check)
-                execute_query(conn,
-                    """DELETE FROM images 
-                       WHERE sample_id = %s AND image_type = 'outcrop'""",
-                    (sample_id,))
-                outcrop_image_data = outcrop_image.read()
-                if outcrop_image_data:
-                    execute_query(conn,
-                        """INSERT INTO images (sample_id, image_type, image_data, file_name, 
-                           file_size, mime_type, created_at)
-                           VALUES (%s, 'outcrop', %s, %s, %s, %s, NOW())""",
-                        (sample_id, outcrop_image_data, outcrop_image.filename,
-                             len(outcrop_image_data), outcrop_image.content_type or 'application/octet-stream'))
+                save_rock_image(conn, sample_id, 'outcrop', outcrop_image)
             
             # Log activity
             log_activity(conn, session['user_id'], 'submitted', 
@@ -2663,52 +2952,22 @@ def personnel_add_rock():
     return render_template('personnel/add_rock.html')
 
 @app.route('/personnel/edit-rock/<int:sample_id>', methods=['GET', 'POST'])
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_edit_rock(sample_id):
     """Edit a rock sample"""
-    conn = get_db_connection()
+    # Uploaded images are streamed, which needs the pure-Python driver
+    conn = get_blob_connection() if request.method == 'POST' else get_db_connection()
     ensure_rock_location_columns(conn)
     
     if request.method == 'POST':
         try:
-            # Get form data
-            rock_id = request.form.get('rock_id', '').strip()
-            rock_type = request.form.get('rock_type', '').strip()
-            description = request.form.get('description', '').strip()
-            location_name = request.form.get('location_name', '').strip()
-            barangay = request.form.get('barangay', '').strip() or None
-            province = request.form.get('province', '').strip() or None
-            latitude_str = (request.form.get('latitude', '') or '').strip()
-            longitude_str = (request.form.get('longitude', '') or '').strip()
-            formation = request.form.get('formation', '').strip()
-            rock_index = request.form.get('rock_index', '').strip()
-
-            if not latitude_str or not longitude_str:
-                close_connection(conn)
-                flash('Latitude and longitude are required.', 'error')
-                return redirect(url_for('personnel_edit_rock', sample_id=sample_id))
-            try:
-                latitude = float(latitude_str)
-                longitude = float(longitude_str)
-            except ValueError:
-                close_connection(conn)
-                flash('Latitude and longitude must be numeric values.', 'error')
-                return redirect(url_for('personnel_edit_rock', sample_id=sample_id))
-
-            if latitude < -90 or latitude > 90:
-                close_connection(conn)
-                flash('Latitude must be between -90 and 90 degrees.', 'error')
-                return redirect(url_for('personnel_edit_rock', sample_id=sample_id))
-            if longitude < -180 or longitude > 180:
+            fields, error = parse_rock_form(request.form)
+            if error:
                 close_connection(conn)
-                flash('Longitude must be between -180 and 180 degrees.', 'error')
-                return redirect(url_for('personnel_edit_rock', sample_id=sample_id))
-            
-            # Validate required fields
-            if not rock_id or not rock_type or not location_name:
-                flash('Rock ID, Rock Type, and Location are required!', 'error')
+                flash(error, 'error')
                 return redirect(url_for('personnel_edit_rock', sample_id=sample_id))
+            rock_id = fields['rock_id']
+            rock_type = fields['rock_type']
             
             # Update the rock sample
             execute_query(conn,
@@ -2718,57 +2977,26 @@ def personnel_edit_rock(sample_id):
                    formation = %s, rock_index = %s,
                    updated_at = NOW()
                    WHERE sample_id = %s""",
-                (rock_id, rock_type, description, location_name, barangay, province, latitude, longitude,
-                 formation, rock_index, sample_id))
+                (rock_id, rock_type, fields['description'], fields['location_name'], fields['barangay'],
+                 fields['province'], fields['latitude'], fields['longitude'],
+                 fields['formation'], fields['rock_index'], sample_id))
+            invalidate_rock_caches()
             
             # Handle image removals
-            remove_ids = request.form.getlist('remove_images')
-            if remove_ids:
-                for image_id in remove_ids:
-                    if image_id.isdigit():
-                        execute_query(conn,
-                            "DELETE FROM images WHERE image_id = %s AND sample_id = %s",
-                            (int(image_id), sample_id))
-
-            # Handle new uploads - delete existing images of same type first to ensure only one
+            remove_rock_images(conn, sample_id, request.form.getlist('remove_images'))
+
+            # Handle new uploads - each replaces any existing image of the same type
             rock_specimen_file = request.files.get('rock_specimen')
             if rock_specimen_file and rock_specimen_file.filename:
-                # Delete existing rock_specimen image before inserting new one
-                execute_query(conn,
-                    """DELETE FROM images 
-                       WHERE sample_id = %s AND image_type = 'rock_specimen'""",
-                    (sample_id,))
-                specimen_data = rock_specimen_file.read()
-                if specimen_data:
-                    execute_query(conn,
-                        """INSERT INTO images (sample_id, image_type, image_data, file_name,
-                           file_size, mime_type, created_at)
-                           VALUES (%s, 'rock_specimen', %s, %s, %s, %s, NOW())""",
-                        (sample_id, specimen_data, rock_specimen_file.filename,
-                         len(specimen_data), rock_specimen_file.content_type or 'application/octet-stream'))
+                save_rock_image(conn, sample_id, 'rock_specimen', rock_specimen_file)
 
             outcrop_file = request.files.get('outcrop_image')
             if outcrop_file and outcrop_file.filename:
-                # Delete existing outcrop image before inserting new one
-                execute_query(conn,
-                    """DELETE FROM images 
-                       WHERE sample_id = %s AND image_type = 'outcrop'""",
-                    (sample_id,))
-                outcrop_data = outcrop_file.read()
-                if outcrop_data:
-                    execute_query(conn,
-                        """INSERT INTO images (sample_id, image_type, image_data, file_name,
-                           file_size, mime_type, created_at)
-                           VALUES (%s, 'outcrop', %s, %s, %s, %s, NOW())""",
-                        (sample_id, outcrop_data, outcrop_file.filename,
-                         len(outcrop_data), outcrop_file.content_type or 'application/octet-stream'))
+                save_rock_image(conn, sample_id, 'outcrop', outcrop_file)
             
             # Log the edit activity
             user_id = session['user_id']
-            execute_query(conn,
-                """INSERT INTO activity_logs (user_id, sample_id, activity_type, description)
-                   VALUES (%s, %s, 'edited', %s)""",
-                (user_id, sample_id, f'Rock sample edited by personnel: {rock_id}'))
+            log_activity(conn, user_id, 'edited', f'Rock sample edited by personnel: {rock_id}', sample_id)
             
             close_connection(conn)
             flash('Rock sample updated successfully!', 'success')
@@ -2781,10 +3009,12 @@ def personnel_edit_rock(sample_id):
             return redirect(url_for('personnel_edit_rock', sample_id=sample_id))
     
     else:
-        # GET request - show edit form
+        # GET request - show edit form (only the fields the form shows)
         rock = fetch_one(conn,
-            """SELECT rs.*, CONCAT(u.first_name, ' ', u.last_name) as student_name,
-               u.email as student_email, u.school_id
+            """SELECT rs.sample_id, rs.rock_index, rs.rock_id, rs.rock_type, rs.description, rs.formation,
+               rs.location_name, rs.barangay, rs.province, rs.latitude, rs.longitude,
+               rs.status, rs.created_at,
+               CONCAT(u.first_name, ' ', u.last_name) as student_name, u.school_id
                FROM rock_samples rs
                JOIN users u ON rs.user_id = u.user_id
                WHERE rs.sample_id = %s""",
@@ -2807,8 +3037,7 @@ def personnel_edit_rock(sample_id):
         return render_template('personnel/edit_rock.html', rock=rock, images=images)
 
 @app.route('/personnel/activity-logs')
-@login_required
-@role_required('personnel')
+@require_personnel
 def personnel_activity_logs():
     """View activity logs with filtering - only show activities performed by logged-in personnel"""
     conn = get_db_connection()
@@ -2830,13 +3059,14 @@ def personnel_activity_logs():
     where_conditions = ["al.user_id = %s"]
     params = [user_id]
     
-    if date_from:
-        where_conditions.append("DATE(al.timestamp) >= %s")
-        params.append(date_from)
+    start, end = parse_log_dates(date_from, date_to)
+    if start:
+        where_conditions.append(LOG_DATE_FROM_CLAUSE)
+        params.append(start)
     
-    if date_to:
-        where_conditions.append("DATE(al.timestamp) <= %s")
-        params.append(date_to)
+    if end:
+        where_conditions.append(LOG_DATE_TO_CLAUSE)
+        params.append(end)
     
     # Combine query with conditions
     query = base_query + " AND " + " AND ".join(where_conditions[1:]) + " ORDER BY al.timestamp DESC LIMIT 100" if len(where_conditions) > 1 else base_query + " ORDER BY al.timestamp DESC LIMIT 100"
@@ -2854,8 +3084,7 @@ def personnel_activity_logs():
 # ============================================================================
 
 @app.route('/admin/dashboard')
-@login_required
-@role_required('admin')
+@require_admin
 def admin_dashboard():
     """Admin dashboard with system statistics"""
     conn = get_db_connection()
@@ -2893,8 +3122,7 @@ def admin_dashboard():
     return render_template('admin/dashboard.html', stats=stats, recent_activity=recent_activity, all_rocks=all_rocks)
 
 @app.route('/admin/manage-users')
-@login_required
-@role_required('admin')
+@require_admin
 def admin_manage_users():
     """Manage all users in the system"""
     conn = get_db_connection()
@@ -2919,8 +3147,7 @@ def admin_manage_users():
     return render_template('admin/manage_users.html', users=users, role_filter=role_filter)
 
 @app.route('/admin/toggle-user/<int:user_id>', methods=['POST'])
-@login_required
-@role_required('admin')
+@require_admin
 def admin_toggle_user(user_id):
     """Activate or deactivate a user"""
     conn = get_db_connection()
@@ -2931,14 +3158,14 @@ def admin_toggle_user(user_id):
     execute_query(conn,
         "UPDATE users SET is_active = %s WHERE user_id = %s",
         (new_status, user_id))
+    invalidate_user_cache(user_id)
     
     close_connection(conn)
     flash(f'User {"activated" if new_status else "deactivated"} successfully!', 'success')
-    return redirect(url_for('admin_manage_users'))
+    return redirect(cached_url('admin_manage_users'))
 
 @app.route('/admin/delete-user/<int:user_id>', methods=['POST'])
-@login_required
-@role_required('admin')
+@require_admin
 def admin_delete_user(user_id):
     """Delete a user from the system"""
     from flask import jsonify
@@ -2958,6 +3185,7 @@ def admin_delete_user(user_id):
         execute_query(conn,
             "UPDATE users SET is_active = 0, updated_at = NOW() WHERE user_id = %s",
             (user_id,))
+        invalidate_user_cache(user_id)
         close_connection(conn)
         return jsonify({ 'success': True, 'message': 'User deactivated to preserve submitted rock records.' })
     except Exception as e:
@@ -2968,8 +3196,7 @@ def admin_delete_user(user_id):
         return jsonify({ 'success': False, 'message': f'Error deleting user: {str(e)}' }), 500
 
 @app.route('/admin/rock-list')
-@login_required
-@role_required('admin')
+@require_admin
 def admin_rock_list():
     """View all rock samples with search and filtering"""
     conn = get_db_connection()
@@ -2978,18 +3205,13 @@ def admin_rock_list():
     search_query = request.args.get('search', '').strip()
     rock_type_filter = request.args.get('rock_type', '').strip()
     
-    # Debug logging (remove in production)
-    print(f"Search query: '{search_query}', Rock type filter: '{rock_type_filter}'")
-    
-    # Build the base query
-    base_query = """SELECT rs.*, CONCAT(u.first_name, ' ', u.last_name) as student_name,
-           u.school_id as student_id,
-           CONCAT(v.first_name, ' ', v.last_name) as verified_by_name
+    # Build the base query (only the columns the list table shows)
+    base_query = """SELECT rs.sample_id, rs.rock_id, rs.rock_type, rs.location_name, rs.status, rs.created_at,
+           CONCAT(u.first_name, ' ', u.last_name) as student_name,
+           u.school_id as student_id
            FROM rock_samples rs
            JOIN users u ON rs.user_id = u.user_id
-           LEFT JOIN users v ON rs.verified_by = v.user_id
-           LEFT JOIN archives a ON rs.sample_id = a.sample_id
-           WHERE a.sample_id IS NULL"""
+           WHERE NOT EXISTS (SELECT 1 FROM archives a WHERE a.sample_id = rs.sample_id)"""
     
     # Build WHERE conditions
     where_conditions = []
@@ -2997,12 +3219,13 @@ def admin_rock_list():
     
     # Add search functionality
     if search_query:
-        where_conditions.append("""(rs.rock_id LIKE %s OR rs.rock_type LIKE %s 
+        name_clause, name_param = name_search_clause(search_query)
+        where_conditions.append(f"""(rs.rock_id LIKE %s OR rs.rock_type LIKE %s 
                                    OR rs.location_name LIKE %s OR rs.description LIKE %s
-                                   OR CONCAT(u.first_name, ' ', u.last_name) LIKE %s
+                                   OR {name_clause}
                                    OR u.school_id LIKE %s)""")
         search_param = f"%{search_query}%"
-        params.extend([search_param] * 6)  # 6 placeholders for the search
+        params.extend([search_param] * 4 + [name_param, search_param])  # 6 placeholders for the search
     
     # Add rock type filter
     if rock_type_filter and rock_type_filter != '':
@@ -3017,9 +3240,8 @@ def admin_rock_list():
     
     query += " ORDER BY rs.created_at DESC"
     
-    # Debug logging (remove in production)
-    print(f"Final query: {query}")
-    print(f"Parameters: {params}")
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug("admin_rock_list query: %s params: %s", query, params)
     
     # Execute query
     rocks = fetch_all(conn, query, params)
@@ -3029,8 +3251,7 @@ def admin_rock_list():
                           search_query=search_query, rock_type_filter=rock_type_filter)
 
 @app.route('/admin/export-rocks/csv')
-@login_required
-@role_required('admin')
+@require_admin
 def admin_export_rocks_csv():
     """Export rock samples to CSV format based on current filters and status"""
     conn = None
@@ -3045,63 +3266,16 @@ def admin_export_rocks_csv():
         # Get filtered rocks (without image data for CSV)
         rocks = get_filtered_admin_rocks(conn, search_query, rock_type_filter, status_filter, include_image_data=False)
         
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header row
-        writer.writerow([
-            'Sample Index', 'Rock ID', 'Rock Type', 'Description', 'Formation',
-            'Location Name', 'Barangay', 'Province', 'Latitude', 'Longitude',
-            'Rock Specimen Image', 'Outcrop Image',
-            'Student ID', 'Submitted By', 'Verified By', 'Status', 'Created At', 'Updated At'
-        ])
-        
-        # Write data rows
-        for rock in rocks:
-            # Check if images exist and show "(image)" if they do
-            rock_specimen_img = '(image)' if rock.get('has_rock_specimen') else ''
-            outcrop_img = '(image)' if rock.get('has_outcrop') else ''
-            
-            writer.writerow([
-                rock.get('rock_index', ''),
-                rock.get('rock_id', ''),
-                rock.get('rock_type', ''),
-                rock.get('description', ''),
-                rock.get('formation', ''),
-                rock.get('location_name', ''),
-                rock.get('barangay', ''),
-                rock.get('province', ''),
-                rock.get('latitude', ''),
-                rock.get('longitude', ''),
-                rock_specimen_img,
-                outcrop_img,
-                rock.get('student_id', ''),
-                rock.get('student_name', ''),
-                rock.get('verified_by_name', ''),
-                rock.get('status', ''),
-                rock.get('created_at').strftime('%Y-%m-%d %H:%M:%S') if rock.get('created_at') else '',
-                rock.get('updated_at').strftime('%Y-%m-%d %H:%M:%S') if rock.get('updated_at') else ''
-            ])
+        # CSV header row
+        header = ADMIN_ROCK_EXPORT_HEADERS
         
         # Prepare file for download
-        output.seek(0)
         status_suffix = f"_{status_filter}" if status_filter else "_all"
         filename = f"rock_samples{status_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         
         close_connection(conn)
         
-        # Create BytesIO object for CSV
-        mem = io.BytesIO()
-        mem.write(output.getvalue().encode('utf-8'))
-        mem.seek(0)
-        
-        return send_file(
-            mem,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
-        )
+        return csv_response(header, rock_csv_rows(rocks, ('student_id', 'student_name', 'verified_by_name')), filename)
         
     except Exception as e:
         if conn:
@@ -3116,8 +3290,7 @@ def admin_export_rocks_csv():
         return redirect(url_for('admin_rock_list'))
 
 @app.route('/admin/export-rocks/excel')
-@login_required
-@role_required('admin')
+@require_admin
 def admin_export_rocks_excel():
     """Export rock samples to Excel format based on current filters and status"""
     conn = None
@@ -3132,221 +3305,37 @@ def admin_export_rocks_excel():
         # Get filtered rocks with image data for Excel export
         rocks = get_filtered_admin_rocks(conn, search_query, rock_type_filter, status_filter, include_image_data=True)
         
-        # Create Excel workbook in memory
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Rock Samples"
-        
-        # Define header row (including image columns)
-        headers = [
-            'Sample Index', 'Rock ID', 'Rock Type', 'Description', 'Formation',
-            'Location Name', 'Barangay', 'Province', 'Latitude', 'Longitude',
-            'Rock Specimen Image', 'Outcrop Image',
-            'Student ID', 'Submitted By', 'Verified By', 'Status', 'Created At', 'Updated At'
-        ]
-        
-        # Style for header row
-        header_fill = PatternFill(start_color="8B0000", end_color="8B0000", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Write header row
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = header_alignment
-        
-        # Set column widths for image columns (columns K and L) - wider for images
-        ws.column_dimensions['K'].width = 25  # Rock Specimen Image
-        ws.column_dimensions['L'].width = 25  # Outcrop Image
-        
-        # Set row height for image rows (higher to accommodate images)
-        image_row_height = 115  # points
-        
-        # Write data rows and embed images
-        for row_num, rock in enumerate(rocks, 2):
-            # Write text data
-            ws.cell(row=row_num, column=1, value=rock.get('rock_index', ''))
-            ws.cell(row=row_num, column=2, value=rock.get('rock_id', ''))
-            ws.cell(row=row_num, column=3, value=rock.get('rock_type', ''))
-            ws.cell(row=row_num, column=4, value=rock.get('description', ''))
-            ws.cell(row=row_num, column=5, value=rock.get('formation', ''))
-            ws.cell(row=row_num, column=6, value=rock.get('location_name', ''))
-            ws.cell(row=row_num, column=7, value=rock.get('barangay', ''))
-            ws.cell(row=row_num, column=8, value=rock.get('province', ''))
-            ws.cell(row=row_num, column=9, value=rock.get('latitude', ''))
-            ws.cell(row=row_num, column=10, value=rock.get('longitude', ''))
-            
-            # Set row height for images
-            ws.row_dimensions[row_num].height = image_row_height
-            
-            # Column 11: Rock Specimen Image
-            if rock.get('rock_specimen_data'):
-                try:
-                    # Create image from bytes
-                    img_data = rock.get('rock_specimen_data')
-                    # Ensure img_data is bytes
-                    if not isinstance(img_data, bytes):
-                        if isinstance(img_data, bytearray):
-                            img_data = bytes(img_data)
-                        else:
-                            raise ValueError(f"Image data is not bytes, got {type(img_data)}")
-                    img_bytes = io.BytesIO(img_data)
-                    
-                    # Resize image while maintaining aspect ratio using PIL
-                    pil_img = PILImage.open(img_bytes)
-                    max_size = 150
-                    
-                    # Store original dimensions
-                    original_width = pil_img.width
-                    original_height = pil_img.height
-                    
-                    # Calculate new size maintaining aspect ratio
-                    if original_width > max_size or original_height > max_size:
-                        # Use LANCZOS resampling for high quality
-                        try:
-                            pil_img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
-                        except (AttributeError, TypeError):
-                            # Fallback for older PIL versions
-                            pil_img.thumbnail((max_size, max_size), PILImage.LANCZOS)
-                    
-                    # Get final dimensions after thumbnail
-                    final_width = pil_img.width
-                    final_height = pil_img.height
-                    
-                    # Save resized image to BytesIO
-                    resized_bytes = io.BytesIO()
-                    # Determine best format - preserve PNG if possible, otherwise use JPEG
-                    if pil_img.mode == 'RGBA':
-                        pil_img.save(resized_bytes, format='PNG')
-                    elif pil_img.format and pil_img.format.upper() in ['PNG', 'JPEG', 'JPG']:
-                        pil_img.save(resized_bytes, format=pil_img.format, quality=85 if pil_img.format.upper() == 'JPEG' else None)
-                    else:
-                        if pil_img.mode not in ['RGB', 'L']:
-                            pil_img = pil_img.convert('RGB')
-                        pil_img.save(resized_bytes, format='JPEG', quality=85)
-                    resized_bytes.seek(0)
-                    
-                    # Create openpyxl image
-                    img = OpenpyxlImage(resized_bytes)
-                    img.width = final_width
-                    img.height = final_height
-                    
-                    # Anchor image to cell
-                    img.anchor = f'K{row_num}'
-                    ws.add_image(img)
-                except Exception as e:
-                    print(f"Error adding rock specimen image for sample {rock.get('sample_id')}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    ws.cell(row=row_num, column=11, value='(image error)')
-            else:
-                ws.cell(row=row_num, column=11, value='')
-            
-            # Column 12: Outcrop Image
-            if rock.get('outcrop_data'):
-                try:
-                    # Create image from bytes
-                    img_data = rock.get('outcrop_data')
-                    # Ensure img_data is bytes
-                    if not isinstance(img_data, bytes):
-                        if isinstance(img_data, bytearray):
-                            img_data = bytes(img_data)
-                        else:
-                            raise ValueError(f"Image data is not bytes, got {type(img_data)}")
-                    img_bytes = io.BytesIO(img_data)
-                    
-                    # Resize image while maintaining aspect ratio using PIL
-                    pil_img = PILImage.open(img_bytes)
-                    max_size = 150
-                    
-                    # Store original dimensions
-                    original_width = pil_img.width
-                    original_height = pil_img.height
-                    
-                    # Calculate new size maintaining aspect ratio
-                    if original_width > max_size or original_height > max_size:
-                        # Use LANCZOS resampling for high quality
-                        try:
-                            pil_img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
-                        except (AttributeError, TypeError):
-                            # Fallback for older PIL versions
-                            pil_img.thumbnail((max_size, max_size), PILImage.LANCZOS)
-                    
-                    # Get final dimensions after thumbnail
-                    final_width = pil_img.width
-                    final_height = pil_img.height
-                    
-                    # Save resized image to BytesIO
-                    resized_bytes = io.BytesIO()
-                    # Determine best format - preserve PNG if possible, otherwise use JPEG
-                    if pil_img.mode == 'RGBA':
-                        pil_img.save(resized_bytes, format='PNG')
-                    elif pil_img.format and pil_img.format.upper() in ['PNG', 'JPEG', 'JPG']:
-                        pil_img.save(resized_bytes, format=pil_img.format, quality=85 if pil_img.format.upper() == 'JPEG' else None)
-                    else:
-                        if pil_img.mode not in ['RGB', 'L']:
-                            pil_img = pil_img.convert('RGB')
-                        pil_img.save(resized_bytes, format='JPEG', quality=85)
-                    resized_bytes.seek(0)
-                    
-                    # Create openpyxl image
-                    img = OpenpyxlImage(resized_bytes)
-                    img.width = final_width
-                    img.height = final_height
-                    
-                    # Anchor image to cell
-                    img.anchor = f'L{row_num}'
-                    ws.add_image(img)
-                except Exception as e:
-                    print(f"Error adding outcrop image for sample {rock.get('sample_id')}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    ws.cell(row=row_num, column=12, value='(image error)')
-            else:
-                ws.cell(row=row_num, column=12, value='')
-            
-            # Continue with remaining text columns
-            ws.cell(row=row_num, column=13, value=rock.get('student_id', ''))
-            ws.cell(row=row_num, column=14, value=rock.get('student_name', ''))
-            ws.cell(row=row_num, column=15, value=rock.get('verified_by_name', ''))
-            ws.cell(row=row_num, column=16, value=rock.get('status', ''))
-            ws.cell(row=row_num, column=17, value=rock.get('created_at').strftime('%Y-%m-%d %H:%M:%S') if rock.get('created_at') else '')
-            ws.cell(row=row_num, column=18, value=rock.get('updated_at').strftime('%Y-%m-%d %H:%M:%S') if rock.get('updated_at') else '')
-        
-        # Auto-adjust column widths for text columns (skip image columns K and L)
-        for col_num in range(1, len(headers) + 1):
-            if col_num not in [11, 12]:  # Skip image columns
-                column_letter = ws.cell(row=1, column=col_num).column_letter
-                max_length = 0
-                for row in ws.iter_rows(min_row=1, max_row=min(len(rocks) + 1, 100), min_col=col_num, max_col=col_num):
-                    for cell in row:
-                        try:
-                            if cell.value and len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                adjusted_width = min(max_length + 2, 50)
-                if adjusted_width > 0:
-                    ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # Save workbook to BytesIO
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+        headers = ADMIN_ROCK_EXPORT_HEADERS
+        
+        def row_values(rock):
+            """Cell values for one rock; the image columns are filled in by excel_response"""
+            return [
+                rock.get('rock_index', ''),
+                rock.get('rock_id', ''),
+                rock.get('rock_type', ''),
+                rock.get('description', ''),
+                rock.get('formation', ''),
+                rock.get('location_name', ''),
+                rock.get('barangay', ''),
+                rock.get('province', ''),
+                rock.get('latitude', ''),
+                rock.get('longitude', ''),
+                None,  # Rock Specimen Image
+                None,  # Outcrop Image
+                rock.get('student_id', ''),
+                rock.get('student_name', ''),
+                rock.get('verified_by_name', ''),
+                rock.get('status', ''),
+                rock.get('created_at_str') or '',
+                rock.get('updated_at_str') or ''
+            ]
         
         status_suffix = f"_{status_filter}" if status_filter else "_all"
         filename = f"rock_samples{status_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         
         close_connection(conn)
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return excel_response("Rock Samples", headers, rocks, row_values, filename)
         
     except Exception as e:
         if conn:
@@ -3361,46 +3350,23 @@ def admin_export_rocks_excel():
         return redirect(url_for('admin_rock_list'))
 
 @app.route('/admin/add-rock', methods=['GET', 'POST'])
-@login_required
-@role_required('admin')
+@require_admin
 def admin_add_rock():
     """Add new rock sample (admin adds their own rock)"""
     if request.method == 'POST':
         user_id = session['user_id']  # Admin's ID
-        rock_index = request.form.get('rock_index')
-        rock_id = request.form.get('rock_id')
-        rock_type = request.form.get('rock_type')
-        description = request.form.get('description', '')
-        formation = request.form.get('formation', '')
-        location_name = request.form.get('location_name')
-        barangay = request.form.get('barangay') or None
-        province = request.form.get('province') or None
-        
-        # Handle optional latitude/longitude
-        latitude_str = (request.form.get('latitude', '') or '').strip()
-        longitude_str = (request.form.get('longitude', '') or '').strip()
-
-        if not latitude_str or not longitude_str:
-            flash('Latitude and longitude are required.', 'danger')
-            return redirect(url_for('admin_add_rock'))
-        try:
-            latitude = float(latitude_str)
-            longitude = float(longitude_str)
-        except ValueError:
-            flash('Latitude and longitude must be numeric values.', 'danger')
-            return redirect(url_for('admin_add_rock'))
-
-        if latitude < -90 or latitude > 90:
-            flash('Latitude must be between -90 and 90 degrees.', 'danger')
-            return redirect(url_for('admin_add_rock'))
-        if longitude < -180 or longitude > 180:
-            flash('Longitude must be between -180 and 180 degrees.', 'danger')
+        fields, error = parse_rock_form(request.form)
+        if error:
+            flash(error, 'danger')
             return redirect(url_for('admin_add_rock'))
+        rock_id = fields['rock_id']
+        rock_type = fields['rock_type']
         
         rock_specimen = request.files.get('rock_specimen')
         outcrop_image = request.files.get('outcrop_image')
         
-        conn = get_db_connection()
+        # Uploaded images are streamed, which needs the pure-Python driver
+        conn = get_blob_connection()
         try:
             ensure_rock_location_columns(conn)
             # Insert rock sample - admin rocks are auto-verified
@@ -3409,40 +3375,18 @@ def admin_add_rock():
                    description, formation, location_name, barangay, province, latitude, longitude, 
                    status, verified_by, created_at)
                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'verified', %s, NOW())""",
-                (user_id, rock_index, rock_id, rock_type, description, formation, 
-                 location_name, barangay, province, latitude, longitude, user_id))
+                (user_id, fields['rock_index'], rock_id, rock_type, fields['description'], fields['formation'],
+                 fields['location_name'], fields['barangay'], fields['province'],
+                 fields['latitude'], fields['longitude'], user_id))
+            invalidate_rock_caches()
             
             # Insert rock specimen image (ensure only one image of this type)
             if rock_specimen and rock_specimen.filename:
-                # Delete any existing rock_specimen images for this sample (safety check)
-                execute_query(conn,
-                    """DELETE FROM images 
-                       WHERE sample_id = %s AND image_type = 'rock_specimen'""",
-                    (sample_id,))
-                rock_specimen_data = rock_specimen.read()
-                if rock_specimen_data:
-                    execute_query(conn,
-                        """INSERT INTO images (sample_id, image_type, image_data, file_name, 
-                           file_size, mime_type, created_at)
-                           VALUES (%s, 'rock_specimen', %s, %s, %s, %s, NOW())""",
-                        (sample_id, rock_specimen_data, rock_specimen.filename,
-                             len(rock_specimen_data), rock_specimen.content_type or 'application/octet-stream'))
+                save_rock_image(conn, sample_id, 'rock_specimen', rock_specimen)
             
             # Insert outcrop image (ensure only one image of this type)
             if outcrop_image and outcrop_image.filename:
-                # Delete any existing outcrop images for this sample (safety check)
-                execute_query(conn,
-                    """DELETE FROM images 
-                       WHERE sample_id = %s AND image_type = 'outcrop'""",
-                    (sample_id,))
-                outcrop_image_data = outcrop_image.read()
-                if outcrop_image_data:
-                    execute_query(conn,
-                        """INSERT INTO images (sample_id, image_type, image_data, file_name, 
-                           file_size, mime_type, created_at)
-                           VALUES (%s, 'outcrop', %s, %s, %s, %s, NOW())""",
-                        (sample_id, outcrop_image_data, outcrop_image.filename,
-                             len(outcrop_image_data), outcrop_image.content_type or 'application/octet-stream'))
+                save_rock_image(conn, sample_id, 'outcrop', outcrop_image)
             
             # Log activity
             log_activity(conn, session['user_id'], 'submitted', 
@@ -3458,15 +3402,16 @@ def admin_add_rock():
     return render_template('admin/add_rock.html')
 
 @app.route('/admin/rock-detail/<int:sample_id>')
-@login_required
-@role_required('admin')
+@require_admin
 def admin_rock_detail(sample_id):
     """View detailed information about a rock sample"""
     conn = get_db_connection()
     
     rock = fetch_one(conn,
-        """SELECT rs.*, CONCAT(u.first_name, ' ', u.last_name) as student_name,
-           u.email as student_email, u.school_id,
+        """SELECT rs.sample_id, rs.rock_index, rs.rock_id, rs.rock_type, rs.description, rs.formation,
+           rs.location_name, rs.barangay, rs.province, rs.latitude, rs.longitude, rs.status,
+           rs.created_at, rs.updated_at,
+           CONCAT(u.first_name, ' ', u.last_name) as student_name, u.school_id,
            CONCAT(v.first_name, ' ', v.last_name) as verified_by_name
            FROM rock_samples rs
            JOIN users u ON rs.user_id = u.user_id
@@ -3492,52 +3437,22 @@ def admin_rock_detail(sample_id):
                          images=images, approval_history=approval_history)
 
 @app.route('/admin/edit-rock/<int:sample_id>', methods=['GET', 'POST'])
-@login_required
-@role_required('admin')
+@require_admin
 def admin_edit_rock(sample_id):
     """Edit a rock sample"""
-    conn = get_db_connection()
+    # Uploaded images are streamed, which needs the pure-Python driver
+    conn = get_blob_connection() if request.method == 'POST' else get_db_connection()
     ensure_rock_location_columns(conn)
     
     if request.method == 'POST':
         try:
-            # Get form data
-            rock_id = request.form.get('rock_id', '').strip()
-            rock_type = request.form.get('rock_type', '').strip()
-            description = request.form.get('description', '').strip()
-            location_name = request.form.get('location_name', '').strip()
-            barangay = request.form.get('barangay', '').strip() or None
-            province = request.form.get('province', '').strip() or None
-            latitude_str = (request.form.get('latitude', '') or '').strip()
-            longitude_str = (request.form.get('longitude', '') or '').strip()
-            formation = request.form.get('formation', '').strip()
-            rock_index = request.form.get('rock_index', '').strip()
-
-            if not latitude_str or not longitude_str:
-                close_connection(conn)
-                flash('Latitude and longitude are required.', 'error')
-                return redirect(url_for('admin_edit_rock', sample_id=sample_id))
-            try:
-                latitude = float(latitude_str)
-                longitude = float(longitude_str)
-            except ValueError:
-                close_connection(conn)
-                flash('Latitude and longitude must be numeric values.', 'error')
-                return redirect(url_for('admin_edit_rock', sample_id=sample_id))
-
-            if latitude < -90 or latitude > 90:
-                close_connection(conn)
-                flash('Latitude must be between -90 and 90 degrees.', 'error')
-                return redirect(url_for('admin_edit_rock', sample_id=sample_id))
-            if longitude < -180 or longitude > 180:
+            fields, error = parse_rock_form(request.form)
+            if error:
                 close_connection(conn)
-                flash('Longitude must be between -180 and 180 degrees.', 'error')
-                return redirect(url_for('admin_edit_rock', sample_id=sample_id))
-            
-            # Validate required fields
-            if not rock_id or not rock_type or not location_name:
-                flash('Rock ID, Rock Type, and Location are required!', 'error')
+                flash(error, 'error')
                 return redirect(url_for('admin_edit_rock', sample_id=sample_id))
+            rock_id = fields['rock_id']
+            rock_type = fields['rock_type']
             
             # Update the rock sample
             execute_query(conn,
@@ -3547,57 +3462,26 @@ def admin_edit_rock(sample_id):
                    formation = %s, rock_index = %s,
                    updated_at = NOW()
                    WHERE sample_id = %s""",
-                (rock_id, rock_type, description, location_name, barangay, province, latitude, longitude,
-                 formation, rock_index, sample_id))
+                (rock_id, rock_type, fields['description'], fields['location_name'], fields['barangay'],
+                 fields['province'], fields['latitude'], fields['longitude'],
+                 fields['formation'], fields['rock_index'], sample_id))
+            invalidate_rock_caches()
             
             # Handle image removals
-            remove_ids = request.form.getlist('remove_images')
-            if remove_ids:
-                for image_id in remove_ids:
-                    if image_id.isdigit():
-                        execute_query(conn,
-                            "DELETE FROM images WHERE image_id = %s AND sample_id = %s",
-                            (int(image_id), sample_id))
-
-            # Handle new uploads - delete existing images of same type first to ensure only one
+            remove_rock_images(conn, sample_id, request.form.getlist('remove_images'))
+
+            # Handle new uploads - each replaces any existing image of the same type
             rock_specimen_file = request.files.get('rock_specimen')
             if rock_specimen_file and rock_specimen_file.filename:
-                # Delete existing rock_specimen image before inserting new one
-                execute_query(conn,
-                    """DELETE FROM images 
-                       WHERE sample_id = %s AND image_type = 'rock_specimen'""",
-                    (sample_id,))
-                specimen_data = rock_specimen_file.read()
-                if specimen_data:
-                    execute_query(conn,
-                        """INSERT INTO images (sample_id, image_type, image_data, file_name,
-                           file_size, mime_type, created_at)
-                           VALUES (%s, 'rock_specimen', %s, %s, %s, %s, NOW())""",
-                        (sample_id, specimen_data, rock_specimen_file.filename,
-                         len(specimen_data), rock_specimen_file.content_type or 'application/octet-stream'))
+                save_rock_image(conn, sample_id, 'rock_specimen', rock_specimen_file)
 
             outcrop_file = request.files.get('outcrop_image')
             if outcrop_file and outcrop_file.filename:
-                # Delete existing outcrop image before inserting new one
-                execute_query(conn,
-                    """DELETE FROM images 
-                       WHERE sample_id = %s AND image_type = 'outcrop'""",
-                    (sample_id,))
-                outcrop_data = outcrop_file.read()
-                if outcrop_data:
-                    execute_query(conn,
-                        """INSERT INTO images (sample_id, image_type, image_data, file_name,
-                           file_size, mime_type, created_at)
-                           VALUES (%s, 'outcrop', %s, %s, %s, %s, NOW())""",
-                        (sample_id, outcrop_data, outcrop_file.filename,
-                         len(outcrop_data), outcrop_file.content_type or 'application/octet-stream'))
+                save_rock_image(conn, sample_id, 'outcrop', outcrop_file)
             
             # Log the edit activity
             user_id = session['user_id']
-            execute_query(conn,
-                """INSERT INTO activity_logs (user_id, sample_id, activity_type, description)
-                   VALUES (%s, %s, 'edited', %s)""",
-                (user_id, sample_id, f'Rock sample edited by admin: {rock_id}'))
+            log_activity(conn, user_id, 'edited', f'Rock sample edited by admin: {rock_id}', sample_id)
             
             close_connection(conn)
             flash('Rock sample updated successfully!', 'success')
@@ -3610,10 +3494,12 @@ def admin_edit_rock(sample_id):
             return redirect(url_for('admin_edit_rock', sample_id=sample_id))
     
     else:
-        # GET request - show edit form
+        # GET request - show edit form (only the fields the form shows)
         rock = fetch_one(conn,
-            """SELECT rs.*, CONCAT(u.first_name, ' ', u.last_name) as student_name,
-               u.email as student_email, u.school_id
+            """SELECT rs.sample_id, rs.rock_index, rs.rock_id, rs.rock_type, rs.description, rs.formation,
+               rs.location_name, rs.barangay, rs.province, rs.latitude, rs.longitude,
+               rs.status, rs.created_at,
+               CONCAT(u.first_name, ' ', u.last_name) as student_name, u.school_id
                FROM rock_samples rs
                JOIN users u ON rs.user_id = u.user_id
                WHERE rs.sample_id = %s""",
@@ -3636,8 +3522,7 @@ def admin_edit_rock(sample_id):
         return render_template('admin/edit_rock.html', rock=rock, images=images)
 
 @app.route('/admin/archive-rock/<int:sample_id>', methods=['POST'])
-@login_required
-@role_required('admin')
+@require_admin
 def admin_archive_rock(sample_id):
     """Archive a rock sample"""
     conn = None
@@ -3666,12 +3551,10 @@ def admin_archive_rock(sample_id):
             """INSERT INTO archives (sample_id, archived_by, archive_reason, status)
                VALUES (%s, %s, %s, 'archived')""",
             (sample_id, user_id, reason))
+        invalidate_rock_caches()
         
         # Log the activity
-        activity_id = execute_query(conn,
-            """INSERT INTO activity_logs (user_id, sample_id, activity_type, description)
-               VALUES (%s, %s, 'archived', %s)""",
-            (user_id, sample_id, f'Rock sample archived by admin: {reason}'))
+        log_activity(conn, user_id, 'archived', f'Rock sample archived by admin: {reason}', sample_id)
         
         close_connection(conn)
         flash('Rock sample archived successfully!', 'success')
@@ -3689,8 +3572,7 @@ def admin_archive_rock(sample_id):
     return redirect(url_for('admin_rock_list'))
 
 @app.route('/admin/archives')
-@login_required
-@role_required('admin')
+@require_admin
 def admin_archives():
     """View all archived rock samples"""
     conn = get_db_connection()
@@ -3709,8 +3591,7 @@ def admin_archives():
     return render_template('admin/archives.html', archives=archives)
 
 @app.route('/admin/unarchive/<int:sample_id>', methods=['POST'])
-@login_required
-@role_required('admin')
+@require_admin
 def admin_unarchive_rock(sample_id):
     """Unarchive a rock sample"""
     conn = None
@@ -3737,12 +3618,10 @@ def admin_unarchive_rock(sample_id):
         execute_query(conn,
             "DELETE FROM archives WHERE sample_id = %s",
             (sample_id,))
+        invalidate_rock_caches()
         
         # Log the activity
-        execute_query(conn,
-            """INSERT INTO activity_logs (user_id, sample_id, activity_type, description)
-               VALUES (%s, %s, 'edited', %s)""",
-            (user_id, sample_id, f'Rock sample unarchived by admin'))
+        log_activity(conn, user_id, 'edited', 'Rock sample unarchived by admin', sample_id)
         
         close_connection(conn)
         flash('Rock sample unarchived successfully!', 'success')
@@ -3760,8 +3639,7 @@ def admin_unarchive_rock(sample_id):
     return redirect(url_for('admin_archives'))
 
 @app.route('/admin/map')
-@login_required
-@role_required('admin')
+@require_admin
 def admin_map():
     """Interactive map showing all rock sample locations"""
     conn = get_db_connection()
@@ -3788,8 +3666,7 @@ def admin_map():
     return render_template('admin/map.html', rocks=rocks, cities=cities)
 
 @app.route('/admin/activity-logs')
-@login_required
-@role_required('admin')
+@require_admin
 def admin_activity_logs():
     """View all activity logs with filtering"""
     conn = get_db_connection()
@@ -3822,13 +3699,14 @@ def admin_activity_logs():
         params.append(action_filter)
     
     # Add date filters
-    if date_from:
-        where_conditions.append("DATE(al.timestamp) >= %s")
-        params.append(date_from)
+    start, end = parse_log_dates(date_from, date_to)
+    if start:
+        where_conditions.append(LOG_DATE_FROM_CLAUSE)
+        params.append(start)
     
-    if date_to:
-        where_conditions.append("DATE(al.timestamp) <= %s")
-        params.append(date_to)
+    if end:
+        where_conditions.append(LOG_DATE_TO_CLAUSE)
+        params.append(end)
     
     # Combine query
     if where_conditions:
@@ -3849,23 +3727,20 @@ def admin_activity_logs():
                           date_from=date_from, date_to=date_to)
 
 @app.route('/admin/settings', methods=['GET', 'POST'])
-@login_required
-@role_required('admin')
+@require_admin
 def admin_settings():
     """Admin settings page"""
-    conn = get_db_connection()
     user_id = session['user_id']
     
-    ensure_user_photo_columns(conn)
-    
     if request.method == 'POST':
+        conn = get_db_connection()
         first_name = request.form.get('first_name')
         last_name = request.form.get('last_name')
         email = request.form.get('email')
         new_password = request.form.get('new_password')
         
         if new_password:
-            password_hash = generate_password_hash(new_password)
+            password_hash = hash_password(new_password)
             execute_query(conn,
                 """UPDATE users SET first_name = %s, last_name = %s, email = %s, 
                    password_hash = %s WHERE user_id = %s""",
@@ -3875,42 +3750,31 @@ def admin_settings():
                 """UPDATE users SET first_name = %s, last_name = %s, email = %s 
                    WHERE user_id = %s""",
                 (first_name, last_name, email, user_id))
+        invalidate_user_cache(user_id)
+        close_connection(conn)
         
         flash('Settings updated successfully!', 'success')
-        return redirect(url_for('admin_settings'))
+        return redirect(cached_url('admin_settings'))
     
-    user = fetch_one(conn, "SELECT * FROM users WHERE user_id = %s", (user_id,))
-    close_connection(conn)
-    return render_template('admin/settings.html', user=user)
+    # The account fields come from the per-user cache (dropped on every users UPDATE)
+    return render_template('admin/settings.html', user=get_current_user())
 
 @app.route('/admin/upload-photo', methods=['POST'])
-@login_required
-@role_required('admin')
+@require_admin
 def admin_upload_photo():
     """Upload or replace admin profile photo"""
     conn = get_db_connection()
     try:
-        ensure_user_photo_columns(conn)
         file = request.files.get('profile_photo')
         if not file or not file.filename:
             close_connection(conn)
             flash('Please select an image to upload', 'danger')
-            return redirect(url_for('admin_settings'))
-        filename = secure_filename(file.filename)
-        data = file.read()
-        if not data:
+            return redirect(cached_url('admin_settings'))
+        if not save_profile_photo(conn, session['user_id'], file):
             close_connection(conn)
             flash('Empty file uploaded', 'danger')
-            return redirect(url_for('admin_settings'))
-        execute_query(conn, """
-            UPDATE users
-            SET profile_image = %s,
-                profile_image_mime = %s,
-                profile_image_name = %s,
-                profile_image_size = %s,
-                updated_at = NOW()
-            WHERE user_id = %s
-        """, (data, file.content_type or 'application/octet-stream', filename, len(data), session['user_id']))
+            return redirect(cached_url('admin_settings'))
+        invalidate_user_cache(session['user_id'])
         log_activity(conn, session['user_id'], 'profile_photo_updated', 'Updated profile photo')
         close_connection(conn)
         flash('Profile photo updated', 'success')
@@ -3920,82 +3784,135 @@ def admin_upload_photo():
         except Exception:
             pass
         flash(f'Error uploading photo: {str(e)}', 'danger')
-    return redirect(url_for('admin_settings'))
+    return redirect(cached_url('admin_settings'))
 
 # ============================================================================
 # IMAGE ROUTES
 # ============================================================================
 
+def blob_response(conn, etag, blob_query, params, mimetype, download_name):
+    """
+    Answer an image request with 304 if the client's copy is current, otherwise
+    read the BLOB and send it. Closes conn.
+    
+    Args:
+        conn: Database connection, already used for the metadata query
+        etag: ETag built from that metadata (changes whenever the BLOB does)
+        blob_query: SQL selecting the BLOB as its only column
+        params: Parameters for blob_query
+        mimetype: Content type of the BLOB
+        download_name: File name for the response
+        
+    Returns:
+        Response, or None if the BLOB is gone
+    """
+    if etag in request.if_none_match:
+        close_connection(conn)
+        response = app.response_class(status=304)
+    else:
+        row = fetch_one(conn, blob_query, params)
+        close_connection(conn)
+        data = next(iter(row.values())) if row else None
+        if not data:
+            return None
+        response = send_file(
+            io.BytesIO(data),
+            mimetype=mimetype,
+            as_attachment=False,
+            download_name=download_name
+        )
+    response.set_etag(etag)
+    # Private to signed-in users; no-cache makes the browser revalidate so a
+    # replaced image shows up immediately
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def image_etag(image):
+    """ETag for an images row; uploads replace rows in place and reset created_at"""
+    created_at = image.get('created_at')
+    return f"{image['image_id']}-{int(created_at.timestamp()) if created_at else 0}-{image.get('file_size') or 0}"
+
 @app.route('/image/<int:image_id>')
 @login_required
 def serve_image(image_id):
-    """Serve an image from the database"""
+    """Serve an image from the database (304 without reading image_data if unchanged)"""
     conn = get_db_connection()
     
     image = fetch_one(conn,
-        "SELECT image_data, mime_type, file_name FROM images WHERE image_id = %s",
+        "SELECT image_id, mime_type, file_name, file_size, created_at FROM images WHERE image_id = %s",
         (image_id,))
     
-    close_connection(conn)
-    
+    response = None
     if image:
-        return send_file(
-            io.BytesIO(image['image_data']),
-            mimetype=image['mime_type'],
-            as_attachment=False,
-            download_name=image['file_name']
-        )
+        response = blob_response(conn, image_etag(image),
+                                 "SELECT image_data FROM images WHERE image_id = %s", (image_id,),
+                                 image['mime_type'], image['file_name'])
     else:
+        close_connection(conn)
+    
+    if response is None:
         flash('Image not found', 'danger')
         return redirect(url_for('index'))
+    return response
 
 @app.route('/image/sample/<int:sample_id>/<image_type>')
 @login_required
 def serve_sample_image(sample_id, image_type):
-    """Serve a specific type of image for a rock sample"""
+    """Serve a specific type of image for a rock sample (304 without reading image_data if unchanged)"""
     conn = get_db_connection()
     
     image = fetch_one(conn,
-        """SELECT image_data, mime_type, file_name 
+        """SELECT image_id, mime_type, file_name, file_size, created_at
            FROM images 
            WHERE sample_id = %s AND image_type = %s
            ORDER BY created_at DESC LIMIT 1""",
         (sample_id, image_type))
     
-    close_connection(conn)
-    
+    response = None
     if image:
-        return send_file(
-            io.BytesIO(image['image_data']),
-            mimetype=image['mime_type'],
-            as_attachment=False,
-            download_name=image['file_name']
-        )
+        response = blob_response(conn, image_etag(image),
+                                 "SELECT image_data FROM images WHERE image_id = %s", (image['image_id'],),
+                                 image['mime_type'], image['file_name'])
     else:
+        close_connection(conn)
+    
+    if response is None:
         # Return placeholder image
         return redirect(url_for('static', filename='images/no-image.png'))
+    return response
 
 @app.route('/user/photo/<int:user_id>')
 @login_required
 def serve_user_photo(user_id):
-    """Serve a user's profile photo; falls back to placeholder if none."""
+    """
+    Serve a user's profile photo; 404 if none so clients show their fallback.
+    
+    Responses carry an ETag built from the photo's size and the row's updated_at,
+    and browsers revalidate with If-None-Match: an unchanged photo is answered
+    with 304 from a metadata-only query, without reading the LONGBLOB.
+    """
     conn = get_db_connection()
-    ensure_user_photo_columns(conn)
-    image = fetch_one(conn, """
-        SELECT profile_image, profile_image_mime, profile_image_name
+    meta = fetch_one(conn, """
+        SELECT profile_image IS NOT NULL AS has_photo, profile_image_size,
+               profile_image_mime, profile_image_name, updated_at
         FROM users
         WHERE user_id = %s
     """, (user_id,))
-    close_connection(conn)
-    if image and image.get('profile_image'):
-        return send_file(
-            io.BytesIO(image['profile_image']),
-            mimetype=image.get('profile_image_mime') or 'image/jpeg',
-            as_attachment=False,
-            download_name=image.get('profile_image_name') or 'profile.jpg'
-        )
-    # No profile image stored; return 404 so clients can show local fallback (white circle)
-    abort(404)
+    if not meta or not meta['has_photo']:
+        close_connection(conn)
+        # No profile image stored; return 404 so clients can show local fallback (white circle)
+        abort(404)
+    
+    updated_at = meta.get('updated_at')
+    etag = f"{user_id}-{int(updated_at.timestamp()) if updated_at else 0}-{meta.get('profile_image_size') or 0}"
+    response = blob_response(conn, etag,
+                             "SELECT profile_image FROM users WHERE user_id = %s", (user_id,),
+                             meta.get('profile_image_mime') or 'image/jpeg',
+                             meta.get('profile_image_name') or 'profile.jpg')
+    if response is None:
+        abort(404)
+    return response
 
 # ============================================================================
 # ERROR HANDLERS
@@ -4017,8 +3934,7 @@ def forbidden(error):
 # ============================================================================
 
 @app.route('/admin/add-user', methods=['POST'])
-@login_required
-@role_required('admin')
+@require_admin
 def admin_add_user():
     """Add a new user"""
     try:
@@ -4032,7 +3948,7 @@ def admin_add_user():
         
         if not all([username, email, first_name, last_name, password]):
             flash('All fields are required', 'error')
-            return redirect(url_for('admin_manage_users'))
+            return redirect(cached_url('admin_manage_users'))
         
         conn = get_db_connection()
         
@@ -4044,10 +3960,10 @@ def admin_add_user():
         if existing_user:
             flash('Username or email already exists', 'error')
             close_connection(conn)
-            return redirect(url_for('admin_manage_users'))
+            return redirect(cached_url('admin_manage_users'))
         
         # Hash password and insert user
-        password_hash = generate_password_hash(password)
+        password_hash = hash_password(password)
         user_id = execute_query(conn,
             """INSERT INTO users (username, email, password_hash, first_name, last_name, 
                role, school_id, is_active, created_at) 
@@ -4065,11 +3981,10 @@ def admin_add_user():
         if 'conn' in locals():
             close_connection(conn)
     
-    return redirect(url_for('admin_manage_users'))
+    return redirect(cached_url('admin_manage_users'))
 
 @app.route('/admin/edit-user/<int:user_id>', methods=['GET', 'POST'])
-@login_required
-@role_required('admin')
+@require_admin
 def admin_edit_user(user_id):
     """Edit user information"""
     conn = get_db_connection()
@@ -4078,13 +3993,8 @@ def admin_edit_user(user_id):
         try:
             username = request.form.get('username')
             email = request.form.get('email')
-            full_name = request.form.get('full_name', '')
-            # Derive first_name and last_name from full_name for backward compatibility
-            full_name = (full_name or '').strip()
-            if ' ' in full_name:
-                first_name, last_name = full_name.split(' ', 1)
-            else:
-                first_name, last_name = full_name, ''
+            first_name = request.form.get('first_name', '').strip()
+            last_name = request.form.get('last_name', '').strip()
             role = request.form.get('role')
             school_id = request.form.get('school_id')
             is_active = request.form.get('is_active') == 'on'
@@ -4110,11 +4020,12 @@ def admin_edit_user(user_id):
                    last_name = %s, role = %s, school_id = %s, is_active = %s, updated_at = NOW()
                    WHERE user_id = %s""",
                 (username, email, first_name, last_name, role, school_id, is_active, user_id))
+            invalidate_user_cache(user_id)
             
             # Update password if provided
             new_password = request.form.get('new_password')
             if new_password and new_password.strip():
-                password_hash = generate_password_hash(new_password)
+                password_hash = hash_password(new_password)
                 execute_query(conn,
                     "UPDATE users SET password_hash = %s WHERE user_id = %s",
                     (password_hash, user_id))
@@ -4124,7 +4035,7 @@ def admin_edit_user(user_id):
             
             close_connection(conn)
             flash(f'User {username} updated successfully', 'success')
-            return redirect(url_for('admin_manage_users'))
+            return redirect(cached_url('admin_manage_users'))
             
         except Exception as e:
             flash(f'Error updating user: {str(e)}', 'error')
@@ -4136,13 +4047,15 @@ def admin_edit_user(user_id):
         try:
             # Get user information
             user = fetch_one(conn,
-                "SELECT * FROM users WHERE user_id = %s",
+                """SELECT user_id, username, email, first_name, last_name, role,
+                   school_id, is_active, created_at, updated_at
+                   FROM users WHERE user_id = %s""",
                 (user_id,))
             
             if not user:
                 flash('User not found', 'error')
                 close_connection(conn)
-                return redirect(url_for('admin_manage_users'))
+                return redirect(cached_url('admin_manage_users'))
             
             close_connection(conn)
             return render_template('admin/edit_user.html', user=user)
@@ -4151,13 +4064,12 @@ def admin_edit_user(user_id):
             flash(f'Error loading user: {str(e)}', 'error')
             if 'conn' in locals():
                 close_connection(conn)
-            return redirect(url_for('admin_manage_users'))
+            return redirect(cached_url('admin_manage_users'))
 
 # Removed export-to-CSV endpoint for admin
 
 @app.route('/admin/update-profile', methods=['POST'])
-@login_required
-@role_required('admin')
+@require_admin
 def admin_update_profile():
     """Update admin profile"""
     try:
@@ -4175,12 +4087,13 @@ def admin_update_profile():
         if existing_user:
             flash('Email already taken by another user', 'error')
             close_connection(conn)
-            return redirect(url_for('admin_settings'))
+            return redirect(cached_url('admin_settings'))
         
         # Update user profile
         execute_query(conn,
             "UPDATE users SET first_name = %s, last_name = %s, email = %s, updated_at = NOW() WHERE user_id = %s",
             (first_name, last_name, email, session['user_id']))
+        invalidate_user_cache(session['user_id'])
         
         # Update session
         session['full_name'] = f"{first_name} {last_name}"
@@ -4195,11 +4108,10 @@ def admin_update_profile():
         if 'conn' in locals():
             close_connection(conn)
     
-    return redirect(url_for('admin_settings'))
+    return redirect(cached_url('admin_settings'))
 
 @app.route('/admin/change-password', methods=['POST'])
-@login_required
-@role_required('admin')
+@require_admin
 def admin_change_password():
     """Change admin password"""
     try:
@@ -4209,23 +4121,24 @@ def admin_change_password():
         
         if new_password != confirm_password:
             flash('New passwords do not match', 'error')
-            return redirect(url_for('admin_settings'))
+            return redirect(cached_url('admin_settings'))
         
         conn = get_db_connection()
         
         # Verify current password
         user = fetch_one(conn, "SELECT password_hash FROM users WHERE user_id = %s", (session['user_id'],))
         
-        if not user or not check_password_hash(user['password_hash'], current_password):
+        if not user or not verify_password(user['password_hash'], current_password):
             flash('Current password is incorrect', 'error')
             close_connection(conn)
-            return redirect(url_for('admin_settings'))
+            return redirect(cached_url('admin_settings'))
         
         # Update password
-        new_hash = generate_password_hash(new_password)
+        new_hash = hash_password(new_password)
         execute_query(conn,
             "UPDATE users SET password_hash = %s, updated_at = NOW() WHERE user_id = %s",
             (new_hash, session['user_id']))
+        invalidate_user_cache(session['user_id'])
         
         log_activity(conn, session['user_id'], 'password_changed', 'Changed password')
         
@@ -4237,7 +4150,7 @@ def admin_change_password():
         if 'conn' in locals():
             close_connection(conn)
     
-    return redirect(url_for('admin_settings'))
+    return redirect(cached_url('admin_settings'))
 
 
 # ============================================================================
@@ -4,8 +4,28 @@ Provides authentication and authorization decorators for Flask routes
 Implements role-based access control
 """
 
+import os
 from functools import wraps
 from flask import session, redirect, url_for, flash, abort
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from werkzeug.security import check_password_hash
+from cache_utils import TTLCache
+
+# Current-user rows keyed by user_id; routes that update a user call invalidate_user_cache().
+# That only clears this worker process, so other workers may show a changed role or
+# is_active for up to USER_CACHE_TTL seconds (see Operational Notes in the README)
+USER_CACHE = TTLCache(ttl=int(os.environ.get('USER_CACHE_TTL', 10)))
+
+# Argon2id cost: 64 MiB, 3 passes, 2 lanes by default (tens of ms per hash, well
+# under Werkzeug's pbkdf2 default). Hashes made with other settings are upgraded
+# on the next login (see password_needs_rehash)
+PASSWORD_HASHER = PasswordHasher(
+    time_cost=int(os.environ.get('ARGON2_TIME_COST', 3)),
+    memory_cost=int(os.environ.get('ARGON2_MEMORY_KIB', 65536)),
+    parallelism=int(os.environ.get('ARGON2_PARALLELISM', 2)),
+)
+ARGON2_HASH_PREFIX = '$argon2'
 
 # ============================================================================
 # AUTHENTICATION DECORATORS
@@ -51,6 +71,8 @@ def role_required(*roles):
         def staff_route():
             return "Admin or Personnel only"
     """
+    allowed_roles = frozenset(roles)
+    
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
@@ -58,7 +80,39 @@ def role_required(*roles):
                 flash('Please login to access this page', 'warning')
                 return redirect(url_for('login'))
             
-            if session['role'] not in roles:
+            if session['role'] not in allowed_roles:
+                flash('You do not have permission to access this page', 'danger')
+                abort(403)
+            
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def require_role(*roles):
+    """
+    Decorator combining login_required and role_required in a single wrapper
+    Redirects to login if not authenticated, returns 403 for any other role
+    
+    Args:
+        *roles: Variable number of role strings (e.g., 'admin', 'personnel', 'student')
+        
+    Usage:
+        @app.route('/admin-only')
+        @require_admin
+        def admin_route():
+            return "Admin only"
+    """
+    allowed_roles = frozenset(roles)
+    
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            role = session.get('role')
+            if role is None or 'user_id' not in session:
+                flash('Please login to access this page', 'warning')
+                return redirect(url_for('login'))
+            
+            if role not in allowed_roles:
                 flash('You do not have permission to access this page', 'danger')
                 abort(403)
             
@@ -66,6 +120,65 @@ def role_required(*roles):
         return decorated_function
     return decorator
 
+# Prebuilt decorators for the three single-role route groups
+require_admin = require_role('admin')
+require_personnel = require_role('personnel')
+require_student = require_role('student')
+
+# ============================================================================
+# PASSWORD HASHING
+# ============================================================================
+
+def hash_password(password):
+    """
+    Hash a password for storing in users.password_hash
+    
+    Args:
+        password: Plain-text password
+        
+    Returns:
+        str: Argon2id hash string
+    """
+    return PASSWORD_HASHER.hash(password)
+
+def verify_password(stored_hash, password):
+    """
+    Check a password against a stored hash
+    Accepts Argon2 hashes and legacy Werkzeug (pbkdf2/scrypt) hashes
+    
+    Args:
+        stored_hash: Value of users.password_hash
+        password: Plain-text password to check
+        
+    Returns:
+        bool: True if the password matches, False otherwise
+    """
+    if not stored_hash:
+        return False
+    if stored_hash.startswith(ARGON2_HASH_PREFIX):
+        try:
+            return PASSWORD_HASHER.verify(stored_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    return check_password_hash(stored_hash, password)
+
+def password_needs_rehash(stored_hash):
+    """
+    Check whether a stored hash should be replaced after a successful login
+    
+    Args:
+        stored_hash: Value of users.password_hash that just verified
+        
+    Returns:
+        bool: True for legacy Werkzeug hashes and Argon2 hashes made with other parameters
+    """
+    if not stored_hash.startswith(ARGON2_HASH_PREFIX):
+        return True
+    try:
+        return PASSWORD_HASHER.check_needs_rehash(stored_hash)
+    except InvalidHashError:
+        return True
+
 # ============================================================================
 # AUTHORIZATION HELPER FUNCTIONS
 # ============================================================================
@@ -280,7 +393,7 @@ def can_submit_samples():
 
 def get_current_user():
     """
-    Get the full current user data from database
+    Get the current user's data from the database (cached per user for up to USER_CACHE_TTL seconds)
     
     Returns:
         dict: User data or None if not authenticated or on database error
@@ -295,9 +408,19 @@ def get_current_user():
         if not user_id:
             return None
             
+        user = USER_CACHE.get(user_id)
+        if user is not None:
+            return user
+            
         conn = get_db_connection()
-        user = fetch_one(conn, "SELECT * FROM users WHERE user_id = %s", (user_id,))
+        user = fetch_one(conn,
+            """SELECT user_id, username, email, first_name, last_name, role, school_id,
+                      is_active, created_at, updated_at, last_login
+               FROM users WHERE user_id = %s""",
+            (user_id,))
         close_connection(conn)
+        if user:
+            USER_CACHE.set(user_id, user)
         return user
     except Exception as e:
         # Database connection failed - log and return None to prevent crashes
@@ -306,6 +429,18 @@ def get_current_user():
         traceback.print_exc()
         return None
 
+def invalidate_user_cache(user_id):
+    """
+    Drop a user's cached row so the next get_current_user() reads it again
+    
+    Only this worker process's cache is cleared; other workers keep their
+    copy until it expires.
+    
+    Args:
+        user_id: ID of the user whose data changed
+    """
+    USER_CACHE.pop(user_id)
+
 def get_session_context():
     """
     Get session data as a context dictionary for templates
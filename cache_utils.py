@@ -0,0 +1,78 @@
+"""
+Cache Utilities Module
+Provides a small in-process, thread-safe cache with per-entry expiry
+Used to avoid repeating database lookups whose results rarely change
+"""
+
+import time
+import threading
+
+# ============================================================================
+# TTL CACHE
+# ============================================================================
+
+class TTLCache:
+    """
+    Thread-safe dictionary cache whose entries expire after a fixed time
+
+    Each gunicorn/Passenger worker holds its own copy, and clear()/pop()
+    only affect the calling process. Values must therefore be safe to serve
+    for up to `ttl` seconds after the underlying data changes, unless the
+    app runs as a single worker process.
+
+    Usage:
+        USER_CACHE = TTLCache(ttl=60, maxsize=1024)
+        user = USER_CACHE.get(user_id)
+        if user is None:
+            user = load_user(user_id)
+            USER_CACHE.set(user_id, user)
+    """
+
+    def __init__(self, ttl, maxsize=1024):
+        """
+        Args:
+            ttl: Seconds an entry stays valid
+            maxsize: Maximum number of entries kept; the oldest is evicted first
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key, or default if missing or expired
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        """
+        Store value under key for `ttl` seconds
+        """
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.maxsize:
+                # Dicts keep insertion order, so the first key is the oldest entry
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def pop(self, key):
+        """
+        Remove key from the cache (no error if it is not cached)
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """
+        Remove every entry from the cache
+        """
+        with self._lock:
+            self._data.clear()
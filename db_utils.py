@@ -5,8 +5,12 @@ Uses mysql.connector for MariaDB/MySQL connectivity
 """
 
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
+from mysql.connector.connection import MySQLConnection
+from mysql.connector.errors import PoolError
+import io
 import os
+import threading
 
 # ============================================================================
 # DATABASE CONFIGURATION
@@ -23,13 +27,95 @@ DB_CONFIG = {
     'autocommit': True
 }
 
+# Connections kept open per process; requests beyond this get a dedicated connection
+DB_POOL_NAME = 'webgis'
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+
+# Connections for requests that store uploaded images. They use the pure-Python
+# driver, which streams BLOB parameters; the C extension would read them into memory
+DB_BLOB_POOL_NAME = 'webgis_blob'
+DB_BLOB_POOL_SIZE = int(os.environ.get('DB_BLOB_POOL_SIZE', 4))
+
+_connection_pool = None
+_blob_connection_pool = None
+_pool_lock = threading.Lock()
+
 # ============================================================================
 # CONNECTION MANAGEMENT
 # ============================================================================
 
+def get_connection_pool():
+    """
+    Return the process-wide connection pool, creating it on first use
+    
+    The pool is created lazily so that each worker process (e.g. under
+    gunicorn) opens its own sockets after forking.
+    
+    Returns:
+        MySQLConnectionPool: Shared connection pool
+    """
+    global _connection_pool
+    if _connection_pool is None:
+        with _pool_lock:
+            if _connection_pool is None:
+                _connection_pool = pooling.MySQLConnectionPool(
+                    pool_name=DB_POOL_NAME,
+                    pool_size=DB_POOL_SIZE,
+                    **DB_CONFIG
+                )
+    return _connection_pool
+
+def get_blob_connection_pool():
+    """
+    Return the process-wide pool of pure-Python connections for image uploads,
+    creating it on first use
+    
+    Returns:
+        MySQLConnectionPool: Shared upload connection pool
+    """
+    global _blob_connection_pool
+    if _blob_connection_pool is None:
+        with _pool_lock:
+            if _blob_connection_pool is None:
+                _blob_connection_pool = pooling.MySQLConnectionPool(
+                    pool_name=DB_BLOB_POOL_NAME,
+                    pool_size=DB_BLOB_POOL_SIZE,
+                    use_pure=True,
+                    **DB_CONFIG
+                )
+    return _blob_connection_pool
+
+def get_blob_connection():
+    """
+    Get a database connection that streams BLOB parameters in execute_blob_query()
+    
+    Use it instead of get_db_connection() for requests that store uploaded
+    images; everything else keeps the faster C extension. Falls back to
+    opening a dedicated connection when every pooled one is in use.
+    
+    Returns:
+        connection: MySQL database connection object (pure-Python driver)
+        
+    Raises:
+        Error: If connection fails
+    """
+    try:
+        try:
+            return get_blob_connection_pool().get_connection()
+        except PoolError:
+            connection = mysql.connector.connect(use_pure=True, **DB_CONFIG)
+            if connection.is_connected():
+                return connection
+    except Error as e:
+        print(f"Error connecting to MySQL database: {e}")
+        raise
+
 def get_db_connection():
     """
-    Create and return a new database connection
+    Get a database connection from the connection pool
+    
+    Falls back to opening a dedicated connection when every pooled
+    connection is in use.
     
     Returns:
         connection: MySQL database connection object
@@ -38,23 +124,45 @@ def get_db_connection():
         Error: If connection fails
     """
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        if connection.is_connected():
-            return connection
+        try:
+            return get_connection_pool().get_connection()
+        except PoolError:
+            connection = mysql.connector.connect(**DB_CONFIG)
+            if connection.is_connected():
+                return connection
     except Error as e:
         print(f"Error connecting to MySQL database: {e}")
         raise
 
 def close_connection(connection):
     """
-    Close database connection
+    Close database connection (pooled connections are returned to the pool)
     
     Args:
         connection: MySQL database connection object
     """
-    if connection and connection.is_connected():
+    if not connection:
+        return
+    if isinstance(connection, pooling.PooledMySQLConnection):
+        try:
+            connection.close()
+        except Error as e:
+            # The connection is still handed back; the pool reconnects it on next checkout
+            print(f"Error returning connection to pool: {e}")
+    elif connection.is_connected():
         connection.close()
 
+def _unwrap_connection(connection):
+    """
+    Return the real connection behind a pooled connection
+    
+    PooledMySQLConnection only forwards attribute reads, so checks such as
+    the connection class must be made on the wrapped connection.
+    """
+    if isinstance(connection, pooling.PooledMySQLConnection):
+        return connection._cnx
+    return connection
+
 # ============================================================================
 # QUERY EXECUTION FUNCTIONS
 # ============================================================================
@@ -82,7 +190,9 @@ def execute_query(connection, query, params=None):
         else:
             cursor.execute(query)
         
-        connection.commit()
+        # Inside begin_transaction() the commit is left to commit_transaction()
+        if not connection.in_transaction:
+            connection.commit()
         
         # Return last inserted ID for INSERT queries
         if cursor.lastrowid:
@@ -170,6 +280,52 @@ def fetch_all(connection, query, params=None):
         if cursor:
             cursor.close()
 
+def iter_rows(connection, query, params=None):
+    """
+    Stream rows from the database one at a time with an unbuffered cursor,
+    so large results (e.g. image BLOBs) are never all held in memory
+    
+    The connection cannot run other queries until the iteration finishes.
+    
+    Args:
+        connection: MySQL database connection object
+        query: SQL query string
+        params: Tuple of parameters for parameterized query
+        
+    Yields:
+        dict: One row with column names as keys
+        
+    Raises:
+        Error: If query execution fails
+    """
+    cursor = None
+    finished = False
+    try:
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+        
+        for row in cursor:
+            yield row
+        finished = True
+        
+    except Error as e:
+        print(f"Error fetching data: {e}")
+        print(f"Query: {query}")
+        print(f"Params: {params}")
+        raise
+    finally:
+        if cursor:
+            if not finished:
+                # Drain what the caller did not read so the connection stays usable
+                try:
+                    cursor.fetchall()
+                except Error:
+                    pass
+            cursor.close()
+
 def execute_many(connection, query, params_list):
     """
     Execute a query multiple times with different parameters (batch insert/update)
@@ -189,7 +345,8 @@ def execute_many(connection, query, params_list):
     try:
         cursor = connection.cursor()
         cursor.executemany(query, params_list)
-        connection.commit()
+        if not connection.in_transaction:
+            connection.commit()
         return cursor.rowcount
         
     except Error as e:
@@ -201,6 +358,115 @@ def execute_many(connection, query, params_list):
         if cursor:
             cursor.close()
 
+def execute_batch(connection, statements):
+    """
+    Execute several write statements as one transaction in a single round-trip
+    
+    The statements are sent as one multi-statement query wrapped in START
+    TRANSACTION / COMMIT, so they are applied together or not at all.
+    Running several statements in one execute() needs mysql-connector-python
+    9.2 or later (pinned in requirements.txt).
+    
+    Args:
+        connection: MySQL database connection object
+        statements: List of (query, params) tuples; params may be None
+        
+    Returns:
+        list: Number of affected rows for each statement
+        
+    Raises:
+        Error: If any statement fails (the transaction is rolled back)
+    """
+    queries = ['START TRANSACTION']
+    params = []
+    for query, query_params in statements:
+        queries.append(query)
+        params.extend(query_params or ())
+    queries.append('COMMIT')
+    
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(';\n'.join(queries), tuple(params) or None)
+        # Read the result of every statement, so an error in a later one is raised here
+        rowcounts = []
+        while cursor.nextset():
+            rowcounts.append(cursor.rowcount)
+        # Drop the COMMIT's result
+        return rowcounts[:-1]
+        
+    except Error as e:
+        try:
+            connection.rollback()
+        except Error:
+            pass
+        print(f"Error executing batch: {e}")
+        print(f"Queries: {queries}")
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+
+class BlobStream(io.RawIOBase):
+    """
+    Read-only wrapper around an upload stream for use as a BLOB parameter
+    in execute_blob_query()
+    
+    The pure-Python driver sends io.IOBase parameters in 128 KB chunks, and
+    types them as BLOB only when the object has no `mode` attribute (a
+    spooled upload file reports 'w+b', which would be sent as a string).
+    """
+    
+    def __init__(self, stream):
+        self._stream = stream
+    
+    def readable(self):
+        return True
+    
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+def execute_blob_query(connection, query, params):
+    """
+    Execute a data-modifying query whose parameters include large binary values
+    
+    Uses a prepared statement, so values are sent in binary form rather than
+    as an escaped SQL literal. BlobStream parameters are streamed to the
+    server in chunks on a connection from get_blob_connection(). A
+    C-extension connection cannot send long data, so they are read into
+    memory first if one is passed in.
+    
+    Args:
+        connection: MySQL database connection object
+        query: SQL query string
+        params: Tuple of parameters (bytes or BlobStream for BLOB values)
+        
+    Returns:
+        int: Last inserted ID for INSERT queries, or affected rows count
+        
+    Raises:
+        Error: If query execution fails
+    """
+    if not isinstance(_unwrap_connection(connection), MySQLConnection):
+        params = tuple(p.read() if isinstance(p, BlobStream) else p for p in params)
+    
+    cursor = None
+    try:
+        cursor = connection.cursor(prepared=True)
+        cursor.execute(query, params)
+        if not connection.in_transaction:
+            connection.commit()
+        return cursor.lastrowid or cursor.rowcount
+        
+    except Error as e:
+        connection.rollback()
+        print(f"Error executing blob query: {e}")
+        print(f"Query: {query}")
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+
 def call_procedure(connection, procedure_name, params=None):
     """
     Call a stored procedure
@@ -248,12 +514,16 @@ def call_procedure(connection, procedure_name, params=None):
 
 def begin_transaction(connection):
     """
-    Begin a transaction (disable autocommit)
+    Begin a transaction
+    
+    Until commit_transaction() or rollback_transaction() is called,
+    execute_query() and the other write helpers do not commit, so all
+    statements are applied (and flushed to disk) together.
     
     Args:
         connection: MySQL database connection object
     """
-    connection.autocommit = False
+    connection.start_transaction()
 
 def commit_transaction(connection):
     """
@@ -263,7 +533,6 @@ def commit_transaction(connection):
         connection: MySQL database connection object
     """
     connection.commit()
-    connection.autocommit = True
 
 def rollback_transaction(connection):
     """
@@ -273,7 +542,6 @@ def rollback_transaction(connection):
         connection: MySQL database connection object
     """
     connection.rollback()
-    connection.autocommit = True
 
 # ============================================================================
 # UTILITY FUNCTIONS
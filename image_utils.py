@@ -0,0 +1,232 @@
+"""
+Image Utilities Module
+Provides thumbnail generation for images embedded in Excel exports, and
+resizing of uploaded profile photos
+Thumbnails for one export are produced in parallel on a shared thread pool
+"""
+
+import io
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image as PILImage, ImageFile, ImageOps, UnidentifiedImageError
+from cache_utils import TTLCache
+
+# Uploads are arbitrary user files: Pillow refuses images over twice this many
+# pixels (DecompressionBombError) before allocating memory for them, instead of
+# a huge PNG taking gigabytes of RAM mid-export
+PILImage.MAX_IMAGE_PIXELS = 40_000_000
+# Decode what is there of a truncated upload instead of failing on it
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+# ============================================================================
+# THUMBNAIL CONFIGURATION
+# ============================================================================
+
+# Longest side, in pixels, of an image embedded in an export
+THUMBNAIL_MAX_SIZE = 150
+# JPEG quality of generated thumbnails; artifacts are not visible at this size
+THUMBNAIL_JPEG_QUALITY = 80
+# PNG/JPEG images up to 25% larger than THUMBNAIL_MAX_SIZE are embedded as they
+# are (Excel shows them at thumbnail size) rather than decoded and re-encoded
+THUMBNAIL_PASSTHROUGH_MARGIN = 1.25
+
+# Pillow releases the GIL while decoding, resizing and encoding, so threads
+# run thumbnails on several cores without forking the web worker
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Finished thumbnails keyed by a digest of the source image, so images that
+# appear in repeated exports are only decoded and resized once per hour
+THUMBNAIL_CACHE = TTLCache(ttl=3600, maxsize=2048)
+
+# Longest side, in pixels, of a stored profile photo (shown at most a few hundred pixels wide)
+PROFILE_PHOTO_MAX_SIZE = 512
+PROFILE_PHOTO_JPEG_QUALITY = 85
+
+_thumbnail_executor = None
+_executor_lock = threading.Lock()
+# One reusable encode buffer per thumbnail thread (see _encode_jpeg)
+_encode_buffers = threading.local()
+
+# ============================================================================
+# THUMBNAILS
+# ============================================================================
+
+def make_thumbnail(img_data, max_size=THUMBNAIL_MAX_SIZE):
+    """
+    Shrink an image to fit a max_size square, keeping its aspect ratio
+
+    Args:
+        img_data: Image file contents (bytes)
+        max_size: Longest side of the result in pixels
+
+    Returns:
+        tuple: (JPEG bytes, or the original PNG/JPEG if it (nearly) fits,
+                display width, display height)
+    """
+    # Ensure img_data is bytes
+    if isinstance(img_data, bytearray):
+        img_data = bytes(img_data)
+    elif not isinstance(img_data, bytes):
+        raise ValueError(f"Image data is not bytes, got {type(img_data)}")
+
+    # Opening only parses the header; the pixels are decoded on first use
+    with PILImage.open(io.BytesIO(img_data)) as probe:
+        width, height = probe.size
+        image_format = (probe.format or '').upper()
+    longest = max(width, height)
+    if longest <= max_size * THUMBNAIL_PASSTHROUGH_MARGIN and image_format in ('PNG', 'JPEG'):
+        # (Nearly) small enough and in a format Excel embeds: reuse the original
+        # bytes without decoding, hashing or caching them
+        if longest > max_size:
+            width, height = round(width * max_size / longest), round(height * max_size / longest)
+        return img_data, width, height
+
+    cache_key = (hashlib.blake2b(img_data, digest_size=16).digest(), max_size)
+    cached = THUMBNAIL_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    thumbnail = _resize_image(img_data, max_size)
+    THUMBNAIL_CACHE.set(cache_key, thumbnail)
+    return thumbnail
+
+def _resize_image(img_data, max_size):
+    """Do the PIL work for make_thumbnail (no caching)"""
+    with PILImage.open(io.BytesIO(img_data)) as pil_img:
+        if pil_img.format == 'JPEG':
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale (no smaller than twice
+            # the thumbnail) so full-size camera photos are never fully decoded
+            pil_img.draft('RGB', (max_size * 2, max_size * 2))
+        if pil_img.width > max_size or pil_img.height > max_size:
+            # Use LANCZOS resampling for high quality
+            try:
+                pil_img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
+            except (AttributeError, TypeError):
+                # Fallback for older PIL versions
+                pil_img.thumbnail((max_size, max_size), PILImage.LANCZOS)
+
+        # Specimen and outcrop images are photos, so every thumbnail is a JPEG:
+        # much faster to encode than PNG and smaller in the workbook
+        if pil_img.mode not in ('RGB', 'L'):
+            pil_img = pil_img.convert('RGB')
+
+        return _encode_jpeg(pil_img), pil_img.width, pil_img.height
+
+def _encode_jpeg(pil_img):
+    """
+    Encode a thumbnail as JPEG into this thread's reusable buffer
+
+    The buffer is overwritten from the start and never truncated, so it keeps
+    its size between images instead of growing a new BytesIO every time.
+
+    Returns:
+        bytes: The encoded image
+    """
+    buffer = getattr(_encode_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _encode_buffers.buffer = io.BytesIO()
+    buffer.seek(0)
+    pil_img.save(buffer, format='JPEG', quality=THUMBNAIL_JPEG_QUALITY, optimize=True)
+    size = buffer.tell()
+    with buffer.getbuffer() as view:
+        return bytes(view[:size])
+
+def _thumbnail_or_error(img_data):
+    """Run make_thumbnail, returning the exception instead of raising it"""
+    try:
+        return make_thumbnail(img_data)
+    except Exception as e:
+        return e
+
+def get_thumbnail_executor():
+    """
+    Get the shared thumbnail thread pool, creating it on first use
+
+    Returns:
+        ThreadPoolExecutor: Pool with THUMBNAIL_WORKERS threads
+    """
+    global _thumbnail_executor
+    if _thumbnail_executor is None:
+        with _executor_lock:
+            if _thumbnail_executor is None:
+                _thumbnail_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS,
+                                                         thread_name_prefix='thumbnail')
+    return _thumbnail_executor
+
+def make_thumbnails(images):
+    """
+    Thumbnail a batch of images in parallel, once per distinct image
+
+    Args:
+        images: List of image contents; empty entries (None, b'') are skipped
+
+    Returns:
+        list: One entry per input, in order - None for an empty entry, the
+              make_thumbnail tuple, or the exception raised for that image
+    """
+    results = [None] * len(images)
+
+    # Group identical images (e.g. one outcrop photo uploaded for several
+    # samples) by their bytes, so each is decoded and resized only once
+    pending = {}
+    for index, data in enumerate(images):
+        if data:
+            pending.setdefault(bytes(data), []).append(index)
+    if not pending:
+        return results
+
+    if len(pending) == 1 or THUMBNAIL_WORKERS <= 1:
+        thumbnails = [_thumbnail_or_error(data) for data in pending]
+    else:
+        thumbnails = get_thumbnail_executor().map(_thumbnail_or_error, pending)
+
+    for indexes, thumbnail in zip(pending.values(), thumbnails):
+        for index in indexes:
+            results[index] = thumbnail
+    return results
+
+# ============================================================================
+# PROFILE PHOTOS
+# ============================================================================
+
+def make_profile_photo(stream, max_size=PROFILE_PHOTO_MAX_SIZE):
+    """
+    Decode an uploaded profile photo and shrink it to a JPEG that fits a max_size square
+
+    Args:
+        stream: Binary file object of the upload (read directly, not copied into memory)
+        max_size: Longest side of the result in pixels
+
+    Returns:
+        bytes: The JPEG to store
+
+    Raises:
+        ValueError: If the upload is not an image Pillow can read
+    """
+    try:
+        with PILImage.open(stream) as pil_img:
+            if pil_img.format == 'JPEG':
+                pil_img.draft('RGB', (max_size * 2, max_size * 2))
+            # Phone photos are often stored sideways with an EXIF rotation, which
+            # re-encoding drops, so apply it to the pixels first
+            pil_img = ImageOps.exif_transpose(pil_img)
+            pil_img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
+
+            if pil_img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in pil_img.info:
+                # JPEG has no transparency: flatten onto white rather than black
+                rgba = pil_img.convert('RGBA')
+                pil_img = PILImage.new('RGB', rgba.size, 'white')
+                pil_img.paste(rgba, mask=rgba.getchannel('A'))
+            elif pil_img.mode not in ('RGB', 'L'):
+                pil_img = pil_img.convert('RGB')
+
+            output = io.BytesIO()
+            pil_img.save(output, format='JPEG', quality=PROFILE_PHOTO_JPEG_QUALITY,
+                         optimize=True, progressive=True)
+            return output.getvalue()
+    except PILImage.DecompressionBombError as e:
+        raise ValueError("The uploaded image is too large") from e
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError("The uploaded file is not a supported image") from e
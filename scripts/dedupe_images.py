@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Remove duplicate rock images and add the images unique key.
+
+Before uq_images_sample_type existed, a sample could end up with several
+images of the same type. The app only adds the key when there are no such
+duplicates, so this one-off script deletes the older rows of each
+(sample_id, image_type) pair, keeping the newest image, and then adds the
+key. Restart the app afterwards so uploads switch to the single upsert.
+
+Without --apply the script only reports what it would delete.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from db_utils import get_db_connection, close_connection, fetch_all, execute_query  # noqa: E402
+
+DUPLICATES_QUERY = """
+    SELECT older.image_id, older.sample_id, older.image_type, older.file_name
+    FROM images older
+    JOIN images newer ON newer.sample_id = older.sample_id
+        AND newer.image_type = older.image_type
+        AND newer.image_id > older.image_id
+    GROUP BY older.image_id, older.sample_id, older.image_type, older.file_name
+    ORDER BY older.sample_id, older.image_type, older.image_id
+"""
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Remove duplicate rock images and add the images unique key.")
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Delete the older duplicates and add the key (default: only list them).",
+    )
+    return parser.parse_args()
+
+
+def dedupe_images(apply: bool) -> None:
+    conn = get_db_connection()
+    try:
+        duplicates = fetch_all(conn, DUPLICATES_QUERY) or []
+        for row in duplicates:
+            print(f"Sample {row['sample_id']} {row['image_type']}: older image {row['image_id']} ({row['file_name']})")
+        print(f"{len(duplicates)} older duplicate image(s) found.")
+
+        if not apply:
+            if duplicates:
+                print("Nothing deleted. Re-run with --apply to delete them and add the unique key.")
+            return
+
+        if duplicates:
+            deleted = execute_query(conn, """
+                DELETE older FROM images older
+                JOIN images newer ON newer.sample_id = older.sample_id
+                    AND newer.image_type = older.image_type
+                    AND newer.image_id > older.image_id
+            """)
+            print(f"Deleted {deleted} image(s).")
+
+        index = fetch_all(conn, """
+            SELECT 1 AS present FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'images'
+              AND index_name = 'uq_images_sample_type' LIMIT 1""")
+        if index:
+            print("uq_images_sample_type already exists.")
+        else:
+            execute_query(conn, "ALTER TABLE images ADD UNIQUE KEY uq_images_sample_type (sample_id, image_type)")
+            print("Added uq_images_sample_type. Restart the app to use it.")
+    finally:
+        close_connection(conn)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    dedupe_images(args.apply)
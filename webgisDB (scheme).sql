@@ -37,10 +37,13 @@ CREATE TABLE IF NOT EXISTS users (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     last_login TIMESTAMP NULL,
+    -- Searched by the personnel/admin rock lists (MATCH ... AGAINST on ft_full_name)
+    full_name VARCHAR(101) GENERATED ALWAYS AS (CONCAT(first_name, ' ', last_name)) STORED,
     INDEX idx_username (username),
     INDEX idx_email (email),
     INDEX idx_role (role),
-    INDEX idx_is_active (is_active)
+    INDEX idx_is_active (is_active),
+    FULLTEXT INDEX ft_full_name (full_name)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ============================================================================
@@ -86,6 +89,10 @@ CREATE TABLE IF NOT EXISTS images (
     file_size INT NOT NULL,
     mime_type VARCHAR(100) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Excel export thumbnail, made on first export and cleared when the image is replaced
+    thumbnail_data MEDIUMBLOB NULL,
+    thumbnail_width SMALLINT NULL,
+    thumbnail_height SMALLINT NULL,
     FOREIGN KEY (sample_id) REFERENCES rock_samples(sample_id) ON DELETE CASCADE,
     INDEX idx_sample_id (sample_id),
     INDEX idx_image_type (image_type)
@@ -352,10 +359,19 @@ DELIMITER ;
 -- ============================================================================
 
 -- Additional composite indexes for common queries
-CREATE INDEX idx_rocks_user_status ON rock_samples(user_id, status);
+-- A student's rocks by status, newest first (pending verifications, dashboard counts)
+CREATE INDEX idx_rocks_user_status_created ON rock_samples(user_id, status, created_at);
 CREATE INDEX idx_rocks_verified_status ON rock_samples(verified_by, status);
+CREATE INDEX idx_rocks_status_created ON rock_samples(status, created_at);
+CREATE INDEX idx_rocks_status_type ON rock_samples(status, rock_type);
+-- Admin rock list/exports: newest-first across every status, optionally by rock type
+CREATE INDEX idx_rocks_created ON rock_samples(created_at);
+CREATE INDEX idx_rocks_type_created ON rock_samples(rock_type, created_at);
+-- Word/prefix search on the student browse page (MATCH ... AGAINST in boolean mode)
+CREATE FULLTEXT INDEX ft_search ON rock_samples(rock_index, rock_id, rock_type, location_name, description);
 CREATE INDEX idx_activity_user_timestamp ON activity_logs(user_id, timestamp);
-CREATE INDEX idx_images_sample_type ON images(sample_id, image_type);
+-- One image per type per sample; uploads replace it with INSERT ... ON DUPLICATE KEY UPDATE
+CREATE UNIQUE INDEX uq_images_sample_type ON images(sample_id, image_type);
 
 -- ============================================================================
 -- GRANT PERMISSIONS (Adjust according to your XAMPP setup)
@@ -95,7 +95,10 @@ CREATE TABLE `images` (
   `file_name` varchar(255) NOT NULL,
   `file_size` int(11) NOT NULL,
   `mime_type` varchar(100) NOT NULL,
-  `created_at` timestamp NOT NULL DEFAULT current_timestamp()
+  `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+  `thumbnail_data` mediumblob DEFAULT NULL,
+  `thumbnail_width` smallint(6) DEFAULT NULL,
+  `thumbnail_height` smallint(6) DEFAULT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 --
@@ -209,7 +212,8 @@ CREATE TABLE `users` (
   `profile_image` longblob DEFAULT NULL,
   `profile_image_mime` varchar(255) DEFAULT NULL,
   `profile_image_name` varchar(255) DEFAULT NULL,
-  `profile_image_size` int(11) DEFAULT NULL
+  `profile_image_size` int(11) DEFAULT NULL,
+  `full_name` varchar(101) GENERATED ALWAYS AS (concat(`first_name`,' ',`last_name`)) STORED
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 --
@@ -332,7 +336,7 @@ ALTER TABLE `images`
   ADD PRIMARY KEY (`image_id`),
   ADD KEY `idx_sample_id` (`sample_id`),
   ADD KEY `idx_image_type` (`image_type`),
-  ADD KEY `idx_images_sample_type` (`sample_id`,`image_type`);
+  ADD UNIQUE KEY `uq_images_sample_type` (`sample_id`,`image_type`);
 
 --
 -- Indexes for table `rock_samples`
@@ -346,8 +350,13 @@ ALTER TABLE `rock_samples`
   ADD KEY `idx_rock_type` (`rock_type`),
   ADD KEY `idx_status` (`status`),
   ADD KEY `idx_location` (`latitude`,`longitude`),
-  ADD KEY `idx_rocks_user_status` (`user_id`,`status`),
-  ADD KEY `idx_rocks_verified_status` (`verified_by`,`status`);
+  ADD KEY `idx_rocks_user_status_created` (`user_id`,`status`,`created_at`),
+  ADD KEY `idx_rocks_verified_status` (`verified_by`,`status`),
+  ADD KEY `idx_rocks_status_created` (`status`,`created_at`),
+  ADD KEY `idx_rocks_status_type` (`status`,`rock_type`),
+  ADD KEY `idx_rocks_created` (`created_at`),
+  ADD KEY `idx_rocks_type_created` (`rock_type`,`created_at`),
+  ADD FULLTEXT KEY `ft_search` (`rock_index`,`rock_id`,`rock_type`,`location_name`,`description`);
 
 --
 -- Indexes for table `users`
@@ -359,7 +368,8 @@ ALTER TABLE `users`
   ADD KEY `idx_username` (`username`),
   ADD KEY `idx_email` (`email`),
   ADD KEY `idx_role` (`role`),
-  ADD KEY `idx_is_active` (`is_active`);
+  ADD KEY `idx_is_active` (`is_active`),
+  ADD FULLTEXT KEY `ft_full_name` (`full_name`);
 
 --
 -- AUTO_INCREMENT for dumped tables